@@ -1,18 +1,28 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field, validator
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional, Tuple
 import asyncio
+import json
+import time
 from utils import download_datasets, load_and_chunk_documents
-from models import initialize_models
-from retrievers import create_hybrid_retriever
-from workflow import setup_langgraph_workflow, run_workflow
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
-from langchain import hub
+from models import initialize_decomposition_llm, initialize_models
+from retrievers import create_hybrid_retriever, hybrid_retriever_from_artifact
+from index_store import current_version, load_index
+from cache import SemanticAnswerCache
+from batch import BatchRunner
+from planner import QueryPlanner
+from context import ContextPacker
+from metrics import INDEX_CHUNKS, RequestMetricsMiddleware, render_metrics
+from tracing import TracingMiddleware
+from config import BATCH_MAX_QUESTIONS, DOCS_DIRECTORY, INDEX_DIRECTORY, INDEX_RELOAD_INTERVAL
+from workflow import setup_langgraph_workflow, run_workflow, stream_workflow, create_rag_chain, create_sub_question_generator
 import logging
 
 # Initialize FastAPI app
 app = FastAPI()
+app.add_middleware(RequestMetricsMiddleware, endpoints=["/ask", "/ask/stream", "/ask/batch"])
+app.add_middleware(TracingMiddleware, endpoints=["/ask", "/ask/stream", "/ask/batch"])
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,108 +41,174 @@ class AnswerResponse(BaseModel):
     sub_questions: List[str]
     answer: str
 
-class SubQuery(BaseModel):
-    questions: List[str] = Field(description="The list of sub-questions")
+class BatchRequest(BaseModel):
+    questions: List[QuestionRequest] = Field(..., min_items=1, max_items=BATCH_MAX_QUESTIONS)
 
-def generate_sub_queries(llm: ChatOpenAI, question: str) -> List[str]:
+async def initialize_app() -> Dict[str, Any]:
     """
-    Generate sub-queries from the main question using structured generation.
+    Initializes the datasets and models asynchronously.
+
+    When an index has been built with build_index.py it is memory-mapped from disk;
+    otherwise the corpus is downloaded, chunked and embedded in-process. The RAG chain
+    and the LangGraph workflow are built once here and shared by all requests. Under
+    gunicorn with preload_app this runs once in the master and workers inherit the result.
+    """
+    embeddings, reranker, llm = initialize_models()
+    if current_version(INDEX_DIRECTORY) is not None:
+        artifact = load_index(INDEX_DIRECTORY)
+        hybrid_retriever = hybrid_retriever_from_artifact(artifact, embeddings)
+        index_version = artifact.version
+        INDEX_CHUNKS.set(artifact.manifest["num_chunks"])
+    else:
+        logging.warning(f"No index found in {INDEX_DIRECTORY}, embedding the corpus at startup.")
+        await download_datasets()
+        doc_splits = await load_and_chunk_documents(DOCS_DIRECTORY)
+        hybrid_retriever = create_hybrid_retriever(doc_splits, embeddings)
+        index_version = f"in-memory-{int(time.time())}"
+        INDEX_CHUNKS.set(len(doc_splits))
+    query_planner = QueryPlanner(create_sub_question_generator(initialize_decomposition_llm(llm)))
+    # Loads the tokenizer once, here, rather than whenever a workflow is compiled
+    context_packer = ContextPacker()
+    return {
+        "llm": llm,
+        "embeddings": embeddings,
+        "reranker": reranker,
+        "hybrid_retriever": hybrid_retriever,
+        "index_version": index_version,
+        "query_planner": query_planner,
+        "context_packer": context_packer,
+        "rag_workflow": build_workflow(llm, reranker, hybrid_retriever, query_planner, context_packer),
+    }
+
+def build_workflow(
+    llm: Any, reranker: Any, hybrid_retriever: Any, query_planner: QueryPlanner, context_packer: ContextPacker
+) -> Any:
+    """
+    Compile the RAG workflow for a retriever.
 
     Args:
-        llm (ChatOpenAI): The LLM model instance.
-        question (str): The main question.
+        llm (Any): The LLM model instance.
+        reranker (Any): The reranking model.
+        hybrid_retriever (Any): Hybrid retriever instance.
+        query_planner (QueryPlanner): The planner shared by every workflow, with its decomposition cache.
+        context_packer (ContextPacker): The packer shared by every workflow, with its tokenizer.
 
     Returns:
-        List[str]: A list of generated sub-queries.
+        Any: The compiled workflow graph.
     """
-    try:
-        sub_question_generator = llm.with_structured_output(SubQuery)
-        result = sub_question_generator.invoke({"input": question})
-        sub_queries = result.questions
-        logging.info(f"Generated sub-queries for the question: {question}")
-        return sub_queries
-    except Exception as e:
-        logging.error(f"Failed to generate sub-queries: {e}")
-        return []
+    return setup_langgraph_workflow(
+        llm, query_planner.sub_question_generator, hybrid_retriever, create_rag_chain(llm), reranker,
+        context_packer=context_packer, query_planner=query_planner,
+    )
 
-def create_rag_chain(llm: ChatOpenAI) -> Any:
+# Initialize app data
+app_data = asyncio.run(initialize_app())
+llm = app_data["llm"]
+embeddings = app_data["embeddings"]
+reranker = app_data["reranker"]
+hybrid_retriever = app_data["hybrid_retriever"]
+index_version = app_data["index_version"]
+query_planner = app_data["query_planner"]
+context_packer = app_data["context_packer"]
+rag_workflow = app_data["rag_workflow"]
+answer_cache = SemanticAnswerCache()
+index_checked_at = time.monotonic()
+index_reload_lock = asyncio.Lock()
+
+def load_workflow(version: str) -> Tuple[Any, Any, Any]:
     """
-    Create a RAG (Retrieval-Augmented Generation) chain.
+    Load an index version and compile the workflow around it.
 
     Args:
-        llm (ChatOpenAI): The LLM model instance.
+        version (str): The index version to load.
 
     Returns:
-        Any: A configured RAG chain.
+        Tuple: The index artifact, its hybrid retriever and the compiled workflow.
     """
-    try:
-        # Pull a pre-defined RAG prompt template from the LangChain Hub
-        prompt = hub.pull("rlm/rag-prompt")
-        # Combine the prompt with the LLM and an output parser
-        rag_chain = prompt | llm | StrOutputParser()
-        logging.info("RAG chain created successfully.")
-        return rag_chain
-    except Exception as e:
-        logging.error(f"Failed to create RAG chain: {e}")
-        raise
+    artifact = load_index(INDEX_DIRECTORY, version)
+    retriever = hybrid_retriever_from_artifact(artifact, embeddings)
+    return artifact, retriever, build_workflow(llm, reranker, retriever, query_planner, context_packer)
 
-async def initialize_app() -> Dict[str, Any]:
+async def refresh_index() -> None:
     """
-    Initializes the datasets and models asynchronously.
-    """
-    await download_datasets()
-    doc_splits = await load_and_chunk_documents('./docs')
-    embeddings, reranker, llm = initialize_models()
-    hybrid_retriever = create_hybrid_retriever(doc_splits, embeddings)
-    return {
-        "llm": llm,
-        "hybrid_retriever": hybrid_retriever,
-    }
+    Switch to a newly built index version, checking at most every INDEX_RELOAD_INTERVAL seconds.
 
-# Initialize app data
-app_data = asyncio.run(initialize_app())
-llm = app_data["llm"]
-hybrid_retriever = app_data["hybrid_retriever"]
+    The new version is loaded in a thread, so requests in flight keep being served, and
+    by one request at a time; the others go on with the current version meanwhile.
+    Answers cached under the previous version are dropped on the next cache access.
+    """
+    global hybrid_retriever, index_version, index_checked_at, rag_workflow
+    if time.monotonic() - index_checked_at < INDEX_RELOAD_INTERVAL or index_reload_lock.locked():
+        return
+    async with index_reload_lock:
+        if time.monotonic() - index_checked_at < INDEX_RELOAD_INTERVAL:
+            return
+        index_checked_at = time.monotonic()
+        version = await asyncio.to_thread(current_version, INDEX_DIRECTORY)
+        if version is None or version == index_version:
+            return
+        try:
+            artifact, hybrid_retriever, rag_workflow = await asyncio.to_thread(load_workflow, version)
+            index_version = artifact.version
+            INDEX_CHUNKS.set(artifact.manifest["num_chunks"])
+        except Exception as e:
+            logging.error(f"Failed to reload index version {version}: {e}")
 
 @app.post("/ask", response_model=AnswerResponse)
-async def ask_question(request: QuestionRequest, background_tasks: BackgroundTasks):
+async def ask_question(
+    request: QuestionRequest,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    cache_control: Optional[str] = Header(None),
+):
     """
     Endpoint to handle questions and generate answers using the RAG workflow.
     This endpoint supports parallelism and concurrency to handle multiple requests.
 
+    Answers to near-duplicate questions are served from a semantic cache; send
+    ``Cache-Control: no-cache`` to bypass it. The ``X-Cache`` response header reports
+    HIT, MISS or BYPASS.
+
     Args:
         request (QuestionRequest): The incoming request containing the question.
         background_tasks (BackgroundTasks): Allows background processing of tasks.
+        response (Response): The outgoing response, used to set cache headers.
+        cache_control (Optional[str]): The request's Cache-Control header.
 
     Returns:
         AnswerResponse: The response containing sub-queries and the generated answer.
     """
     try:
         question = request.question
-        sub_queries = generate_sub_queries(llm, question)
+        await refresh_index()
+        bypass_cache = cache_control is not None and "no-cache" in cache_control.lower()
+        # A reload during the request must not mix the answer of one index with the version of another
+        workflow_app, workflow_index_version = rag_workflow, index_version
+        # The question is only embedded for the cache, so a bypassing request skips it
+        question_vector = None if bypass_cache else await embeddings.aembed_query(question)
+        if question_vector is not None:
+            cached = answer_cache.get(question_vector, workflow_index_version)
+            if cached is not None:
+                response.headers["X-Cache"] = "HIT"
+                return AnswerResponse(**cached)
+        response.headers["X-Cache"] = "BYPASS" if bypass_cache else "MISS"
+
+        # The compiled workflow is shared; its async nodes keep the event loop free while it runs
+        result = await run_workflow(workflow_app, {"question": question})
+        if result is None:
+            raise HTTPException(status_code=500, detail="Failed to generate answer")
+        sub_queries = result.get("sub_questions") or []
 
         if not sub_queries:
             raise HTTPException(status_code=400, detail="Failed to generate sub-queries")
 
-        rag_chain = create_rag_chain(llm)
-
-        # Define a background task to run the workflow concurrently
-        def run_rag_workflow(inputs: Dict[str, Any]) -> Dict[str, Any]:
-            try:
-                app_workflow = setup_langgraph_workflow(llm, sub_queries, hybrid_retriever, rag_chain)
-                result = run_workflow(app_workflow, inputs)
-                return result
-            except Exception as e:
-                logging.error(f"Error in workflow execution: {e}")
-                return {"generation": "Failed to generate answer"}
-
-        inputs = {"question": question}
-        result = await asyncio.to_thread(run_rag_workflow, inputs)  # Run in a separate thread
-
         # Assume the final answer is stored in the result after workflow execution
         final_answer = result.get("generation", "No answer generated")
-        
-        return AnswerResponse(sub_questions=sub_queries, answer=final_answer)
+        answer = AnswerResponse(sub_questions=sub_queries, answer=final_answer)
+        if question_vector is not None and result.get("generation"):
+            answer_cache.set(question_vector, workflow_index_version, answer.dict())
+
+        return answer
 
     except HTTPException as he:
         raise he
@@ -140,6 +216,128 @@ async def ask_question(request: QuestionRequest, background_tasks: BackgroundTas
         logging.error(f"Error processing the question: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data: Any) -> str:
+    """
+    Format one Server-Sent Event.
+
+    Args:
+        event (str): The event name.
+        data (Any): JSON-serializable event data.
+
+    Returns:
+        str: The encoded event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest, cache_control: Optional[str] = Header(None)):
+    """
+    Endpoint that streams the RAG workflow's progress as Server-Sent Events.
+
+    Events are sent as soon as they are produced: ``sub_questions`` after decomposition,
+    ``sources`` with the chunk ids and files used as context, one ``token`` event per
+    generated token, then ``done`` with the full AnswerResponse. Failures are reported
+    as an ``error`` event. Answer cache hits are streamed the same way.
+
+    Args:
+        request (QuestionRequest): The incoming request containing the question.
+        cache_control (Optional[str]): The request's Cache-Control header.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+    """
+    question = request.question
+    await refresh_index()
+    bypass_cache = cache_control is not None and "no-cache" in cache_control.lower()
+    workflow_app, workflow_index_version = rag_workflow, index_version
+
+    async def events():
+        try:
+            question_vector = None if bypass_cache else await embeddings.aembed_query(question)
+            cached = None if question_vector is None else answer_cache.get(question_vector, workflow_index_version)
+            if cached is not None:
+                yield sse_event("sub_questions", cached["sub_questions"])
+                yield sse_event("token", cached["answer"])
+                yield sse_event("done", cached)
+                return
+            async for event, data in stream_workflow(workflow_app, {"question": question}):
+                if event != "done":
+                    yield sse_event(event, data)
+                elif not data.get("sub_questions"):
+                    yield sse_event("error", {"detail": "Failed to generate sub-queries"})
+                else:
+                    answer = AnswerResponse(
+                        sub_questions=data["sub_questions"],
+                        answer=data.get("generation", "No answer generated"),
+                    )
+                    if question_vector is not None and data.get("generation"):
+                        answer_cache.set(question_vector, workflow_index_version, answer.dict())
+                    yield sse_event("done", answer.dict())
+        except Exception as e:
+            logging.error(f"Error streaming the answer: {e}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchRequest):
+    """
+    Endpoint that answers up to BATCH_MAX_QUESTIONS questions in one request.
+
+    The questions share planning, query embedding and retrieval (see BatchRunner) and
+    bypass the answer cache. Results are streamed as newline-delimited JSON in the order
+    they finish, one object per question with its ``id`` (the index in the request),
+    ``question`` and either ``sub_questions`` and ``answer`` or ``error``.
+
+    Args:
+        request (BatchRequest): The questions.
+
+    Returns:
+        StreamingResponse: An application/x-ndjson response.
+    """
+    await refresh_index()
+    runner = BatchRunner(
+        lambda retriever: build_workflow(llm, reranker, retriever, query_planner, context_packer),
+        hybrid_retriever,
+        embeddings,
+        query_planner,
+    )
+    records = [{"id": i, "question": item.question} for i, item in enumerate(request.questions)]
+
+    async def results():
+        try:
+            async for result in runner.run(records):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logging.error(f"Error answering the batch: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Endpoint exposing Prometheus metrics, aggregated across all gunicorn workers.
+    """
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+@app.on_event("shutdown")
+async def close_clients():
+    """
+    Close the HTTP sessions of the reranker and the embeddings client when the worker stops.
+    """
+    client = getattr(reranker, "client", None)
+    if client is not None and hasattr(client, "close"):
+        await client.close()
+    if hasattr(embeddings, "close"):
+        # Waits for the client's own loop thread to close its session, so not on this loop
+        await asyncio.to_thread(embeddings.close)
+
 # Default root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Set
+
+from cache import normalize_text
+from config import BATCH_CONCURRENCY, BATCH_WINDOW_SIZE
+from planner import QueryPlanner
+from workflow import run_workflow
+
+
+class SharedRetriever:
+    """
+    Retriever wrapper that runs each distinct query once and shares the result.
+
+    Queries are compared after normalization, so the sub-questions that many
+    questions of a batch have in common are retrieved once. Concurrent callers of
+    the same query wait for the same retrieval. Results are kept for the wrapper's
+    lifetime, which should be one batch; a failed retrieval is dropped, so the next
+    caller of its query tries again.
+
+    Args:
+        retriever (Any): The retriever to wrap; only ``ainvoke`` is used.
+    """
+
+    def __init__(self, retriever: Any):
+        self.retriever = retriever
+        self.calls = 0
+        self._results: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def ainvoke(self, query: str) -> Any:
+        key = normalize_text(query)
+        result = self._results.get(key)
+        if result is None or (result.done() and (result.cancelled() or result.exception() is not None)):
+            self.calls += 1
+            result = asyncio.ensure_future(self.retriever.ainvoke(query))
+            self._results[key] = result
+        try:
+            # Shielded, so a caller's timeout does not cancel the retrieval the others wait for
+            return list(await asyncio.shield(result))
+        except Exception:
+            if result.done() and self._results.get(key) is result:
+                del self._results[key]
+            raise
+
+
+class BatchRunner:
+    """
+    Answers many questions with the RAG workflow, sharing retrieval work across them.
+
+    Questions are taken in windows of ``window`` questions. For each window the unique
+    questions are planned first and all their sub-questions are embedded in full
+    batches, which fills the query embedding cache. The questions are then answered
+    with up to ``concurrency`` workflows at once. All of them use one SharedRetriever,
+    so a sub-question shared by several questions is retrieved once per batch.
+
+    Args:
+        build_workflow (Callable[[Any], Any]): Compiles the workflow around a retriever.
+        hybrid_retriever (Any): The retriever to share.
+        embeddings (Any): The query embeddings used by the retriever.
+        query_planner (QueryPlanner): The planner used by the workflow.
+        concurrency (int): Questions answered at once.
+        window (int): Questions planned and embedded together.
+    """
+
+    def __init__(
+        self,
+        build_workflow: Callable[[Any], Any],
+        hybrid_retriever: Any,
+        embeddings: Any,
+        query_planner: QueryPlanner,
+        concurrency: int = BATCH_CONCURRENCY,
+        window: int = BATCH_WINDOW_SIZE,
+    ):
+        self.build_workflow = build_workflow
+        self.hybrid_retriever = hybrid_retriever
+        self.embeddings = embeddings
+        self.query_planner = query_planner
+        self.concurrency = concurrency
+        self.window = window
+
+    async def prepare(self, questions: List[str], semaphore: asyncio.Semaphore) -> None:
+        """
+        Plan the unique questions and embed all their sub-questions in batches.
+
+        Args:
+            questions (List[str]): The questions of one window.
+            semaphore (asyncio.Semaphore): Bounds the planning calls in flight.
+        """
+        unique = list({normalize_text(question): question for question in questions}.values())
+
+        async def plan(question: str) -> List[str]:
+            async with semaphore:
+                return await self.query_planner.plan(question)
+
+        plans = await asyncio.gather(*[plan(question) for question in unique])
+        sub_questions = list({normalize_text(q): q for sub in plans for q in sub}.values())
+        if sub_questions and hasattr(self.embeddings, "aembed_queries"):
+            try:
+                await self.embeddings.aembed_queries(sub_questions)
+            except Exception as e:
+                # Each retrieval embeds its own query again if the batch failed
+                logging.warning(f"Failed to embed {len(sub_questions)} sub-questions in batch: {e}")
+        logging.info(f"Planned {len(unique)} questions into {len(sub_questions)} unique sub-questions.")
+
+    async def answer(self, workflow: Any, record: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """
+        Answer one question.
+
+        Args:
+            workflow (Any): The compiled workflow.
+            record (Dict[str, Any]): The question's "id" and "question".
+            semaphore (asyncio.Semaphore): Bounds the workflows in flight.
+
+        Returns:
+            Dict[str, Any]: The record with "sub_questions" and "answer", or with "error".
+        """
+        async with semaphore:
+            result = await run_workflow(workflow, {"question": record["question"]})
+        if result is None:
+            return {**record, "error": "Failed to generate answer"}
+        if not result.get("sub_questions"):
+            return {**record, "error": "Failed to generate sub-queries"}
+        return {**record, "sub_questions": result["sub_questions"], "answer": result.get("generation", "No answer generated")}
+
+    async def run(self, records: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer the questions, yielding each result as soon as it is ready.
+
+        Args:
+            records (Iterable[Dict[str, Any]]): Records with an "id" and a "question".
+
+        Yields:
+            Dict[str, Any]: One result per record, in completion order.
+        """
+        records = list(records)
+        shared_retriever = SharedRetriever(self.hybrid_retriever)
+        workflow = self.build_workflow(shared_retriever)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        for begin in range(0, len(records), self.window):
+            window = records[begin:begin + self.window]
+            await self.prepare([record["question"] for record in window], semaphore)
+            tasks = [asyncio.ensure_future(self.answer(workflow, record, semaphore)) for record in window]
+            try:
+                for task in asyncio.as_completed(tasks):
+                    yield await task
+            finally:
+                for task in tasks:
+                    task.cancel()
+        logging.info(f"Answered {len(records)} questions with {shared_retriever.calls} retrievals.")
+
+
+def read_questions(path: str, field: str = "question", id_field: str = "id") -> List[Dict[str, Any]]:
+    """
+    Read questions from a JSONL file.
+
+    Args:
+        path (str): The JSONL file.
+        field (str): The field holding the question.
+        id_field (str): The field holding the question's id; the line number if absent.
+
+    Returns:
+        List[Dict[str, Any]]: Records with an "id" and a "question".
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            records.append({"id": str(row.get(id_field, line_number)), "question": row[field]})
+    return records
+
+
+def compact_results(path: str) -> Set[str]:
+    """
+    Rewrite a results file so that it holds one successful result per id.
+
+    Failed results, duplicates of an id already answered and a line cut short by an
+    interrupted run are dropped, so the questions they belong to can be answered again
+    without leaving two lines for one id. The file is replaced atomically.
+
+    Args:
+        path (str): The JSONL results file; it may not exist.
+
+    Returns:
+        Set[str]: The ids of the results kept.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    kept = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in result and str(result["id"]) not in done:
+                done.add(str(result["id"]))
+                kept.append(line if line.endswith("\n") else line + "\n")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+    os.replace(tmp_path, path)
+    return done
+
+
+async def run_jsonl(
+    runner: BatchRunner,
+    input_path: str,
+    output_path: str,
+    field: str = "question",
+    id_field: str = "id",
+    overwrite: bool = False,
+) -> Dict[str, int]:
+    """
+    Answer the questions of a JSONL file and append the results to another.
+
+    The results file is the checkpoint: every result is written and flushed as soon as
+    it is ready, and questions that already have a result without an error are skipped,
+    so an interrupted run resumes where it stopped. Failed questions are retried, after
+    their results are removed (see ``compact_results``), so the file holds at most one
+    line per id.
+
+    Args:
+        runner (BatchRunner): The batch runner.
+        input_path (str): The JSONL file of questions.
+        output_path (str): The JSONL results file.
+        field (str): The field holding the question.
+        id_field (str): The field holding the question's id.
+        overwrite (bool): Start over instead of resuming.
+
+    Returns:
+        Dict[str, int]: The number of questions "answered", "failed" and "skipped".
+    """
+    records = read_questions(input_path, field, id_field)
+    done = set() if overwrite else compact_results(output_path)
+    pending = []
+    for record in records:
+        # A repeated id in the input is answered once
+        if record["id"] not in done:
+            done.add(record["id"])
+            pending.append(record)
+    counts = {"answered": 0, "failed": 0, "skipped": len(records) - len(pending)}
+    logging.info(f"Answering {len(pending)} questions from {input_path}, {counts['skipped']} already done.")
+    with open(output_path, "w" if overwrite else "a", encoding="utf-8") as out:
+        async for result in runner.run(pending):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            counts["failed" if "error" in result else "answered"] += 1
+    return counts
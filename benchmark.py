@@ -0,0 +1,578 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import aiohttp
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from prometheus_client.parser import text_string_to_metric_families
+
+from bm25 import BM25Index, tokenize
+from config import CHUNK_OVERLAP, CHUNK_SIZE, VECTOR_INDEX_TYPE, VECTOR_SEARCH_K
+from embedding_client import BatchedEmbeddings
+from index_store import load_index
+from retrievers import build_index
+from stub_services import StubLLMService, StubNIMService, stub_vector
+from vector_index import benchmark_vector_indexes
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+QUANTILES = (0.5, 0.95, 0.99)
+STAGE_HISTOGRAMS = (("rag_node_duration_seconds", "node"), ("rag_upstream_request_duration_seconds", "upstream"))
+
+
+def load_workload(path: str, field: str = "question") -> List[str]:
+    """
+    Read questions from a JSONL file, one JSON object per line.
+
+    Args:
+        path (str): The JSONL file.
+        field (str): The key holding the question.
+
+    Returns:
+        List[str]: The questions, in file order.
+    """
+    with open(path, encoding="utf-8") as f:
+        questions = [json.loads(line)[field] for line in f if line.strip()]
+    if not questions:
+        raise ValueError(f"No questions in {path}")
+    return questions
+
+
+def percentiles_ms(seconds: Iterable[float]) -> Dict[str, float]:
+    """
+    Summarize latencies given in seconds as p50/p95/p99 in milliseconds.
+    """
+    values = np.asarray(list(seconds), dtype=np.float64)
+    if not len(values):
+        return {}
+    return {f"p{int(q * 100)}_ms": round(float(np.quantile(values, q)) * 1000, 2) for q in QUANTILES}
+
+
+def histogram_buckets(exposition: str, metric: str, label: str) -> Dict[str, Dict[float, float]]:
+    """
+    Read the cumulative bucket counts of a histogram from Prometheus text output.
+
+    Args:
+        exposition (str): A /metrics response body.
+        metric (str): The histogram name.
+        label (str): The label to group by, e.g. "node".
+
+    Returns:
+        Dict[str, Dict[float, float]]: Cumulative count per upper bound, per label value.
+    """
+    buckets: Dict[str, Dict[float, float]] = defaultdict(dict)
+    for family in text_string_to_metric_families(exposition):
+        if family.name != metric:
+            continue
+        for sample in family.samples:
+            if sample.name == f"{metric}_bucket":
+                bound = float(sample.labels["le"])
+                buckets[sample.labels[label]][bound] = buckets[sample.labels[label]].get(bound, 0.0) + sample.value
+    return buckets
+
+
+def bucket_quantile(buckets: Dict[float, float], q: float) -> float:
+    """
+    Estimate a quantile from cumulative histogram buckets, as PromQL's histogram_quantile does.
+
+    Args:
+        buckets (Dict[float, float]): Cumulative count per upper bound, including +Inf.
+        q (float): The quantile, between 0 and 1.
+
+    Returns:
+        float: The estimate, interpolated linearly within the bucket it falls in.
+    """
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    rank = q * total
+    lower, below = 0.0, 0.0
+    for bound in bounds:
+        if buckets[bound] >= rank:
+            if bound == float("inf"):
+                return lower
+            inside = buckets[bound] - below
+            return lower + (bound - lower) * ((rank - below) / inside if inside else 1.0)
+        lower, below = bound, buckets[bound]
+    return lower
+
+
+def stage_latencies(before: str, after: str) -> Dict[str, Dict[str, float]]:
+    """
+    Per-stage latency quantiles over the interval between two /metrics scrapes.
+
+    Args:
+        before (str): The scrape taken before the load.
+        after (str): The scrape taken after it.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Count and p50/p95/p99 in ms per "node:<name>" and "upstream:<name>".
+    """
+    stages = {}
+    for metric, label in STAGE_HISTOGRAMS:
+        start, end = histogram_buckets(before, metric, label), histogram_buckets(after, metric, label)
+        for name, counts in end.items():
+            delta = {bound: count - start.get(name, {}).get(bound, 0.0) for bound, count in counts.items()}
+            if delta[float("inf")] <= 0:
+                continue
+            stages[f"{label}:{name}"] = {
+                "count": int(delta[float("inf")]),
+                **{f"p{int(q * 100)}_ms": round(bucket_quantile(delta, q) * 1000, 2) for q in QUANTILES},
+            }
+    return stages
+
+
+def process_tree(root: int) -> List[int]:
+    """
+    List a process and all its descendants, from /proc.
+    """
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    children[int(f.read().rsplit(")", 1)[1].split()[1])].append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    pids, pending = [], [root]
+    while pending:
+        pid = pending.pop()
+        pids.append(pid)
+        pending.extend(children.get(pid, []))
+    return pids
+
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """
+    Resident (RSS) and proportional (PSS) memory of a process, in MB.
+
+    PSS divides shared pages among the processes mapping them, so summing it over
+    the server's processes gives its real footprint.
+    """
+    fields = {}
+    for path in (f"/proc/{pid}/smaps_rollup", f"/proc/{pid}/status"):
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("Rss", "Pss", "VmRSS") and key not in fields:
+                        fields[key] = int(value.split()[0]) / 1024
+        except OSError:
+            continue
+    return {"rss_mb": round(fields.get("Rss", fields.get("VmRSS", 0.0)), 1), "pss_mb": round(fields.get("Pss", 0.0), 1)}
+
+
+def server_memory(root: int) -> Dict[str, Any]:
+    """
+    Memory of every process serving the app, with totals.
+    """
+    processes = []
+    pids = process_tree(root)
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        if "resource_tracker" in cmdline:
+            continue
+        processes.append({"pid": pid, "role": "master" if pid == root and len(pids) > 1 else "worker", **process_memory(pid)})
+    workers = [p for p in processes if p["role"] == "worker"] or processes
+    return {
+        "processes": processes,
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "max_worker_rss_mb": max((p["rss_mb"] for p in workers), default=0.0),
+    }
+
+
+async def replay(
+    url: str,
+    questions: List[str],
+    total: int,
+    concurrency: int,
+    rate: float = 0.0,
+    use_cache: bool = False,
+    seed: int = 0,
+) -> Tuple[List[float], int, float]:
+    """
+    Send questions to ``/ask``, cycling through the workload.
+
+    With ``rate`` > 0, requests arrive as a Poisson process at that many per second
+    (open loop) and latency includes any wait for a free connection; otherwise
+    ``concurrency`` clients send back to back (closed loop).
+
+    Args:
+        url (str): The server base URL.
+        questions (List[str]): The workload.
+        total (int): Requests to send.
+        concurrency (int): Requests in flight at most.
+        rate (float): Arrival rate in requests per second; 0 for a closed loop.
+        use_cache (bool): Let the answer cache serve repeated questions.
+        seed (int): Seed for the arrival times.
+
+    Returns:
+        Tuple[List[float], int, float]: Latencies of successful requests in seconds, the number of failures, and the wall time.
+    """
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {} if use_cache else {"Cache-Control": "no-cache"}
+    latencies: List[float] = []
+    failures = 0
+
+    async def ask(session: aiohttp.ClientSession, question: str) -> None:
+        nonlocal failures
+        arrived = time.perf_counter()
+        async with semaphore:
+            start = arrived if rate > 0 else time.perf_counter()
+            try:
+                async with session.post(f"{url}/ask", json={"question": question}, headers=headers) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=300)) as session:
+        started = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            if rate > 0 and i:
+                await asyncio.sleep(rng.expovariate(rate))
+            tasks.append(asyncio.create_task(ask(session, questions[i % len(questions)])))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return latencies, failures, elapsed
+
+
+def synthetic_documents(questions: List[str], num_chunks: int, seed: int = 0) -> List[Document]:
+    """
+    Chunks of random words drawn from the workload's vocabulary plus filler terms.
+
+    Args:
+        questions (List[str]): The workload, so lexical search has something to match.
+        num_chunks (int): Number of chunks.
+        seed (int): Random seed.
+
+    Returns:
+        List[Document]: The chunks, about CHUNK_SIZE characters each.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({token for question in questions for token in tokenize(question)})
+    vocabulary += [f"term{i}" for i in range(2000)]
+    words = max(1, CHUNK_SIZE // 8)
+    return [
+        Document(page_content=" ".join(rng.choices(vocabulary, k=words)), metadata={"source": f"synthetic-{i // 50}.pdf"})
+        for i in range(num_chunks)
+    ]
+
+
+def build_synthetic_index(index_dir: str, questions: List[str], num_chunks: int, nim_url: str, seed: int = 0) -> str:
+    """
+    Build an index of synthetic chunks embedded by the stub NIM service.
+
+    Returns:
+        str: The index version.
+    """
+    embeddings = BatchedEmbeddings(base_url=nim_url, model="stub")
+    try:
+        return build_index(synthetic_documents(questions, num_chunks, seed), embeddings, index_dir)
+    finally:
+        embeddings.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(server: str, workers: int, port: int, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    """
+    Start the API under gunicorn (with gunicorn_conf.py) or uvicorn, logging to ``log_path``.
+
+    uvicorn runs a single process; use gunicorn to benchmark several workers.
+    """
+    if server == "gunicorn":
+        command = ["-m", "gunicorn", "-c", "gunicorn_conf.py", "-b", f"127.0.0.1:{port}", "-w", str(workers), "api:app"]
+    else:
+        # api.py initializes itself with asyncio.run at import, so it is imported before uvicorn starts its loop
+        command = ["-c", f"import api, uvicorn; uvicorn.run(api.app, host='127.0.0.1', port={port}, log_level='warning')"]
+    with open(log_path, "ab") as log:
+        return subprocess.Popen(
+            [sys.executable, *command],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, **env},
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float, log_path: str) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                with open(log_path, errors="replace") as f:
+                    raise RuntimeError(f"Server exited during startup:\n{f.read()[-4000:]}")
+            try:
+                async with session.get(f"{url}/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(f"Server did not start within {timeout:.0f}s; see {log_path}")
+
+
+async def scrape(url: str) -> str:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{url}/metrics") as response:
+            return await response.text()
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Start the stub upstreams and the API, replay the workload, and collect the report.
+    """
+    questions = load_workload(args.workload, args.field)
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    index_dir = args.index_dir or os.path.join(workdir, "index")
+    dimension = load_index(index_dir).manifest["dimension"] if args.index_dir else args.dimension
+    nim = StubNIMService(dimension, args.embedding_latency, args.rerank_latency, seed=args.seed).start()
+    llm = StubLLMService(args.llm_latency, args.sub_questions, args.answer_tokens, seed=args.seed).start()
+    process = None
+    try:
+        if not args.index_dir:
+            build_synthetic_index(index_dir, questions, args.chunks, nim.url, args.seed)
+        os.makedirs(os.path.join(workdir, "metrics"), exist_ok=True)
+        env = {
+            "LOCAL_EMBEDDINGS_URL": nim.url,
+            "LLM_API_URL": llm.url,
+            "API_KEY": "stub",
+            "INDEX_DIRECTORY": index_dir,
+            "EMBEDDING_CACHE_DIRECTORY": os.path.join(workdir, "embedding-cache"),
+            "PROMETHEUS_MULTIPROC_DIR": os.path.join(workdir, "metrics"),
+        }
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        log_path = os.path.join(workdir, "server.log")
+        process = start_server(args.server, args.workers, port, env, log_path)
+        await wait_until_ready(url, process, args.startup_timeout, log_path)
+        startup_seconds = time.perf_counter() - started
+        if args.warmup:
+            await replay(url, questions, args.warmup, args.concurrency, use_cache=args.use_cache, seed=args.seed)
+        before = await scrape(url)
+        latencies, failures, elapsed = await replay(
+            url, questions, args.requests, args.concurrency, args.rate, args.use_cache, args.seed
+        )
+        after = await scrape(url)
+        memory = server_memory(process.pid)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        nim.stop()
+        llm.stop()
+    return {
+        "load": {
+            "requests": args.requests,
+            "failures": failures,
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "startup_s": round(startup_seconds, 2),
+            "latency": percentiles_ms(latencies),
+            "stages": stage_latencies(before, after),
+            "memory": memory,
+        },
+        "settings": {
+            key: getattr(args, key)
+            for key in ("server", "workers", "concurrency", "rate", "chunks", "embedding_latency", "rerank_latency", "llm_latency")
+        },
+    }
+
+
+def run_micro(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Time chunking, BM25 build and search, and FAISS search on synthetic data in-process.
+    """
+    questions = load_workload(args.workload, args.field)
+    documents = synthetic_documents(questions, args.chunks, args.seed)
+    texts = [doc.page_content for doc in documents]
+
+    text = "\n\n".join(texts)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    start = time.perf_counter()
+    splitter.split_text(text)
+    chunking_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bm25 = BM25Index.build(texts)
+    bm25_build_seconds = time.perf_counter() - start
+    bm25_latencies = []
+    for question in questions * max(1, args.queries // len(questions)):
+        start = time.perf_counter()
+        bm25.search(question, VECTOR_SEARCH_K * 2)
+        bm25_latencies.append(time.perf_counter() - start)
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.chunks, args.dimension), dtype=np.float32)
+    queries = np.asarray([stub_vector(q, args.dimension) for q in questions], dtype=np.float32)
+    queries = np.resize(queries, (max(len(questions), args.queries), args.dimension))
+    index_types = list(dict.fromkeys(["flat", VECTOR_INDEX_TYPE]))
+    faiss_results = benchmark_vector_indexes(vectors, queries, k=VECTOR_SEARCH_K, index_types=index_types)
+
+    return {
+        "micro": {
+            "chunking": {"split_s": round(chunking_seconds, 3), "mb_per_s": round(len(text) / 2**20 / chunking_seconds, 2)},
+            "bm25": {"build_s": round(bm25_build_seconds, 3), **percentiles_ms(bm25_latencies)},
+            **{
+                f"faiss_{r['index_type']}": {key: r[key] for key in ("p50_ms", "p95_ms", "p99_ms", "recall_at_k")}
+                for r in faiss_results
+            },
+        },
+        "settings": {key: getattr(args, key) for key in ("chunks", "dimension", "queries")},
+    }
+
+
+def flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    """
+    Flatten the numeric fields of a report into "a/b/c" paths.
+    """
+    flat = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}/"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = float(value)
+    return flat
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    List the metrics that got worse than the baseline by more than ``tolerance``.
+
+    Throughput ("_rps", "_per_s") and recall should not drop; latencies ("_ms", "_s")
+    and memory ("_mb") should not rise. Latency changes under 1 ms are ignored as noise.
+
+    Args:
+        report (Dict[str, Any]): The current report.
+        baseline (Dict[str, Any]): A report saved from a known good run.
+        tolerance (float): Allowed relative change, e.g. 0.2 for 20%.
+
+    Returns:
+        List[str]: One description per regression.
+    """
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    for path, old in previous.items():
+        if path.startswith("settings/") or path not in current or not old:
+            continue
+        new = current[path]
+        if path.endswith(("_rps", "_per_s", "recall_at_k")):
+            worse = new < old * (1 - tolerance)
+        elif path.endswith(("_ms", "_s", "_mb")):
+            worse = new > old * (1 + tolerance) and not (path.endswith("_ms") and new - old < 1.0)
+        else:
+            continue
+        if worse:
+            regressions.append(f"{path}: {old:g} -> {new:g}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    if "load" in report:
+        load = report["load"]
+        print(
+            f"{load['requests']} requests, {load['failures']} failed, {load['throughput_rps']} req/s, "
+            f"startup {load['startup_s']}s"
+        )
+        print(f"{'stage':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = [("end-to-end", {"count": load["requests"] - load["failures"], **load["latency"]})]
+        for name, stats in sorted(load["stages"].items()):
+            rows.append((name, stats))
+        for name, stats in rows:
+            print(f"{name:<22}{stats['count']:>8}{stats.get('p50_ms', 0):>10.1f}{stats.get('p95_ms', 0):>10.1f}{stats.get('p99_ms', 0):>10.1f}")
+        print(f"{'process':<22}{'pid':>8}{'RSS MB':>10}{'PSS MB':>10}")
+        for process in load["memory"]["processes"]:
+            print(f"{process['role']:<22}{process['pid']:>8}{process['rss_mb']:>10.1f}{process['pss_mb']:>10.1f}")
+        print(f"{'total':<22}{'':>8}{'':>10}{load['memory']['total_pss_mb']:>10.1f}")
+    if "micro" in report:
+        for name, stats in report["micro"].items():
+            print(f"{name:<16}" + "  ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    Benchmark the RAG service and catch performance regressions before deploying.
+
+    ``load`` replays a JSONL question workload against ``/ask`` on a locally started
+    server whose embedding, reranking and LLM upstreams are stubs with configurable
+    latency, and reports throughput, p50/p95/p99 per stage and memory per worker.
+    ``micro`` times chunking, BM25 and FAISS search in-process. With ``--baseline``
+    the run fails when a metric is worse than a saved report by more than ``--tolerance``.
+    """
+    parser = argparse.ArgumentParser(description=parse_args.__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["load", "micro"])
+    parser.add_argument("--workload", default="benchmark_questions.jsonl", help="JSONL file with one question per line")
+    parser.add_argument("--field", default="question", help="Key of the question in each JSONL line")
+    parser.add_argument("--chunks", type=int, default=5000, help="Synthetic chunks to index")
+    parser.add_argument("--dimension", type=int, default=1024, help="Embedding dimension of the synthetic index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--baseline", help="Fail if worse than this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    load = parser.add_argument_group("load")
+    load.add_argument("--index-dir", help="Serve this index instead of a synthetic one")
+    load.add_argument("--server", choices=["gunicorn", "uvicorn"], default="gunicorn" if importlib.util.find_spec("gunicorn") else "uvicorn")
+    load.add_argument("--workers", type=int, default=2, help="gunicorn workers; uvicorn always runs one process")
+    load.add_argument("--requests", type=int, default=200)
+    load.add_argument("--warmup", type=int, default=10)
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second; 0 sends back to back")
+    load.add_argument("--use-cache", action="store_true", help="Let the answer cache serve repeated questions")
+    load.add_argument("--embedding-latency", default="lognormal:0.02,0.3", help="e.g. constant:0.05, uniform:0.01,0.05")
+    load.add_argument("--rerank-latency", default="lognormal:0.05,0.3")
+    load.add_argument("--llm-latency", default="lognormal:0.8,0.4")
+    load.add_argument("--sub-questions", type=int, default=2)
+    load.add_argument("--answer-tokens", type=int, default=60)
+    load.add_argument("--startup-timeout", type=float, default=120.0)
+    micro = parser.add_argument_group("micro")
+    micro.add_argument("--queries", type=int, default=500)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+
+    report = asyncio.run(run_load(args)) if args.mode == "load" else run_micro(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import faiss
+import numpy as np
+from index_store import VECTORS_FILE, load_index
+from vector_index import INDEX_TYPES, benchmark_vector_indexes, flat_vectors
+from config import INDEX_DIRECTORY
+import logging
+import os
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def load_vectors(index_dir: str) -> np.ndarray:
+    """
+    Read the exact vectors of the current index.
+
+    Args:
+        index_dir (str): The root index directory.
+
+    Returns:
+        np.ndarray: The vectors, one row per live chunk.
+    """
+    artifact = load_index(index_dir)
+    vectors, _ = flat_vectors(faiss.read_index(os.path.join(artifact.path, VECTORS_FILE)))
+    return vectors
+
+def main() -> None:
+    """
+    Compare FAISS index types on recall@k against the flat baseline, query latency and memory.
+
+    Runs on the vectors of the current index, or on random vectors with ``--synthetic``.
+    Queries are indexed vectors with a little noise added, so no embedding service is needed.
+    """
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--index-dir", default=INDEX_DIRECTORY)
+    parser.add_argument("--synthetic", type=int, default=0, help="Benchmark this many clustered random vectors instead")
+    parser.add_argument("--dimension", type=int, default=1024, help="Dimension of the synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        # Clustered like real embeddings; uniform noise is a worst case no ANN index handles well
+        centers = rng.standard_normal((max(1, args.synthetic // 100), args.dimension), dtype=np.float32)
+        noise = rng.standard_normal((args.synthetic, args.dimension), dtype=np.float32)
+        vectors = centers[rng.integers(0, len(centers), size=args.synthetic)] + 0.5 * noise
+    else:
+        vectors = load_vectors(args.index_dir)
+    sample = vectors[rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)]
+    queries = sample + rng.normal(scale=0.01 * float(np.std(vectors)), size=sample.shape).astype(np.float32)
+
+    results = benchmark_vector_indexes(
+        vectors, queries, k=args.k, index_types=args.types, nlist=args.nlist, nprobe=args.nprobe, ef_search=args.ef_search
+    )
+    print(f"{len(vectors)} vectors of dimension {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+    print(f"{'type':<8}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'index MB':>10}{'RSS MB':>10}")
+    for result in results:
+        print(
+            f"{result['index_type']:<8}{result['recall_at_k']:>10.4f}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+            f"{result['build_seconds']:>10.2f}{result['index_bytes'] / 2**20:>10.1f}{result['rss_delta_bytes'] / 2**20:>10.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+PARAMS_FILE = "params.json"
+ARRAY_FILES = ("terms", "indptr", "postings", "weights", "doc_ids")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lower-cased word tokens.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        List[str]: The tokens.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def hash_term(term: str) -> int:
+    """
+    Map a term to a stable 64-bit id, so the vocabulary is an array rather than a dict.
+
+    Args:
+        term (str): The term.
+
+    Returns:
+        int: The term id.
+    """
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index stored as NumPy arrays in CSR layout.
+
+    ``terms`` holds the sorted term ids; the postings of ``terms[i]`` are the rows
+    ``postings[indptr[i]:indptr[i + 1]]`` with their ``weights``. Each weight is the
+    term's IDF times its length-normalized term frequency in that row, all computed
+    at build time, so scoring a query only gathers the postings of its terms and sums
+    them. Row ``r`` is the chunk ``doc_ids[r]``. Saved indexes load memory-mapped.
+
+    Args:
+        terms (np.ndarray): Sorted uint64 term ids.
+        indptr (np.ndarray): Offsets into the postings, one more than there are terms.
+        postings (np.ndarray): Row of each posting.
+        weights (np.ndarray): BM25 weight of each posting.
+        doc_ids (np.ndarray): Chunk id of each row.
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalization.
+    """
+
+    def __init__(
+        self,
+        terms: np.ndarray,
+        indptr: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+        doc_ids: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.terms = terms
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.doc_ids = doc_ids
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def build(
+        cls, texts: Iterable[str], doc_ids: Optional[Iterable[int]] = None, k1: float = 1.5, b: float = 0.75
+    ) -> "BM25Index":
+        """
+        Build the index from chunk texts.
+
+        Args:
+            texts (Iterable[str]): The texts, one per row.
+            doc_ids (Optional[Iterable[int]]): Chunk id of each row; defaults to the row number.
+            k1 (float): Term frequency saturation.
+            b (float): Document length normalization.
+
+        Returns:
+            BM25Index: The built index.
+        """
+        term_ids: Dict[str, int] = {}
+        rows: List[np.ndarray] = []
+        row_terms: List[np.ndarray] = []
+        row_tfs: List[np.ndarray] = []
+        lengths: List[int] = []
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            counts = Counter(term_ids.setdefault(token, len(term_ids)) for token in tokens)
+            row_terms.append(np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)))
+            row_tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            rows.append(np.full(len(counts), row, dtype=np.int32))
+            lengths.append(len(tokens))
+        num_docs = len(lengths)
+        doc_ids = np.arange(num_docs, dtype=np.int64) if doc_ids is None else np.fromiter(doc_ids, dtype=np.int64)
+        if len(doc_ids) != num_docs:
+            raise ValueError(f"Got {len(doc_ids)} doc ids for {num_docs} texts")
+
+        term_of = np.concatenate(row_terms) if row_terms else np.zeros(0, dtype=np.int64)
+        tf = np.concatenate(row_tfs) if row_tfs else np.zeros(0, dtype=np.float32)
+        row_of = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(lengths.mean()) if num_docs and lengths.sum() else 1.0
+
+        # Re-number terms by their hashed id so the vocabulary is a sorted array
+        hashes = np.fromiter((hash_term(term) for term in term_ids), dtype=np.uint64, count=len(term_ids))
+        order = np.argsort(hashes, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        term_of = rank[term_of]
+
+        document_frequency = np.bincount(term_of, minlength=len(hashes)).astype(np.float32)
+        idf = np.log1p((num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1.0 - b + b * lengths / avgdl)
+        weights = (idf[term_of] * tf * (k1 + 1.0) / (tf + norm[row_of])).astype(np.float32)
+
+        by_term = np.argsort(term_of, kind="stable")
+        indptr = np.zeros(len(hashes) + 1, dtype=np.int64)
+        np.cumsum(document_frequency.astype(np.int64), out=indptr[1:])
+        logging.info(f"Built BM25 index over {num_docs} chunks with {len(hashes)} terms.")
+        return cls(hashes[order], indptr, row_of[by_term], weights[by_term], doc_ids, k1=k1, b=b)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score every row against a query.
+
+        Args:
+            query (str): The query text.
+
+        Returns:
+            np.ndarray: One BM25 score per row.
+        """
+        hashes, counts = np.unique(
+            np.fromiter((hash_term(token) for token in tokenize(query)), dtype=np.uint64), return_counts=True
+        )
+        slots = np.searchsorted(self.terms, hashes)
+        found = slots < len(self.terms)
+        found[found] = self.terms[slots[found]] == hashes[found]
+        slots, counts = slots[found], counts[found]
+        if not len(slots):
+            return np.zeros(len(self), dtype=np.float32)
+        starts, ends = self.indptr[slots], self.indptr[slots + 1]
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        # A term repeated in the query counts once per occurrence, as in Okapi BM25
+        repeats = np.repeat(counts, ends - starts).astype(np.float32)
+        return np.bincount(
+            self.postings[positions], weights=self.weights[positions] * repeats, minlength=len(self)
+        ).astype(np.float32)
+
+    def search(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the chunk ids and scores of the k best matching rows.
+
+        Rows that share no term with the query are never returned.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of results.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Chunk ids and scores, best first.
+        """
+        scores = self.scores(query)
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return np.asarray(self.doc_ids[top]), scores[top]
+
+    def save(self, path: str) -> None:
+        """
+        Write the index arrays and parameters to a directory.
+
+        Args:
+            path (str): The target directory.
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAY_FILES:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, PARAMS_FILE), "w") as f:
+            json.dump({"k1": self.k1, "b": self.b, "num_docs": len(self), "num_terms": len(self.terms)}, f)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "BM25Index":
+        """
+        Load an index written by ``save``.
+
+        Args:
+            path (str): The index directory.
+            mmap (bool): Memory-map the arrays instead of reading them into memory.
+
+        Returns:
+            BM25Index: The loaded index.
+        """
+        with open(os.path.join(path, PARAMS_FILE)) as f:
+            params = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in ARRAY_FILES
+        }
+        return cls(**arrays, k1=params["k1"], b=params["b"])
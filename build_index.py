@@ -0,0 +1,32 @@
+import asyncio
+from utils import download_datasets
+from models import initialize_models
+from ingest import ingest_directory
+from config import DOCS_DIRECTORY, INDEX_DIRECTORY
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+async def main() -> None:
+    """
+    Build or incrementally update the on-disk hybrid index ahead of starting the API workers.
+    """
+    try:
+        # Step 1: Download datasets
+        await download_datasets()
+
+        # Step 2: Initialize the embedding model
+        embeddings, _, _ = initialize_models()
+
+        # Step 3: Embed new or changed chunks and save the index
+        version = await ingest_directory(DOCS_DIRECTORY, embeddings, INDEX_DIRECTORY)
+        logging.info(f"Index version {version} is now current in {INDEX_DIRECTORY}.")
+
+    except Exception as e:
+        logging.error(f"Error while building the index: {e}")
+        raise
+
+# Build the index
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,328 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from diskcache import Cache
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_TTL,
+    EMBEDDING_CACHE_DIRECTORY,
+    EMBEDDING_CACHE_DISK_BYTES,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+)
+from metrics import record_cache_lookup
+from tracing import SPAN_KIND_CLIENT, start_span
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text for use as a cache key: case-folded with collapsed whitespace.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(text.casefold().split())
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time to live.
+
+    Args:
+        max_size (int): Maximum number of entries kept.
+        ttl (Optional[float]): Seconds an entry stays valid; None keeps entries until evicted.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class EmbeddingCache:
+    """
+    Two-level cache of query embeddings keyed by model name and normalized text.
+
+    The first level is an in-process LRU. The second is a diskcache store that all
+    worker processes pointing at the same directory share, with size-based LRU
+    eviction on disk. Both levels honour the same time to live.
+    """
+
+    def __init__(
+        self,
+        directory: str = EMBEDDING_CACHE_DIRECTORY,
+        max_size: int = EMBEDDING_CACHE_SIZE,
+        disk_size_bytes: int = EMBEDDING_CACHE_DISK_BYTES,
+        ttl: Optional[float] = EMBEDDING_CACHE_TTL,
+    ):
+        self.ttl = ttl or None
+        self.memory = LRUCache(max_size, self.ttl)
+        self.disk = Cache(directory, size_limit=disk_size_bytes, eviction_policy="least-recently-used")
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(model, text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            record_cache_lookup("embedding", True)
+            return vector
+        data = self.disk.get(key)
+        if data is not None:
+            vector = np.frombuffer(data, dtype=np.float32).tolist()
+            self.memory.set(key, vector)
+            self.disk_hits += 1
+            record_cache_lookup("embedding", True)
+            return vector
+        self.misses += 1
+        record_cache_lookup("embedding", False)
+        return None
+
+    def set(self, model: str, text: str, vector: List[float]) -> None:
+        key = self.key(model, text)
+        self.memory.set(key, vector)
+        self.disk.set(key, np.asarray(vector, dtype=np.float32).tobytes(), expire=self.ttl)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 3),
+            "memory_entries": len(self.memory),
+            "disk_bytes": self.disk.volume(),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that answers repeated queries from an EmbeddingCache.
+
+    Document embeddings pass straight through; ingestion already skips unchanged chunks.
+    Query embeddings that miss the cache are traced as ``upstream embedding`` spans.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.set(self.model, text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self.cache.get(self.model, text)
+        if vector is None:
+            with start_span("upstream embedding", SPAN_KIND_CLIENT, **{"upstream": "embedding", "rag.texts": 1}):
+                vector = await self.embeddings.aembed_query(text)
+            self.cache.set(self.model, text, vector)
+        return vector
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        vectors = [self.cache.get(self.model, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            misses = [texts[i] for i in missing]
+            with start_span("upstream embedding", SPAN_KIND_CLIENT, **{"upstream": "embedding", "rag.texts": len(misses)}):
+                if hasattr(self.embeddings, "aembed_queries"):
+                    embedded = await self.embeddings.aembed_queries(misses)
+                else:
+                    embedded = [await self.embeddings.aembed_query(text) for text in misses]
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self.cache.set(self.model, texts[i], vector)
+        return vectors
+
+    def close(self) -> None:
+        """
+        Close the wrapped embeddings client, if it holds connections.
+        """
+        if hasattr(self.embeddings, "close"):
+            self.embeddings.close()
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose the wrapped client's attributes, such as its throughput stats
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of answers keyed by question embedding.
+
+    A lookup returns the stored answer of the most similar cached question when
+    their cosine similarity reaches the threshold. Entries belong to the index
+    version they were answered from; a lookup under a different version drops all
+    of them, and a store under a version other than the current one is ignored, so
+    an answer that finishes after an index switch is not cached for the new index.
+    When full, the least recently used entry is evicted.
+
+    Args:
+        max_size (int): Maximum number of cached answers.
+        threshold (float): Minimum cosine similarity for a hit.
+        ttl (Optional[float]): Seconds an answer stays valid; None keeps answers until evicted.
+    """
+
+    def __init__(
+        self,
+        max_size: int = ANSWER_CACHE_SIZE,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: Optional[float] = ANSWER_CACHE_TTL,
+    ):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl or None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self, index_version: Optional[str] = None) -> None:
+        """
+        Drop every cached answer, e.g. after the corpus was rebuilt.
+        """
+        with self._lock:
+            self.index_version = index_version
+            self._vectors: Optional[np.ndarray] = None
+            self._answers: List[Any] = []
+            self._expires_at = np.zeros(self.max_size)
+            self._last_used = np.zeros(self.max_size)
+            self._clock = 0
+
+    def _check_version(self, index_version: str, switch: bool = True) -> bool:
+        """
+        Make index_version the cache's version if it is a new one.
+
+        Args:
+            index_version (str): The version of the caller's index.
+            switch (bool): Whether a different version replaces the current one; only
+                lookups switch, since the version is read right before them.
+
+        Returns:
+            bool: True if index_version is the cache's version.
+        """
+        if index_version == self.index_version:
+            return True
+        if self.index_version is not None and not switch:
+            return False
+        if self.index_version is not None:
+            logging.info(f"Index changed to version {index_version}; clearing the answer cache.")
+        self.invalidate(index_version)
+        return True
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, vector: List[float], index_version: str) -> Optional[Any]:
+        self._check_version(index_version)
+        with self._lock:
+            count = len(self._answers)
+            if count:
+                now = time.monotonic()
+                similarities = self._vectors[:count] @ self._unit(vector)
+                similarities[self._expires_at[:count] < now] = -np.inf
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._clock += 1
+                    self._last_used[best] = self._clock
+                    self.hits += 1
+                    record_cache_lookup("answer", True)
+                    return self._answers[best]
+            self.misses += 1
+            record_cache_lookup("answer", False)
+            return None
+
+    def set(self, vector: List[float], index_version: str, answer: Any) -> None:
+        if not self._check_version(index_version, switch=False):
+            logging.debug(f"Not caching an answer from index version {index_version}, now {self.index_version}.")
+            return
+        unit = self._unit(vector)
+        with self._lock:
+            now = time.monotonic()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(unit)), dtype=np.float32)
+            if len(self._answers) < self.max_size:
+                slot = len(self._answers)
+                self._answers.append(answer)
+            else:
+                last_used = np.where(self._expires_at < now, -np.inf, self._last_used)
+                slot = int(np.argmin(last_used))
+                self._answers[slot] = answer
+            self._vectors[slot] = unit
+            self._expires_at[slot] = now + self.ttl if self.ttl else np.inf
+            self._clock += 1
+            self._last_used[slot] = self._clock
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._answers),
+            "index_version": self.index_version,
+        }
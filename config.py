@@ -10,4 +10,67 @@ LLM_API_URL = os.getenv("LLM_API_URL", "https://integrate.api.nvidia.com/v1")
 API_KEY = os.getenv("API_KEY", "<REPLACE_WITH_GENERATED_API_KEY>")
 DOCS_DIRECTORY = './docs'
 CHUNK_SIZE = 500
-CHUNK_OVERLAP = 100
\ No newline at end of file
+CHUNK_OVERLAP = 100
+INDEX_DIRECTORY = os.getenv("INDEX_DIRECTORY", "./index")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_TARGET_LATENCY = float(os.getenv("EMBEDDING_TARGET_LATENCY", "2.0"))
+EMBEDDING_CACHE_DIRECTORY = os.getenv("EMBEDDING_CACHE_DIRECTORY", "./cache/embeddings")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DISK_BYTES = int(os.getenv("EMBEDDING_CACHE_DISK_BYTES", str(1 << 30)))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "30"))
+RETRIEVAL_CONCURRENCY = int(os.getenv("RETRIEVAL_CONCURRENCY", "8"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "10"))
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", "64"))
+VECTOR_INDEX_PQ_BITS = int(os.getenv("VECTOR_INDEX_PQ_BITS", "8"))
+VECTOR_SEARCH_K = int(os.getenv("VECTOR_SEARCH_K", "2"))
+BM25_SEARCH_K = int(os.getenv("BM25_SEARCH_K", "4"))
+HYBRID_SEARCH_K = int(os.getenv("HYBRID_SEARCH_K", "6"))
+FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+FUSION_RRF_K = int(os.getenv("FUSION_RRF_K", "60"))
+FUSION_LEXICAL_WEIGHT = float(os.getenv("FUSION_LEXICAL_WEIGHT", "0.7"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "5"))
+RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "32"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_CONCURRENCY = int(os.getenv("RERANK_CONCURRENCY", "4"))
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "5"))
+RERANK_COOLDOWN = float(os.getenv("RERANK_COOLDOWN", "30"))
+RERANK_LOCAL_MODEL = os.getenv("RERANK_LOCAL_MODEL", "")
+EMBEDDING_RATE_LIMIT = float(os.getenv("EMBEDDING_RATE_LIMIT", "0"))
+EMBEDDING_COALESCE_WINDOW = float(os.getenv("EMBEDDING_COALESCE_WINDOW", "0.005"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1 << 16)))
+DOWNLOAD_REFRESH_INTERVAL = float(os.getenv("DOWNLOAD_REFRESH_INTERVAL", "86400"))
+DOWNLOAD_DOCUMENTS = os.getenv("DOWNLOAD_DOCUMENTS", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+PLANNER_MODE = os.getenv("PLANNER_MODE", "heuristic")
+PLANNER_SIMPLE_MAX_WORDS = int(os.getenv("PLANNER_SIMPLE_MAX_WORDS", "16"))
+DECOMPOSITION_MODEL = os.getenv("DECOMPOSITION_MODEL", "")
+DECOMPOSITION_CACHE_SIZE = int(os.getenv("DECOMPOSITION_CACHE_SIZE", "4096"))
+DECOMPOSITION_CACHE_TTL = float(os.getenv("DECOMPOSITION_CACHE_TTL", "86400"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_WINDOW_SIZE = int(os.getenv("BATCH_WINDOW_SIZE", "256"))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "agentic-rag")
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "8192"))
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIRECTORY = os.getenv("PROFILE_DIRECTORY", "profiles")
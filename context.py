@@ -0,0 +1,202 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_TOKENIZER, CHUNK_OVERLAP
+from tracing import add_span_attributes
+
+# Without a tokenizer, words are counted in pieces of up to four characters plus one per
+# punctuation mark, which is close to what BPE tokenizers produce for English text
+ESTIMATE_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+
+# Shortest suffix/prefix match taken as a real chunk overlap rather than a coincidence
+MIN_OVERLAP = 16
+
+# A passage that does not fit is truncated into the remaining budget only if this much is left
+MIN_TRUNCATED_TOKENS = 64
+
+
+class TokenCounter:
+    """
+    Counts tokens locally, with a tiktoken encoding when one can be loaded.
+
+    The encoding is loaded once, when the counter is created, so a preloaded app
+    shares it with every worker. If tiktoken is missing or the encoding cannot be
+    loaded (it is downloaded on first use), counts are estimated instead.
+
+    Args:
+        encoding (str): The tiktoken encoding name; empty to always estimate.
+    """
+
+    def __init__(self, encoding: str = CONTEXT_TOKENIZER):
+        self.encoding_name = encoding
+        self._encoding = None
+        if encoding:
+            try:
+                import tiktoken
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logging.warning(f"Tokenizer {encoding!r} unavailable, estimating token counts: {e}")
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        return len(ESTIMATE_PATTERN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text down to its first max_tokens tokens.
+
+        Args:
+            text (str): The text.
+            max_tokens (int): The number of tokens to keep.
+
+        Returns:
+            str: The truncated text.
+        """
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode_ordinary(text)
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+        for i, match in enumerate(ESTIMATE_PATTERN.finditer(text)):
+            if i == max_tokens - 1:
+                return text[:match.end()]
+        return text
+
+
+_default_counter: Optional[TokenCounter] = None
+_default_counter_lock = threading.Lock()
+
+
+def default_token_counter() -> TokenCounter:
+    """
+    The process-wide TokenCounter for CONTEXT_TOKENIZER, created on first use.
+
+    Loading the encoding may download it, so it is tried once per process (once in all,
+    under preload_app) instead of once per packer or compiled workflow.
+
+    Returns:
+        TokenCounter: The shared counter; it estimates if the encoding failed to load.
+    """
+    global _default_counter
+    with _default_counter_lock:
+        if _default_counter is None:
+            _default_counter = TokenCounter()
+        return _default_counter
+
+
+def overlap_length(first: str, second: str, max_overlap: int) -> int:
+    """
+    Length of the longest suffix of first that is also a prefix of second.
+
+    Args:
+        first (str): The earlier text.
+        second (str): The later text.
+        max_overlap (int): The longest overlap to look for.
+
+    Returns:
+        int: The overlap in characters, 0 if it is shorter than MIN_OVERLAP.
+    """
+    for size in range(min(len(first), len(second), max_overlap), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return size
+    return 0
+
+
+def merge_passages(documents: List[Document], max_overlap: int = 2 * CHUNK_OVERLAP) -> List[Dict[str, Any]]:
+    """
+    Merge chunks that are adjacent in the same source into passages.
+
+    Chunks with identical text, or text contained in a passage of the same source, are
+    kept once. Chunks of one source are taken in chunk id order and a chunk with the next
+    chunk id is appended to the passage before it: without its first characters if they
+    repeat the passage's end (the splitter's overlap), otherwise after a newline. Each
+    passage keeps the best (lowest) rank of its chunks in the input list.
+
+    Args:
+        documents (List[Document]): The chunks, best first.
+        max_overlap (int): The longest overlap to look for, in characters.
+
+    Returns:
+        List[Dict[str, Any]]: Passages with "source", "chunk_ids", "rank" and "text", best first.
+    """
+    seen_texts = set()
+    by_source: Dict[Any, List[Any]] = {}
+    for rank, doc in enumerate(documents):
+        text = doc.page_content.strip()
+        if not text or text in seen_texts:
+            continue
+        seen_texts.add(text)
+        by_source.setdefault(doc.metadata.get("source"), []).append((doc.metadata.get("chunk_id"), rank, text))
+
+    passages = []
+    for source, chunks in by_source.items():
+        chunks.sort(key=lambda chunk: (chunk[0] is None, chunk[0] if chunk[0] is not None else chunk[1]))
+        current: Optional[Dict[str, Any]] = None
+        for chunk_id, rank, text in chunks:
+            if current is not None:
+                if text in current["text"]:
+                    current["rank"] = min(current["rank"], rank)
+                    current["chunk_ids"].append(chunk_id)
+                    continue
+                previous_id = current["chunk_ids"][-1]
+                if chunk_id is not None and previous_id is not None and chunk_id == previous_id + 1:
+                    overlap = overlap_length(current["text"], text, max_overlap)
+                    current["text"] += text[overlap:] if overlap else "\n" + text
+                    current["rank"] = min(current["rank"], rank)
+                    current["chunk_ids"].append(chunk_id)
+                    continue
+            current = {"source": source, "chunk_ids": [chunk_id], "rank": rank, "text": text}
+            passages.append(current)
+    return sorted(passages, key=lambda passage: passage["rank"])
+
+
+class ContextPacker:
+    """
+    Builds the context for the generation prompt from the reranked chunks.
+
+    Overlapping and adjacent chunks are merged (see ``merge_passages``), then passages
+    are added best first while they fit in the token budget. The first passage that
+    does not fit is truncated into the rest of the budget if at least
+    MIN_TRUNCATED_TOKENS remain; otherwise it is skipped and smaller passages may
+    still fit.
+
+    Args:
+        token_budget (int): The most tokens of context to send.
+        counter (Optional[TokenCounter]): The token counter; ``default_token_counter()`` by default.
+    """
+
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, counter: Optional[TokenCounter] = None):
+        self.token_budget = token_budget
+        self.counter = counter or default_token_counter()
+
+    def pack(self, documents: List[Document]) -> str:
+        """
+        Format the documents as numbered passages within the token budget.
+
+        Args:
+            documents (List[Document]): The reranked chunks, best first.
+
+        Returns:
+            str: The context text.
+        """
+        sections = []
+        remaining = self.token_budget
+        for passage in merge_passages(documents):
+            header = f"[{len(sections) + 1}] {os.path.basename(str(passage['source'] or 'unknown'))}\n"
+            section = header + passage["text"]
+            tokens = self.counter.count(section) + 1
+            if tokens <= remaining:
+                sections.append(section)
+                remaining -= tokens
+                continue
+            if remaining >= MIN_TRUNCATED_TOKENS:
+                sections.append(self.counter.truncate(section, remaining - 1))
+                remaining = 0
+                break
+        add_span_attributes(**{"rag.context_passages": len(sections), "rag.context_tokens": self.token_budget - remaining})
+        logging.debug(f"Packed {len(documents)} chunks into {len(sections)} passages, {self.token_budget - remaining} tokens")
+        return "\n\n".join(sections)
@@ -0,0 +1,281 @@
+import asyncio
+import csv
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import unquote, urlparse
+
+import aiohttp
+
+from config import DOWNLOAD_CHUNK_SIZE, DOWNLOAD_CONCURRENCY, DOWNLOAD_REFRESH_INTERVAL
+
+# Download metadata and partial files live in this hidden subdirectory of the target
+STATE_DIRECTORY = ".downloads"
+
+# Client error statuses that may succeed on a later attempt: request timeout and rate limiting
+RETRYABLE_CLIENT_STATUSES = {408, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a failed download is worth another attempt.
+
+    Network errors, timeouts and 5xx responses are; other 4xx responses, such as a
+    missing file or a denied request, fail the same way every time.
+
+    Args:
+        error (BaseException): The error raised by the attempt.
+
+    Returns:
+        bool: True if the download should be retried.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500 or error.status in RETRYABLE_CLIENT_STATUSES
+    return True
+
+
+def read_manifest(path: str) -> List[str]:
+    """
+    Read the document URLs listed in a CSV manifest such as the dataset's download.csv.
+
+    Every cell holding an http(s) URL counts, whatever the column is called.
+
+    Args:
+        path (str): The CSV file.
+
+    Returns:
+        List[str]: The URLs in file order, without duplicates.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        cells = (cell.strip() for row in csv.reader(f) for cell in row)
+        return list(dict.fromkeys(cell for cell in cells if cell.startswith(("http://", "https://"))))
+
+
+def filenames_for(urls: Iterable[str]) -> Dict[str, str]:
+    """
+    Name each URL's file after the last segment of its path.
+
+    When two URLs end in the same name, later ones are prefixed with a hash of the URL,
+    so names are stable across runs as long as the manifest order is.
+
+    Args:
+        urls (Iterable[str]): The URLs.
+
+    Returns:
+        Dict[str, str]: The file name for each URL.
+    """
+    names: Dict[str, str] = {}
+    taken = set()
+    for url in urls:
+        name = os.path.basename(unquote(urlparse(url).path)) or "index.html"
+        if name in taken:
+            name = f"{hashlib.blake2b(url.encode(), digest_size=4).hexdigest()}_{name}"
+        taken.add(name)
+        names[url] = name
+    return names
+
+
+class Downloader:
+    """
+    Streaming downloader sharing one pooled HTTP session across files.
+
+    Bodies are written to disk in ``chunk_size`` pieces as they arrive. Each file's
+    ETag and Last-Modified are kept, so a file fetched again is only transferred if it
+    changed (304 otherwise), and is not requested at all within ``refresh_interval``
+    seconds of the last check. An interrupted transfer is resumed with an HTTP Range
+    request, guarded by If-Range so a file that changed meanwhile starts over.
+
+    Use as an async context manager.
+
+    Args:
+        directory (str): Where files are written.
+        max_concurrency (int): Files transferred at once.
+        chunk_size (int): Bytes read and written at a time.
+        refresh_interval (float): Seconds a downloaded file is trusted without asking the server.
+        max_retries (int): Attempts per file after the first, each resuming where the last stopped;
+            only failures that ``is_retryable`` accepts are retried.
+        timeout (float): Seconds allowed for one attempt.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_concurrency: int = DOWNLOAD_CONCURRENCY,
+        chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+        refresh_interval: float = DOWNLOAD_REFRESH_INTERVAL,
+        max_retries: int = 3,
+        timeout: float = 600.0,
+    ):
+        self.directory = directory
+        self.max_concurrency = max_concurrency
+        self.chunk_size = chunk_size
+        self.refresh_interval = refresh_interval
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self) -> "Downloader":
+        os.makedirs(os.path.join(self.directory, STATE_DIRECTORY), exist_ok=True)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            # Byte ranges and lengths must refer to the file itself, not a compressed encoding
+            headers={"Accept-Encoding": "identity"},
+            auto_decompress=False,
+        )
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self._session.close()
+        self._session = None
+
+    def _state_path(self, name: str, suffix: str) -> str:
+        return os.path.join(self.directory, STATE_DIRECTORY, name + suffix)
+
+    def _read_meta(self, name: str) -> Dict:
+        try:
+            with open(self._state_path(name, ".json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, name: str, meta: Dict) -> None:
+        path = self._state_path(name, ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    async def fetch(self, url: str, name: Optional[str] = None) -> str:
+        """
+        Bring one file up to date.
+
+        Args:
+            url (str): The file URL.
+            name (Optional[str]): The file name in the directory; defaults to the URL's last path segment.
+
+        Returns:
+            str: "fresh" (not checked), "not_modified", "downloaded" or "resumed".
+        """
+        name = name or filenames_for([url])[url]
+        target = os.path.join(self.directory, name)
+        partial = self._state_path(name, ".part")
+        meta = self._read_meta(name)
+        if meta.get("url") != url:
+            meta = {}
+        complete = os.path.exists(target) and "fetched_at" in meta
+        if complete and time.time() - meta["fetched_at"] < self.refresh_interval:
+            return "fresh"
+
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self._transfer(url, name, target, partial, meta, complete)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    logging.warning(f"Download of {url} interrupted ({e}); retrying.")
+                    await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt))
+                    meta = self._read_meta(name)
+        raise RuntimeError("unreachable")
+
+    async def _transfer(self, url: str, name: str, target: str, partial: str, meta: Dict, complete: bool) -> str:
+        headers = {}
+        offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        validator = meta.get("etag") or meta.get("last_modified")
+        if offset and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        elif complete:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self._session.get(url, headers=headers) as response:
+            if response.status == 304:
+                self._write_meta(name, {**meta, "fetched_at": time.time()})
+                return "not_modified"
+            if response.status == 416:
+                # The partial file no longer matches; start over on the next attempt
+                os.remove(partial)
+                raise aiohttp.ClientPayloadError(f"Range not satisfiable for {url}")
+            response.raise_for_status()
+            resumed = response.status == 206
+            if not resumed:
+                offset = 0
+                meta = {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                # Saved before the body so an interrupted transfer can be resumed
+                self._write_meta(name, meta)
+            expected = response.content_length
+            with open(partial, "ab" if resumed else "wb") as f:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    f.write(chunk)
+            size = os.path.getsize(partial)
+            if expected is not None and size != offset + expected:
+                raise aiohttp.ClientPayloadError(f"Expected {offset + expected} bytes of {url}, got {size}")
+
+        os.replace(partial, target)
+        self._write_meta(name, {**meta, "size": size, "fetched_at": time.time()})
+        logging.info(f"Downloaded {name} ({size} bytes{', resumed' if resumed else ''}).")
+        return "resumed" if resumed else "downloaded"
+
+    async def download_all(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Bring many files up to date, at most ``max_concurrency`` at a time.
+
+        Failures are logged and reported as "failed" instead of raised.
+
+        Args:
+            urls (Iterable[str]): The file URLs.
+
+        Returns:
+            Dict[str, str]: Each URL's outcome, as returned by ``fetch``.
+        """
+        names = filenames_for(urls)
+
+        async def fetch(url: str) -> str:
+            try:
+                return await self.fetch(url, names[url])
+            except Exception as e:
+                logging.error(f"Failed to download {url}: {e}")
+                return "failed"
+
+        statuses = await asyncio.gather(*[fetch(url) for url in names])
+        results = dict(zip(names, statuses))
+        counts = {status: statuses.count(status) for status in set(statuses)}
+        logging.info(f"Download finished: {', '.join(f'{n} {s}' for s, n in sorted(counts.items()))}.")
+        return results
+
+
+class DirectoryLock:
+    """
+    Exclusive lock on a download directory, so concurrent processes download once.
+
+    Used as an async context manager; waiting happens off the event loop.
+
+    Args:
+        directory (str): The download directory.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, STATE_DIRECTORY, "lock")
+        self._file = None
+
+    async def __aenter__(self) -> "DirectoryLock":
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, "w")
+        await asyncio.to_thread(fcntl.flock, self._file, fcntl.LOCK_EX)
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
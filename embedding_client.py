@@ -0,0 +1,256 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_COALESCE_WINDOW,
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_MAX_BATCH_SIZE,
+    EMBEDDING_TARGET_LATENCY,
+)
+from metrics import EMBEDDED_TEXTS, UPSTREAM_ERRORS, observe_upstream
+from scheduler import MicroBatcher, UpstreamLimiter, limiter_for, retry_after_seconds
+
+
+# Live clients, so a forked child can drop the loop threads it did not inherit
+_clients: "weakref.WeakSet[BatchedEmbeddings]" = weakref.WeakSet()
+
+
+class EmbeddingStats:
+    """
+    Running counters for an embedding client.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.requests = 0
+        self.retries = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Chunks embedded per second of wall time spent inside embedding calls."""
+        return self.chunks / self.busy_seconds if self.busy_seconds else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "chunks": self.chunks,
+            "requests": self.requests,
+            "retries": self.retries,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "chunks_per_second": round(self.throughput, 1),
+        }
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embedding client for an OpenAI-compatible ``/embeddings`` endpoint, such as a NIM.
+
+    Texts are split into batches that are sent over one pooled HTTP session with a
+    bounded number of requests in flight. The batch size grows while requests finish
+    under the target latency and is halved when they are slow or rate limited (429).
+    A 413 (payload too large) splits the batch and caps future batches below it.
+
+    All requests run on a private event loop thread, so the sync and async methods
+    share the same connection pool. Query embeddings requested within
+    ``coalesce_window`` seconds of each other, e.g. by concurrent ``/ask`` requests,
+    are sent as one batch. Every request is admitted by the upstream's shared
+    UpstreamLimiter, which bounds concurrency and rate across all clients of the
+    endpoint, including the reranker; ``max_concurrency`` bounds one call's requests.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        truncate: str = "END",
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_CONCURRENCY,
+        target_latency: float = EMBEDDING_TARGET_LATENCY,
+        max_retries: int = 5,
+        timeout: float = 60.0,
+        coalesce_window: float = EMBEDDING_COALESCE_WINDOW,
+        limiter: Optional[UpstreamLimiter] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.truncate = truncate
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.coalesce_window = coalesce_window
+        self.limiter = limiter or limiter_for(self.base_url)
+        self.stats = EmbeddingStats()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._query_batcher: Optional[MicroBatcher] = None
+        self._lock = threading.Lock()
+        _clients.add(self)
+
+    @classmethod
+    def from_nvidia(cls, embeddings: Any, **kwargs: Any) -> "BatchedEmbeddings":
+        """
+        Create a client with the endpoint, model and truncation of an NVIDIAEmbeddings instance.
+        """
+        return cls(base_url=embeddings.base_url, model=embeddings.model, truncate=embeddings.truncate, **kwargs)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        # Started lazily, and again in a forked child, since threads do not survive a fork
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="embedding-client", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _run(self, coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max(self.max_concurrency, self.limiter.max_concurrency)),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            )
+        return self._session
+
+    def _adapt(self, latency: float) -> None:
+        if latency > self.target_latency:
+            self.batch_size = max(1, self.batch_size // 2)
+        elif latency < self.target_latency / 2:
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    async def _post(self, batch: List[str], input_type: str) -> List[List[float]]:
+        session = await self._get_session()
+        payload = {"input": batch, "model": self.model, "input_type": input_type, "truncate": self.truncate}
+        for attempt in range(self.max_retries + 1):
+            async with self.limiter.slot():
+                start = time.perf_counter()
+                try:
+                    async with session.post(f"{self.base_url}/embeddings", json=payload) as response:
+                        if response.status == 413 and len(batch) > 1:
+                            # The server's limit is below this batch, so stop growing past half of it
+                            self.max_batch_size = min(self.max_batch_size, len(batch) // 2)
+                            self.batch_size = min(self.batch_size, self.max_batch_size)
+                            status, retry_after, body = 413, None, None
+                        elif response.status in (429, 502, 503, 504):
+                            status, retry_after, body = response.status, response.headers.get("Retry-After"), None
+                        else:
+                            response.raise_for_status()
+                            status, retry_after, body = response.status, None, await response.json()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    status, retry_after, body = None, None, None
+                    logging.warning(f"Embedding request failed: {e}")
+                latency = time.perf_counter() - start
+            self.stats.requests += 1
+            observe_upstream("embedding", latency)
+
+            if body is not None:
+                self._adapt(latency)
+                return [item["embedding"] for item in sorted(body["data"], key=lambda item: item["index"])]
+            if status == 413:
+                middle = len(batch) // 2
+                first, second = await asyncio.gather(
+                    self._post(batch[:middle], input_type), self._post(batch[middle:], input_type)
+                )
+                return first + second
+            if status == 429:
+                self.batch_size = max(1, self.batch_size // 2)
+                self.limiter.penalize(retry_after_seconds(retry_after, min(30.0, 0.5 * 2 ** attempt)))
+            UPSTREAM_ERRORS.labels("embedding").inc()
+            if attempt == self.max_retries:
+                break
+            self.stats.retries += 1
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else min(30.0, 0.5 * 2 ** attempt)
+            await asyncio.sleep(delay)
+        raise RuntimeError(f"Embedding request failed after {self.max_retries + 1} attempts (last status {status})")
+
+    async def _embed(self, texts: List[str], input_type: str) -> List[List[float]]:
+        start = time.perf_counter()
+        results: List[Optional[List[List[float]]]] = []
+        cursor = 0
+
+        async def worker() -> None:
+            nonlocal cursor
+            while cursor < len(texts):
+                # Each worker takes the current batch size, so adaptation applies to the next request
+                begin, cursor = cursor, min(len(texts), cursor + self.batch_size)
+                slot = len(results)
+                results.append(None)
+                results[slot] = await self._post(texts[begin:cursor], input_type)
+
+        await asyncio.gather(*[worker() for _ in range(self.max_concurrency)])
+        elapsed = time.perf_counter() - start
+        self.stats.chunks += len(texts)
+        self.stats.busy_seconds += elapsed
+        EMBEDDED_TEXTS.labels(input_type).inc(len(texts))
+        if len(texts) > 1:
+            logging.info(
+                f"Embedded {len(texts)} chunks in {elapsed:.2f}s "
+                f"({len(texts) / elapsed:.1f} chunks/sec, batch size {self.batch_size})."
+            )
+        return [vector for batch in results for vector in batch]
+
+    async def _embed_query(self, text: str) -> List[float]:
+        # Created on the client's loop, which is the only loop that touches it
+        if self._query_batcher is None:
+            self._query_batcher = MicroBatcher(
+                lambda texts: self._embed(texts, "query"), self.max_batch_size, self.coalesce_window
+            )
+        return await self._query_batcher.submit(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._run(self._embed(texts, "passage")).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._run(self._embed_query(text)).result()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._run(self._embed(texts, "passage")))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._run(self._embed_query(text)))
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        # Many queries known up front, e.g. a batch job's, go out in full batches at once
+        return await asyncio.wrap_future(self._run(self._embed(texts, "query")))
+
+    def close(self) -> None:
+        """
+        Close the HTTP session and stop the client's event loop.
+        """
+        if self._loop is None:
+            return
+        if self._session is not None:
+            self._run(self._session.close()).result()
+            self._session = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._query_batcher = None
+
+
+def _forget_loops() -> None:
+    # A forked child has the parent's loop object but not the thread running it
+    for client in list(_clients):
+        client._loop = None
+        client._session = None
+        client._query_batcher = None
+        client._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_loops)
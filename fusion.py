@@ -0,0 +1,70 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from config import FUSION_METHOD, FUSION_RRF_K
+
+FUSION_METHODS = ("rrf", "minmax", "zscore")
+
+# A ranked result list: chunk ids best first and their scores, higher being better
+Ranking = Tuple[np.ndarray, np.ndarray]
+
+
+def normalize_scores(scores: np.ndarray, method: str) -> np.ndarray:
+    """
+    Rescale one result list's scores so lists from different backends are comparable.
+
+    Args:
+        scores (np.ndarray): Scores, higher being better.
+        method (str): "minmax" maps them to [0, 1]; "zscore" to zero mean and unit variance.
+
+    Returns:
+        np.ndarray: The normalized scores.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if not len(scores):
+        return scores
+    if method == "minmax":
+        spread = scores.max() - scores.min()
+        return (scores - scores.min()) / spread if spread else np.ones_like(scores)
+    if method == "zscore":
+        std = scores.std()
+        return (scores - scores.mean()) / std if std else np.zeros_like(scores)
+    raise ValueError(f"Unknown score normalization {method!r}")
+
+
+def fuse(
+    rankings: Sequence[Ranking],
+    weights: Sequence[float],
+    method: str = FUSION_METHOD,
+    rrf_k: int = FUSION_RRF_K,
+) -> Ranking:
+    """
+    Merge ranked result lists from several backends on chunk id.
+
+    With "rrf" a chunk at 1-based rank r in a list contributes ``weight / (rrf_k + r)``.
+    With "minmax" or "zscore" it contributes ``weight`` times its normalized score. A
+    chunk missing from a list gets nothing from it. Ties go to the lower chunk id.
+
+    Args:
+        rankings (Sequence[Ranking]): One (chunk ids, scores) pair per backend.
+        weights (Sequence[float]): The weight of each backend.
+        method (str): One of "rrf", "minmax" or "zscore".
+        rrf_k (int): The RRF rank offset; larger values flatten the rank curve.
+
+    Returns:
+        Ranking: All chunk ids found, best first, with their fused scores.
+    """
+    if method == "rrf":
+        contributions: List[np.ndarray] = [
+            weight / (rrf_k + np.arange(1, len(ids) + 1)) for (ids, _), weight in zip(rankings, weights)
+        ]
+    elif method in ("minmax", "zscore"):
+        contributions = [weight * normalize_scores(scores, method) for (_, scores), weight in zip(rankings, weights)]
+    else:
+        raise ValueError(f"Unknown fusion method {method!r}; expected one of {', '.join(FUSION_METHODS)}")
+    ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids, _ in rankings])
+    unique, inverse = np.unique(ids, return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(contributions), minlength=len(unique))
+    order = np.argsort(-scores, kind="stable")
+    return unique[order], scores[order]
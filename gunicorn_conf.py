@@ -1,9 +1,27 @@
 # gunicorn_conf.py
 
+import gc
 import multiprocessing
+import os
+import shutil
 
-# Number of worker processes (2-4 x $(NUM_CORES))
-workers = multiprocessing.cpu_count() * 2 + 1
+# Workers write Prometheus samples to this directory so /metrics can aggregate them.
+# It must be set before any worker imports prometheus_client, and it is cleared here
+# rather than in on_starting because a preloaded app writes samples before that hook.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import multiprocess
+
+# Load the models and the index once in the master; forked workers share its pages
+# copy-on-write, so memory follows the corpus size rather than corpus x workers and
+# a restarted worker is serving as soon as it is forked.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# Each async worker keeps many requests in flight while waiting on the embedding,
+# reranking and LLM services, so one worker per core is enough (WEB_CONCURRENCY overrides)
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
 
 # Using Uvicorn workers to serve ASGI applications
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -20,4 +38,13 @@ errorlog = "-"
 timeout = 120
 
 # Enable graceful reloads (useful during development; disable for production)
-reload = False
\ No newline at end of file
+reload = False
+
+def when_ready(server):
+    # Move everything the master loaded out of the collector's reach, so garbage
+    # collection in the workers does not write to, and so copy, the shared pages
+    gc.freeze()
+
+def child_exit(server, worker):
+    # Stop reporting live gauges, such as in-progress requests, of exited workers
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,314 @@
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from bm25 import BM25Index
+from vector_index import configure_search
+
+# Bump whenever the on-disk layout changes so old workers refuse to load new artifacts.
+INDEX_FORMAT_VERSION = 2
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.faiss"
+SEARCH_INDEX_FILE = "vectors.search.faiss"
+BM25_DIRECTORY = "bm25"
+TOMBSTONES_FILE = "tombstones.npy"
+
+
+class _BlobWriter:
+    """
+    Append byte strings to one contiguous data file and record their offsets.
+
+    Writes ``<path>.bin`` as items arrive and ``<path>.offsets.npy`` on close.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = open(f"{path}.bin", "wb")
+        self._offsets = [0]
+
+    def append(self, item: bytes) -> None:
+        self._file.write(item)
+        self._offsets.append(self._offsets[-1] + len(item))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def close(self) -> None:
+        self._file.close()
+        np.save(f"{self._path}.offsets.npy", np.asarray(self._offsets, dtype=np.int64))
+
+
+class _BlobArray:
+    """
+    Read-only, memory-mapped view over a file written by ``_BlobWriter``.
+    """
+
+    def __init__(self, path: str):
+        self._offsets = np.load(f"{path}.offsets.npy", mmap_mode="r")
+        if os.path.getsize(f"{path}.bin") > 0:
+            self._data = np.memmap(f"{path}.bin", dtype=np.uint8, mode="r")
+        else:
+            self._data = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]])
+
+
+class ChunkStore:
+    """
+    Memory-mapped store of chunk texts and metadata addressed by integer chunk id.
+
+    Chunk ids are positions in the store, so they match the ids used by the FAISS
+    and BM25 indexes. Documents are only materialized when they are requested.
+    """
+
+    def __init__(self, path: str):
+        self._texts = _BlobArray(os.path.join(path, "chunks"))
+        self._metadata = _BlobArray(os.path.join(path, "metadata"))
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def text(self, chunk_id: int) -> str:
+        return self._texts[chunk_id].decode("utf-8")
+
+    def metadata(self, chunk_id: int) -> Dict[str, Any]:
+        return json.loads(self._metadata[chunk_id])
+
+    def document(self, chunk_id: int) -> Document:
+        chunk_id = int(chunk_id)
+        metadata = self.metadata(chunk_id)
+        metadata["chunk_id"] = chunk_id
+        return Document(page_content=self.text(chunk_id), metadata=metadata)
+
+    def documents(self, chunk_ids: Sequence[int]) -> List[Document]:
+        return [self.document(chunk_id) for chunk_id in chunk_ids]
+
+
+class IndexArtifact:
+    """
+    A loaded, versioned index: chunk store, FAISS vectors and BM25 inverted index.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != INDEX_FORMAT_VERSION:
+            raise ValueError(
+                f"Index at {path} has format {self.manifest.get('format_version')}, "
+                f"expected {INDEX_FORMAT_VERSION}"
+            )
+        self.path = path
+        self.version = self.manifest["version"]
+        self.chunk_store = ChunkStore(path)
+        # IO_FLAG_MMAP_IFC (faiss >= 1.9) maps the stored vectors from the file instead of
+        # copying them onto the heap, so they live in the page cache shared by every worker.
+        # Plain IO_FLAG_MMAP only applies to on-disk inverted lists.
+        # Queries go to the approximate index when one was built, else to the exact one.
+        search_path = os.path.join(path, SEARCH_INDEX_FILE)
+        if not os.path.exists(search_path):
+            search_path = os.path.join(path, VECTORS_FILE)
+        self.vector_index = configure_search(
+            faiss.read_index(search_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        )
+        self.bm25 = BM25Index.load(os.path.join(path, BM25_DIRECTORY))
+        tombstones_path = os.path.join(path, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            self.tombstones = np.load(tombstones_path)
+        else:
+            self.tombstones = np.zeros(0, dtype=np.int64)
+
+
+def current_version(index_dir: str) -> Optional[str]:
+    """
+    Return the version the index directory currently points to, if any.
+
+    Args:
+        index_dir (str): The root index directory.
+
+    Returns:
+        Optional[str]: The current version name, or None when no index was built yet.
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class IndexWriter:
+    """
+    Writes a new index version into a temporary directory, then publishes it atomically.
+
+    Chunks can be added in several calls as they become available and are streamed to
+    the chunk store on disk. ``commit`` writes the vector and BM25 indexes, moves the
+    directory to its version name and makes it the current one; ``abort`` discards it.
+    Workers still serving an older version keep a consistent view of their files.
+
+    Args:
+        index_dir (str): The root index directory.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        self.path = os.path.join(index_dir, f".tmp-{self.version}")
+        os.makedirs(self.path)
+        self._texts: Optional[_BlobWriter] = _BlobWriter(os.path.join(self.path, "chunks"))
+        self._metadata: Optional[_BlobWriter] = _BlobWriter(os.path.join(self.path, "metadata"))
+        self._num_documents = 0
+
+    def __len__(self) -> int:
+        return self._num_documents
+
+    def add_documents(self, documents: Iterable[Document]) -> None:
+        """
+        Append chunks to the chunk store; their ids continue from the chunks already added.
+
+        Args:
+            documents (Iterable[Document]): Chunks in chunk-id order.
+        """
+        for doc in documents:
+            self._texts.append(doc.page_content.encode("utf-8"))
+            self._metadata.append(json.dumps(doc.metadata, default=str).encode("utf-8"))
+            self._num_documents += 1
+
+    def close_chunk_store(self) -> ChunkStore:
+        """
+        Finish the chunk store so that it can be read, e.g. to build the BM25 index.
+
+        Returns:
+            ChunkStore: The chunks written so far; no more can be added.
+        """
+        if self._texts is not None:
+            self._texts.close()
+            self._metadata.close()
+            self._texts = self._metadata = None
+        return ChunkStore(self.path)
+
+    def commit(
+        self,
+        vector_index: Any,
+        bm25: BM25Index,
+        manifest: Optional[Dict[str, Any]] = None,
+        tombstones: Optional[np.ndarray] = None,
+        search_index: Optional[Any] = None,
+    ) -> str:
+        """
+        Write the remaining files and make this version the current one.
+
+        Args:
+            vector_index (Any): Exact flat FAISS index whose ids are chunk ids.
+            bm25 (BM25Index): BM25 index over the live chunks.
+            manifest (Optional[Dict[str, Any]]): Extra fields recorded in the manifest.
+            tombstones (Optional[np.ndarray]): Ids of deleted chunks kept in the chunk store.
+            search_index (Optional[Any]): Approximate FAISS index used for queries instead of vector_index.
+
+        Returns:
+            str: The new version name.
+        """
+        try:
+            self.close_chunk_store()
+            faiss.write_index(vector_index, os.path.join(self.path, VECTORS_FILE))
+            if search_index is not None:
+                faiss.write_index(search_index, os.path.join(self.path, SEARCH_INDEX_FILE))
+            bm25.save(os.path.join(self.path, BM25_DIRECTORY))
+            tombstones = np.zeros(0, dtype=np.int64) if tombstones is None else np.asarray(tombstones, dtype=np.int64)
+            np.save(os.path.join(self.path, TOMBSTONES_FILE), tombstones)
+            with open(os.path.join(self.path, MANIFEST_FILE), "w") as f:
+                json.dump(
+                    {
+                        **(manifest or {}),
+                        "format_version": INDEX_FORMAT_VERSION,
+                        "version": self.version,
+                        "num_chunks": self._num_documents - len(tombstones),
+                        "num_tombstones": len(tombstones),
+                        "dimension": vector_index.d,
+                    },
+                    f,
+                    indent=2,
+                )
+            os.rename(self.path, os.path.join(self.index_dir, self.version))
+        except Exception:
+            self.abort()
+            raise
+
+        current_tmp = os.path.join(self.index_dir, f".{CURRENT_FILE}.tmp")
+        with open(current_tmp, "w") as f:
+            f.write(self.version)
+        os.replace(current_tmp, os.path.join(self.index_dir, CURRENT_FILE))
+        logging.info(f"Saved index version {self.version} with {self._num_documents} chunks to {self.index_dir}.")
+        return self.version
+
+    def abort(self) -> None:
+        if self._texts is not None:
+            self._texts.close()
+            self._metadata.close()
+            self._texts = self._metadata = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def save_index(
+    index_dir: str,
+    documents: Iterable[Document],
+    vector_index: Any,
+    bm25: BM25Index,
+    manifest: Optional[Dict[str, Any]] = None,
+    tombstones: Optional[np.ndarray] = None,
+    search_index: Optional[Any] = None,
+) -> str:
+    """
+    Write a new index version and atomically make it the current one.
+
+    The artifact is written to a temporary directory first (see ``IndexWriter``), so
+    workers that are still serving an older version keep a consistent view of their files.
+
+    Args:
+        index_dir (str): The root index directory.
+        documents (Iterable[Document]): Chunks in chunk-id order, including deleted ones.
+        vector_index (Any): Exact flat FAISS index whose ids are chunk ids.
+        bm25 (BM25Index): BM25 index over the live chunks.
+        manifest (Optional[Dict[str, Any]]): Extra fields recorded in the manifest.
+        tombstones (Optional[np.ndarray]): Ids of deleted chunks kept in the chunk store.
+        search_index (Optional[Any]): Approximate FAISS index used for queries instead of vector_index.
+
+    Returns:
+        str: The new version name.
+    """
+    writer = IndexWriter(index_dir)
+    try:
+        writer.add_documents(documents)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.commit(vector_index, bm25, manifest, tombstones, search_index)
+
+
+def load_index(index_dir: str, version: Optional[str] = None) -> IndexArtifact:
+    """
+    Load an index version from disk, memory-mapping its large files.
+
+    Args:
+        index_dir (str): The root index directory.
+        version (Optional[str]): The version to load; defaults to the current one.
+
+    Returns:
+        IndexArtifact: The loaded index.
+    """
+    version = version or current_version(index_dir)
+    if version is None:
+        raise FileNotFoundError(f"No index has been built in {index_dir}")
+    artifact = IndexArtifact(os.path.join(index_dir, version))
+    logging.info(f"Loaded index version {version} from {index_dir}.")
+    return artifact
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import defaultdict, deque
+from itertools import chain
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from bm25 import BM25Index
+from config import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY,
+    INDEX_DIRECTORY,
+    VECTOR_INDEX_TYPE,
+)
+from index_store import VECTORS_FILE, IndexArtifact, IndexWriter, current_version, load_index
+from utils import iter_file_chunks, list_documents
+from vector_index import search_index_for
+
+
+def hash_file(path: str) -> str:
+    """
+    Compute the SHA-256 of a file without reading it into memory at once.
+
+    Args:
+        path (str): The file to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_chunk(text: str) -> str:
+    """
+    Compute the SHA-256 of a chunk's text.
+
+    Args:
+        text (str): The chunk text.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _previous_state(index_dir: str) -> Optional[IndexArtifact]:
+    """
+    Load the current index if it carries a file manifest that can be updated in place.
+    """
+    if current_version(index_dir) is None:
+        return None
+    try:
+        artifact = load_index(index_dir)
+    except ValueError as e:
+        logging.warning(f"{e}; rebuilding it from scratch.")
+        return None
+    if "files" not in artifact.manifest:
+        logging.warning("Current index has no file manifest; rebuilding it from scratch.")
+        return None
+    return artifact
+
+
+async def ingest_directory(
+    directory: str, embeddings: Embeddings, index_dir: str = INDEX_DIRECTORY
+) -> str:
+    """
+    Bring the on-disk index in line with the PDFs in a directory.
+
+    Files are compared to the previous index by content hash and changed files are
+    parsed in a process pool. Only chunks whose text is new are embedded, in
+    batches sent as soon as they fill with at most EMBEDDING_CONCURRENCY of them in
+    flight. Each finished batch goes straight into the vector index and the new
+    version's chunk store on disk. Chunks of deleted or changed files that no longer
+    exist are tombstoned, which removes them from FAISS and from the BM25 statistics
+    while keeping chunk ids stable. The approximate search index, if VECTOR_INDEX_TYPE
+    asks for one, is rebuilt from the exact vectors, also when only the type changed.
+
+    Args:
+        directory (str): The directory containing the PDFs.
+        embeddings (Embeddings): The embeddings model.
+        index_dir (str): The root index directory.
+
+    Returns:
+        str: The version of the index that is current after ingestion.
+    """
+    try:
+        paths = list_documents(directory)
+        file_hashes = {os.path.relpath(path, directory): hash_file(path) for path in paths}
+
+        previous = _previous_state(index_dir)
+        previous_files: Dict[str, Any] = previous.manifest["files"] if previous else {}
+        num_previous = len(previous.chunk_store) if previous else 0
+        tombstones = set(previous.tombstones.tolist()) if previous else set()
+
+        changed = [name for name, digest in file_hashes.items() if previous_files.get(name, {}).get("sha256") != digest]
+        deleted = [name for name in previous_files if name not in file_hashes]
+        index_type_changed = previous and previous.manifest.get("vector_index_type", "flat") != VECTOR_INDEX_TYPE
+        if previous and not changed and not deleted and not index_type_changed:
+            logging.info("Index is up to date; nothing to ingest.")
+            return previous.version
+
+        files = {name: entry for name, entry in previous_files.items() if name in file_hashes and name not in changed}
+        for name in deleted:
+            tombstones.update(previous_files[name]["chunk_ids"])
+
+        writer = IndexWriter(index_dir)
+        in_flight: Deque[Tuple[List[Document], "asyncio.Future"]] = deque()
+        try:
+            if previous:
+                vector_index = faiss.read_index(os.path.join(previous.path, VECTORS_FILE))
+                writer.add_documents(
+                    Document(page_content=previous.chunk_store.text(i), metadata=previous.chunk_store.metadata(i))
+                    for i in range(num_previous)
+                )
+            else:
+                vector_index = None
+            pending: List[Document] = []
+            next_id = num_previous
+
+            async def finish_oldest() -> None:
+                # Batches finish in submission order, so chunks reach the store in chunk id order
+                nonlocal vector_index
+                batch, task = in_flight.popleft()
+                vectors = np.asarray(await task, dtype=np.float32)
+                if vector_index is None:
+                    vector_index = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+                first_id = len(writer)
+                vector_index.add_with_ids(vectors, np.arange(first_id, first_id + len(vectors), dtype=np.int64))
+                writer.add_documents(batch)
+
+            async def embed_pending() -> None:
+                # Send each batch as soon as it fills so embedding overlaps PDF parsing, but
+                # keep at most EMBEDDING_CONCURRENCY batches waiting for their vectors
+                while len(in_flight) >= EMBEDDING_CONCURRENCY:
+                    await finish_oldest()
+                texts = [doc.page_content for doc in pending]
+                in_flight.append((list(pending), asyncio.ensure_future(embeddings.aembed_documents(texts))))
+                pending.clear()
+                while in_flight and in_flight[0][1].done():
+                    await finish_oldest()
+
+            file_chunks = iter_file_chunks([os.path.join(directory, name) for name in changed])
+            # Pull parsed files off the event loop so embedding requests keep flowing meanwhile
+            while (item := await asyncio.to_thread(next, file_chunks, None)) is not None:
+                path, chunks = item
+                name = os.path.relpath(path, directory)
+                old_entry = previous_files.get(name, {"chunk_ids": [], "chunk_hashes": []})
+                if chunks is None:
+                    # Keep the previous version of a file that failed to parse and retry next time
+                    if name in previous_files:
+                        files[name] = {**old_entry, "sha256": None}
+                    continue
+                # A file can repeat a chunk, so each hash maps to all of its ids; every
+                # repetition in the new version reuses one and leftovers are tombstoned
+                reusable: Dict[str, List[int]] = defaultdict(list)
+                for digest, chunk_id in zip(old_entry["chunk_hashes"], old_entry["chunk_ids"]):
+                    reusable[digest].append(chunk_id)
+                chunk_ids, chunk_hashes = [], []
+                for doc in chunks:
+                    digest = hash_chunk(doc.page_content)
+                    if reusable.get(digest):
+                        chunk_ids.append(reusable[digest].pop(0))
+                    else:
+                        chunk_ids.append(next_id)
+                        next_id += 1
+                        pending.append(doc)
+                        if len(pending) >= EMBEDDING_BATCH_SIZE:
+                            await embed_pending()
+                    chunk_hashes.append(digest)
+                tombstones.update(chain.from_iterable(reusable.values()))
+                files[name] = {"sha256": file_hashes[name], "chunk_ids": chunk_ids, "chunk_hashes": chunk_hashes}
+            if pending:
+                await embed_pending()
+            while in_flight:
+                await finish_oldest()
+
+            num_documents = len(writer)
+            live_ids = np.array(sorted(set(range(num_documents)).difference(tombstones)), dtype=np.int64)
+            if not len(live_ids):
+                raise ValueError(f"No documents found in {directory}")
+            stale = np.array(sorted(tombstones.difference(previous.tombstones.tolist())), dtype=np.int64) if previous else []
+            if len(stale):
+                vector_index.remove_ids(stale)
+
+            # New chunk texts are read back from the store written above rather than kept in memory
+            chunk_store = writer.close_chunk_store()
+            bm25 = BM25Index.build((chunk_store.text(i) for i in live_ids), live_ids)
+            version = writer.commit(
+                vector_index,
+                bm25,
+                manifest={
+                    "embedding_model": getattr(embeddings, "model", None),
+                    "chunk_size": CHUNK_SIZE,
+                    "chunk_overlap": CHUNK_OVERLAP,
+                    "files": files,
+                    "vector_index_type": VECTOR_INDEX_TYPE,
+                },
+                tombstones=np.array(sorted(tombstones), dtype=np.int64),
+                search_index=search_index_for(vector_index),
+            )
+        except BaseException:
+            for _, task in in_flight:
+                task.cancel()
+            writer.abort()
+            raise
+        logging.info(
+            f"Ingested {len(changed)} changed and {len(deleted)} deleted files: "
+            f"{num_documents - num_previous} chunks embedded, {len(tombstones)} tombstoned."
+        )
+        return version
+    except Exception as e:
+        logging.error(f"Failed to ingest {directory}: {e}")
+        raise
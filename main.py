@@ -1,100 +1,91 @@
+import argparse
 import asyncio
+from typing import List, Optional
 from utils import download_datasets, load_and_chunk_documents
-from models import initialize_models
-from retrievers import create_hybrid_retriever
-from workflow import setup_langgraph_workflow, run_workflow
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
-from langchain import hub
-from pydantic import BaseModel, Field
-from typing import List, Any, Dict
+from models import initialize_decomposition_llm, initialize_models
+from retrievers import create_hybrid_retriever, load_hybrid_retriever
+from index_store import current_version
+from batch import BatchRunner, run_jsonl
+from planner import QueryPlanner
+from config import BATCH_CONCURRENCY, DOCS_DIRECTORY, INDEX_DIRECTORY
+from workflow import setup_langgraph_workflow, run_workflow, create_rag_chain, create_sub_question_generator
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-class SubQuery(BaseModel):
-    questions: List[str] = Field(description="The list of sub-questions")
+DEFAULT_QUESTION = "How does Get It Right First Time (GIRFT) Urology programme relate to TURBT and URS?"
 
-def generate_sub_queries(llm: ChatOpenAI, question: str) -> List[str]:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """
-    Generate sub-queries from the main question using structured generation.
+    Parse the command line.
 
-    Args:
-        llm (ChatOpenAI): The LLM model instance.
-        question (str): The main question.
-
-    Returns:
-        List[str]: A list of generated sub-queries.
-    """
-    try:
-        sub_question_generator = llm.with_structured_output(SubQuery)
-        result = sub_question_generator.invoke({"input": question})
-        sub_queries = result.questions
-        logging.info(f"Generated sub-queries for the question: {question}")
-        return sub_queries
-    except Exception as e:
-        logging.error(f"Failed to generate sub-queries: {e}")
-        return []
-
-def create_rag_chain(llm: ChatOpenAI) -> Any:
-    """
-    Create a RAG (Retrieval-Augmented Generation) chain.
+    Without --input, the single --question is answered. With --input, every question
+    of the JSONL file is answered and the results are appended to --output; a rerun
+    skips the questions that already have a result.
 
     Args:
-        llm (ChatOpenAI): The LLM model instance.
+        argv (Optional[List[str]]): The arguments; sys.argv by default.
 
     Returns:
-        Any: A configured RAG chain.
+        argparse.Namespace: The parsed arguments.
     """
-    try:
-        # Pull a pre-defined RAG prompt template from the LangChain Hub
-        prompt = hub.pull("rlm/rag-prompt")
-        # Combine the prompt with the LLM and an output parser
-        rag_chain = prompt | llm | StrOutputParser()
-        logging.info("RAG chain created successfully.")
-        return rag_chain
-    except Exception as e:
-        logging.error(f"Failed to create RAG chain: {e}")
-        raise
-
-async def main() -> None:
+    parser = argparse.ArgumentParser(description="Answer questions with the multi-agent RAG workflow.")
+    parser.add_argument("--question", default=DEFAULT_QUESTION, help="The question to answer")
+    parser.add_argument("--input", help="JSONL file of questions to answer in batch")
+    parser.add_argument("--output", default="results.jsonl", help="JSONL file the batch results are appended to")
+    parser.add_argument("--field", default="question", help="Field of each input line holding the question")
+    parser.add_argument("--id-field", default="id", help="Field of each input line holding its id")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions answered at once")
+    parser.add_argument("--overwrite", action="store_true", help="Start the batch over instead of resuming")
+    return parser.parse_args(argv)
+
+async def main(args: argparse.Namespace) -> None:
     """
     Main function to orchestrate the full workflow execution.
+
+    Args:
+        args (argparse.Namespace): The parsed command line.
     """
     try:
-        # Step 1: Download datasets
-        await download_datasets()
-
-        # Step 2: Load and process documents concurrently
-        doc_splits = await load_and_chunk_documents('./docs')
-
-        # Step 3: Initialize models
+        # Step 1: Initialize models
         embeddings, reranker, llm = initialize_models()
 
-        # Step 4: Create hybrid retriever
-        hybrid_retriever = create_hybrid_retriever(doc_splits, embeddings)
+        # Step 2: Load the prebuilt index, or download, chunk and embed the corpus
+        if current_version(INDEX_DIRECTORY) is not None:
+            hybrid_retriever = load_hybrid_retriever(embeddings, INDEX_DIRECTORY)
+        else:
+            await download_datasets()
+            doc_splits = await load_and_chunk_documents(DOCS_DIRECTORY)
+            hybrid_retriever = create_hybrid_retriever(doc_splits, embeddings)
+
+        # Step 3: Create the query planner and the RAG chain using the LLM
+        sub_question_generator = create_sub_question_generator(initialize_decomposition_llm(llm))
+        query_planner = QueryPlanner(sub_question_generator)
+        rag_chain = create_rag_chain(llm)
 
-        # Define a question
-        question = "How does Get It Right First Time (GIRFT) Urology programme relate to TURBT and URS?"
+        def build_workflow(retriever):
+            return setup_langgraph_workflow(
+                llm, sub_question_generator, retriever, rag_chain, reranker, query_planner=query_planner
+            )
 
-        # Step 5: Generate sub-queries using the LLM
-        sub_queries = generate_sub_queries(llm, question)
-        if not sub_queries:
-            logging.error("No sub-queries generated, aborting workflow.")
+        # Step 4: Answer the batch, or run the LangGraph workflow for the single question
+        if args.input:
+            runner = BatchRunner(build_workflow, hybrid_retriever, embeddings, query_planner, concurrency=args.concurrency)
+            counts = await run_jsonl(runner, args.input, args.output, args.field, args.id_field, args.overwrite)
+            logging.info(f"Batch finished: {counts}")
             return
 
-        # Step 6: Create the RAG chain using the LLM
-        rag_chain = create_rag_chain(llm)
-
-        # Step 7: Setup and run LangGraph workflow
-        app = setup_langgraph_workflow(llm, sub_queries, hybrid_retriever, rag_chain)
-        inputs = {"question": question}
-        run_workflow(app, inputs)
+        result = await run_workflow(build_workflow(hybrid_retriever), {"question": args.question})
+        if not result or not result.get("sub_questions"):
+            logging.error("No sub-queries generated; the workflow stopped after decomposition.")
+            return
+        logging.info(f"Sub-questions: {result['sub_questions']}")
+        logging.info(f"Answer: {result.get('generation', 'No answer generated')}")
 
     except Exception as e:
         logging.error(f"Error during workflow execution: {e}")
 
 # Execute the main workflow
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,216 @@
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+from tracing import add_span_attributes, start_span, state_sizes
+
+# Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR (set in
+# gunicorn_conf.py) and /metrics merges the files of all workers, so a scrape that
+# lands on any one worker reports the whole server.
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+NODE_LATENCY = Histogram(
+    "rag_node_duration_seconds", "Time spent in each LangGraph node.", ["node"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_LATENCY = Histogram(
+    "rag_upstream_request_duration_seconds",
+    "Latency of calls to the embedding, LLM and rerank services.",
+    ["upstream"],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter("rag_upstream_errors_total", "Failed calls to upstream services.", ["upstream"])
+UPSTREAM_IN_FLIGHT = Gauge(
+    "rag_upstream_requests_in_flight", "Requests admitted to an upstream service.", ["upstream"], multiprocess_mode="livesum"
+)
+REQUEST_LATENCY = Histogram(
+    "rag_request_duration_seconds", "End-to-end latency of question requests.", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "rag_requests_in_progress", "Question requests being processed.", ["endpoint"], multiprocess_mode="livesum"
+)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Tokens used by LLM calls.", ["kind"])
+EMBEDDED_TEXTS = Counter("rag_embedded_texts_total", "Texts sent to the embedding service.", ["input_type"])
+QUERY_PLANS = Counter("rag_query_plans_total", "Questions planned, by route taken.", ["route"])
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+# The latest write wins: under preload the master sets it once at startup and never
+# again, so any other mode would keep reporting the master's stale index size.
+INDEX_CHUNKS = Gauge("rag_index_chunks", "Live chunks in the served index.", multiprocess_mode="mostrecent")
+
+
+def observe_upstream(upstream: str, seconds: float) -> None:
+    """
+    Record the latency of one call to an upstream service.
+
+    Args:
+        upstream (str): "embedding", "llm" or "rerank".
+        seconds (float): The call's latency.
+    """
+    UPSTREAM_LATENCY.labels(upstream).observe(seconds)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """
+    Count one cache lookup; the hit ratio is hits over all lookups of a cache.
+
+    Args:
+        cache (str): The cache name, e.g. "embedding" or "answer".
+        hit (bool): Whether the lookup was served from the cache.
+    """
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def instrument_node(name: str, node: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]) -> Callable:
+    """
+    Wrap an async LangGraph node so its duration is recorded in NODE_LATENCY.
+
+    Each run is also traced as a ``node {name}`` span with the sizes of its state update.
+
+    Args:
+        name (str): The node name used as label.
+        node (Callable): The async node function.
+
+    Returns:
+        Callable: The instrumented node.
+    """
+    histogram = NODE_LATENCY.labels(name)
+
+    @functools.wraps(node)
+    async def timed(state: Dict[str, Any]) -> Dict[str, Any]:
+        with histogram.time(), start_span(f"node {name}", **{"rag.node": name}) as span:
+            update = await node(state)
+            span.set_attributes(state_sizes(update or {}))
+            return update
+
+    return timed
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[None]:
+    """
+    Count a request as in progress and record its latency when it finishes.
+
+    Args:
+        endpoint (str): The endpoint path used as label.
+    """
+    with REQUESTS_IN_PROGRESS.labels(endpoint).track_inprogress(), REQUEST_LATENCY.labels(endpoint).time():
+        yield
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware tracking in-progress requests and latency for selected endpoints.
+
+    The latency covers the whole response, including streamed bodies.
+
+    Args:
+        app (Any): The wrapped ASGI application.
+        endpoints (Iterable[str]): The request paths to track.
+    """
+
+    def __init__(self, app: Any, endpoints: Iterable[str]):
+        self.app = app
+        self.endpoints = set(endpoints)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.endpoints:
+            await self.app(scope, receive, send)
+            return
+        with track_request(scope["path"]):
+            await self.app(scope, receive, send)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """
+    Callback handler recording the latency and token usage of every LLM call.
+    """
+
+    # Called on the event loop instead of a thread pool; the handler only does bookkeeping
+    run_inline = True
+
+    def __init__(self):
+        self._started: Dict[UUID, float] = {}
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe_upstream("llm", time.perf_counter() - started)
+        prompt_tokens, completion_tokens = token_usage(response)
+        LLM_TOKENS.labels("prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels("completion").inc(completion_tokens)
+        # Runs inline, so the current span is the node that called the LLM
+        add_span_attributes(**{"llm.prompt_tokens": prompt_tokens, "llm.completion_tokens": completion_tokens})
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            observe_upstream("llm", time.perf_counter() - started)
+        UPSTREAM_ERRORS.labels("llm").inc()
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int]:
+    """
+    Read prompt and completion token counts from an LLM result.
+
+    OpenAI-compatible APIs report usage in ``llm_output``; streamed chat responses
+    carry it on the message's ``usage_metadata`` instead, when the server sends it.
+
+    Args:
+        response (LLMResult): The result passed to ``on_llm_end``.
+
+    Returns:
+        Tuple[int, int]: The prompt and completion tokens, zero when not reported.
+    """
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata: Optional[Dict[str, int]] = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Render all metrics in the Prometheus text format.
+
+    Returns:
+        Tuple[bytes, str]: The payload and its content type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    try:
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    except Exception as e:
+        logging.error(f"Failed to render metrics: {e}")
+        raise
@@ -1,20 +1,77 @@
 from typing import Tuple
+import httpx
 from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings, NVIDIARerank
 from langchain_openai import ChatOpenAI
-from config import LOCAL_EMBEDDINGS_URL, LLM_API_URL, API_KEY
+from config import LOCAL_EMBEDDINGS_URL, LLM_API_URL, API_KEY, RERANK_LOCAL_MODEL, DECOMPOSITION_MODEL
+from embedding_client import BatchedEmbeddings
+from cache import CachedEmbeddings
+from metrics import LLMMetricsCallback
+from scheduler import LimitedAsyncTransport, limiter_for
+from reranking import BatchedReranker, CrossEncoderReranker, RerankClient
 import logging
 
-def initialize_models() -> Tuple[NVIDIAEmbeddings, NVIDIARerank, ChatOpenAI]:
+def create_llm(model: str) -> ChatOpenAI:
+    """
+    Create a chat model served from LLM_API_URL.
+
+    The model reports call latency and token usage to the Prometheus metrics, and its
+    async requests go through the LLM_API_URL limiter (LLM_CONCURRENCY, LLM_RATE_LIMIT).
+
+    Args:
+        model (str): The model name.
+
+    Returns:
+        ChatOpenAI: The chat model.
+    """
+    return ChatOpenAI(
+        base_url=LLM_API_URL,
+        api_key=API_KEY,
+        model=model,
+        callbacks=[LLMMetricsCallback()],
+        http_async_client=httpx.AsyncClient(
+            transport=LimitedAsyncTransport(limiter_for(LLM_API_URL)), timeout=httpx.Timeout(600.0, connect=5.0)
+        ),
+    )
+
+def initialize_decomposition_llm(llm: ChatOpenAI) -> ChatOpenAI:
+    """
+    Return the model that decomposes questions: DECOMPOSITION_MODEL if set, otherwise llm.
+
+    Args:
+        llm (ChatOpenAI): The answering model.
+
+    Returns:
+        ChatOpenAI: The decomposition model.
+    """
+    if not DECOMPOSITION_MODEL:
+        return llm
+    logging.info(f"Decomposing questions with {DECOMPOSITION_MODEL}.")
+    return create_llm(DECOMPOSITION_MODEL)
+
+def initialize_models() -> Tuple[CachedEmbeddings, BatchedReranker, ChatOpenAI]:
     """
     Initialize embedding, reranking, and LLM models.
 
+    The NVIDIA embedding model is served through BatchedEmbeddings, which batches
+    and pipelines requests over a pooled HTTP session, behind a query embedding cache.
+    The NVIDIA reranker is called in parallel batches by BatchedReranker, with a local
+    cross-encoder fallback when RERANK_LOCAL_MODEL is set. The LLM is created by
+    create_llm.
+
     Returns:
-        Tuple: Instances of NVIDIAEmbeddings, NVIDIARerank, and ChatOpenAI.
+        Tuple: Instances of CachedEmbeddings, BatchedReranker, and ChatOpenAI.
     """
     try:
-        embeddings = NVIDIAEmbeddings(base_url=LOCAL_EMBEDDINGS_URL, model="nvidia/nv-embedqa-e5-v5", truncate="END")
-        reranker = NVIDIARerank(base_url=LOCAL_EMBEDDINGS_URL, model="nvidia/nv-rerankqa-mistral-4b-v3", truncate="END")
-        llm = ChatOpenAI(base_url=LLM_API_URL, api_key=API_KEY, model="meta/llama-3.1-405b-instruct")
+        embeddings = CachedEmbeddings(BatchedEmbeddings.from_nvidia(
+            NVIDIAEmbeddings(base_url=LOCAL_EMBEDDINGS_URL, model="nvidia/nv-embedqa-e5-v5", truncate="END")
+        ))
+        reranker = BatchedReranker(
+            RerankClient.from_nvidia(
+                NVIDIARerank(base_url=LOCAL_EMBEDDINGS_URL, model="nvidia/nv-rerankqa-mistral-4b-v3", truncate="END")
+            ),
+            fallback=CrossEncoderReranker(RERANK_LOCAL_MODEL) if RERANK_LOCAL_MODEL else None,
+        )
+        llm = create_llm("meta/llama-3.1-405b-instruct")
         logging.info("Models initialized successfully.")
         return embeddings, reranker, llm
     except Exception as e:
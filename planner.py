@@ -0,0 +1,93 @@
+import logging
+import re
+from typing import Any, List, Optional
+
+from cache import LRUCache, normalize_text
+from config import DECOMPOSITION_CACHE_SIZE, DECOMPOSITION_CACHE_TTL, PLANNER_MODE, PLANNER_SIMPLE_MAX_WORDS
+from metrics import QUERY_PLANS, record_cache_lookup
+from tracing import add_span_attributes
+
+# Words and punctuation that join several entities or facts into one question
+MULTI_HOP_PATTERN = re.compile(
+    r"\b(?:and|or|vs|versus|compar\w*|differ\w*|relat\w*|between|both|whereas|as well as)\b|[,;]",
+    re.IGNORECASE,
+)
+
+
+def is_single_hop(question: str, max_words: int = PLANNER_SIMPLE_MAX_WORDS) -> bool:
+    """
+    Guess whether a question can be answered from one retrieval, without decomposition.
+
+    A question is single-hop when it is at most max_words words long, asks one
+    question, and has no conjunction, comparison or list separator that would join
+    several entities or facts. Anything else is decomposed, so mistakes only cost
+    the LLM call that would have been made anyway.
+
+    Args:
+        question (str): The user's question.
+        max_words (int): The longest question treated as single-hop.
+
+    Returns:
+        bool: True if the question is single-hop.
+    """
+    return (
+        len(question.split()) <= max_words
+        and question.count("?") <= 1
+        and MULTI_HOP_PATTERN.search(question) is None
+    )
+
+
+class QueryPlanner:
+    """
+    Decides which sub-questions are retrieved for a question.
+
+    In "heuristic" mode single-hop questions (see ``is_single_hop``) are retrieved
+    as they are; in "always" mode every question is decomposed. Decompositions are
+    cached by normalized question, so a repeated multi-hop question costs no LLM call.
+    A failed decomposition yields no sub-questions and is not cached.
+
+    Args:
+        sub_question_generator (Any): Runnable mapping {"question": ...} to a SubQuery.
+        mode (str): "heuristic" or "always".
+        cache (Optional[LRUCache]): The decomposition cache; one sized from the config by default.
+    """
+
+    def __init__(self, sub_question_generator: Any, mode: str = PLANNER_MODE, cache: Optional[LRUCache] = None):
+        if mode not in ("heuristic", "always"):
+            raise ValueError(f"Unknown planner mode {mode!r}; expected 'heuristic' or 'always'")
+        self.sub_question_generator = sub_question_generator
+        self.mode = mode
+        self.cache = cache or LRUCache(DECOMPOSITION_CACHE_SIZE, DECOMPOSITION_CACHE_TTL or None)
+
+    async def plan(self, question: str) -> List[str]:
+        """
+        Return the sub-questions to retrieve for a question.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            List[str]: The sub-questions; empty if decomposition failed.
+        """
+        if self.mode == "heuristic" and is_single_hop(question):
+            QUERY_PLANS.labels("single_hop").inc()
+            add_span_attributes(**{"rag.plan_route": "single_hop"})
+            return [question]
+        key = normalize_text(question)
+        sub_questions = self.cache.get(key)
+        record_cache_lookup("decomposition", sub_questions is not None)
+        if sub_questions is not None:
+            QUERY_PLANS.labels("cached").inc()
+            add_span_attributes(**{"rag.plan_route": "cached"})
+            return list(sub_questions)
+        try:
+            sub_queries = await self.sub_question_generator.ainvoke({"question": question})
+            sub_questions = sub_queries.questions
+        except Exception as e:
+            logging.error(f"Failed to generate sub-queries: {e}")
+            return []
+        QUERY_PLANS.labels("decomposed").inc()
+        add_span_attributes(**{"rag.plan_route": "decomposed"})
+        if sub_questions:
+            self.cache.set(key, list(sub_questions))
+        return sub_questions
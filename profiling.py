@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Optional
+
+from config import PROFILE_INTERVAL
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the Python stacks of every thread in the process.
+
+    Every ``interval`` seconds a background thread records the stack of each other
+    thread. The result is written in the folded format (``thread;outer;...;inner
+    count`` per line) read by flamegraph.pl, speedscope and similar tools. The event
+    loop is shared, so a profile taken during one request also shows the work of
+    requests running at the same time. Threads such as ``asyncio.to_thread`` workers
+    appear under their own names. Only one profiler runs per process at a time.
+
+    Args:
+        interval (float): Seconds between samples.
+    """
+
+    _running = threading.Lock()
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        """
+        Start sampling.
+
+        Returns:
+            bool: False if another profiler is already running in this process.
+        """
+        if not SamplingProfiler._running.acquire(blocking=False):
+            return False
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        SamplingProfiler._running.release()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path: str) -> None:
+        """
+        Write the samples as folded stacks.
+
+        Args:
+            path (str): The output file; its directory is created if needed.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+from langchain_core.documents import Document
+
+from config import (
+    RERANK_BATCH_SIZE,
+    RERANK_CONCURRENCY,
+    RERANK_COOLDOWN,
+    RERANK_MAX_CANDIDATES,
+    RERANK_TIMEOUT,
+    RERANK_TOP_N,
+)
+from metrics import UPSTREAM_ERRORS, observe_upstream
+from retrievers import dedupe_documents
+from scheduler import UpstreamLimiter, limiter_for, retry_after_seconds
+from tracing import SPAN_KIND_CLIENT, Span, start_span
+
+
+class RerankClient:
+    """
+    Async client for a NIM ``/ranking`` endpoint, such as the one behind NVIDIARerank.
+
+    Args:
+        base_url (str): The endpoint base URL, e.g. ``http://host:8000/v1``.
+        model (str): The reranking model.
+        api_key (Optional[str]): Bearer token, if the endpoint needs one.
+        truncate (Optional[str]): "NONE" or "END".
+        timeout (float): Seconds before a request is abandoned.
+        limiter (Optional[UpstreamLimiter]): Admission control; defaults to the one shared by the endpoint.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        truncate: Optional[str] = "END",
+        timeout: float = 60.0,
+        limiter: Optional[UpstreamLimiter] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api_key = api_key
+        self.truncate = truncate
+        self.timeout = timeout
+        self.limiter = limiter or limiter_for(self.base_url)
+        # A session belongs to the event loop it was created on, so there is one per loop;
+        # an entry goes away with its loop
+        self._sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @classmethod
+    def from_nvidia(cls, reranker: Any, **kwargs: Any) -> "RerankClient":
+        """
+        Create a client with the endpoint, model and truncation of an NVIDIARerank instance.
+        """
+        return cls(base_url=reranker.base_url, model=reranker.model, truncate=reranker.truncate, **kwargs)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None,
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def rank(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score passages against a query.
+
+        Args:
+            query (str): The query.
+            texts (List[str]): The passages.
+
+        Returns:
+            List[float]: One relevance logit per passage, in input order.
+        """
+        payload = {"model": self.model, "query": {"text": query}, "passages": [{"text": t} for t in texts]}
+        if self.truncate:
+            payload["truncate"] = self.truncate
+        with start_span("upstream rerank", SPAN_KIND_CLIENT, **{"upstream": "rerank", "rag.passages": len(texts)}) as span:
+            async with self.limiter.slot():
+                body = await self._post(payload, span)
+        scores = [float("-inf")] * len(texts)
+        for ranking in body["rankings"]:
+            scores[ranking["index"]] = ranking["logit"]
+        return scores
+
+    async def _post(self, payload: Dict[str, Any], span: Span) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            async with self._get_session().post(f"{self.base_url}/ranking", json=payload) as response:
+                span.set_attribute("http.status_code", response.status)
+                if response.status == 429:
+                    self.limiter.penalize(retry_after_seconds(response.headers.get("Retry-After")))
+                response.raise_for_status()
+                return await response.json()
+        except Exception:
+            UPSTREAM_ERRORS.labels("rerank").inc()
+            raise
+        finally:
+            observe_upstream("rerank", time.perf_counter() - start)
+
+    async def close(self) -> None:
+        """
+        Close the sessions of every event loop the client was used on.
+
+        Sessions of loops that are still running are closed on their own loop, waiting
+        at most ``timeout`` seconds; those of closed loops only held connections that
+        died with the loop and are dropped.
+        """
+        current = asyncio.get_running_loop()
+        elsewhere = []
+        for loop, session in list(self._sessions.items()):
+            if session.closed:
+                continue
+            if loop is current:
+                await session.close()
+            elif loop.is_running():
+                elsewhere.append(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop)))
+        self._sessions.clear()
+        if elsewhere:
+            await asyncio.wait(elsewhere, timeout=self.timeout)
+
+
+class CrossEncoderReranker:
+    """
+    Local CPU cross-encoder scoring query-passage pairs with ``transformers``.
+
+    The model is loaded on first use, once even when concurrent requests fall back to
+    it together. When transformers or torch are not installed the reranker reports
+    itself unavailable instead of failing.
+
+    Args:
+        model_name (str): A sequence classification model, e.g. ``cross-encoder/ms-marco-MiniLM-L-6-v2``.
+        max_length (int): Maximum tokens per query-passage pair.
+    """
+
+    def __init__(self, model_name: str, max_length: int = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._model = None
+        self._tokenizer = None
+        self._load_lock = threading.Lock()
+        self.available = True
+
+    def _load(self) -> None:
+        with self._load_lock:
+            # Another thread may have loaded the model while this one waited
+            if self._model is not None:
+                return
+            try:
+                from transformers import AutoModelForSequenceClassification, AutoTokenizer
+            except ImportError as e:
+                self.available = False
+                raise RuntimeError(f"Local reranker needs transformers and torch: {e}") from e
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            # Set last: score() only skips loading once the model is there
+            self._model = AutoModelForSequenceClassification.from_pretrained(self.model_name).eval()
+            logging.info(f"Loaded local reranker {self.model_name}.")
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """
+        Score passages against a query on the CPU.
+
+        Args:
+            query (str): The query.
+            texts (List[str]): The passages.
+
+        Returns:
+            List[float]: One relevance score per passage, in input order.
+        """
+        import torch
+
+        if self._model is None:
+            self._load()
+        inputs = self._tokenizer(
+            [query] * len(texts), texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="pt"
+        )
+        with torch.no_grad():
+            logits = self._model(**inputs).logits
+        return logits[:, -1].tolist()
+
+    async def ascore(self, query: str, texts: List[str]) -> List[float]:
+        return await asyncio.to_thread(self.score, query, texts)
+
+
+class BatchedReranker:
+    """
+    Reranking stage with bounded cost regardless of how many candidates come in.
+
+    Candidates are de-duplicated by chunk id and pruned to the first ``max_candidates``,
+    then scored in batches of ``batch_size``, at most ``max_concurrency`` at a time,
+    with a deadline of ``timeout`` seconds for the whole set. If the remote reranker
+    fails or misses the deadline, every candidate is scored by the local fallback
+    instead, so scores always come from one model; the remote is then skipped for
+    ``cooldown`` seconds. Without a fallback the candidates keep their retrieval order.
+
+    Args:
+        client (Any): Remote scorer with an async ``rank(query, texts)``, e.g. RerankClient.
+        fallback (Optional[CrossEncoderReranker]): Local scorer used when the remote fails.
+        top_n (int): Number of documents returned.
+        max_candidates (int): Number of candidates scored.
+        batch_size (int): Candidates per remote request.
+        max_concurrency (int): Remote requests in flight.
+        timeout (float): Seconds allowed for remote scoring.
+        cooldown (float): Seconds the remote is skipped after a failure.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        fallback: Optional[CrossEncoderReranker] = None,
+        top_n: int = RERANK_TOP_N,
+        max_candidates: int = RERANK_MAX_CANDIDATES,
+        batch_size: int = RERANK_BATCH_SIZE,
+        max_concurrency: int = RERANK_CONCURRENCY,
+        timeout: float = RERANK_TIMEOUT,
+        cooldown: float = RERANK_COOLDOWN,
+    ):
+        self.client = client
+        self.fallback = fallback
+        self.top_n = top_n
+        self.max_candidates = max_candidates
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._remote_down_until = 0.0
+
+    async def _remote_scores(self, query: str, texts: List[str]) -> List[float]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def score_batch(batch: List[str]) -> List[float]:
+            async with semaphore:
+                return await self.client.rank(query, batch)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = await asyncio.wait_for(asyncio.gather(*[score_batch(b) for b in batches]), self.timeout)
+        return [score for batch in results for score in batch]
+
+    async def _scores(self, query: str, texts: List[str]) -> Optional[List[float]]:
+        if time.monotonic() >= self._remote_down_until:
+            try:
+                return await self._remote_scores(query, texts)
+            except Exception as e:
+                reason = "timed out" if isinstance(e, asyncio.TimeoutError) else f"failed: {e}"
+                logging.warning(f"Remote reranking {reason}; skipping it for {self.cooldown:.0f}s.")
+                self._remote_down_until = time.monotonic() + self.cooldown
+        if self.fallback is not None and self.fallback.available:
+            try:
+                return await self.fallback.ascore(query, texts)
+            except Exception as e:
+                logging.error(f"Local reranking failed: {e}")
+        return None
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str) -> List[Document]:
+        """
+        Return the top_n candidates by relevance, with the score in ``metadata["relevance_score"]``.
+
+        Args:
+            documents (Sequence[Document]): The retrieved candidates, best first.
+            query (str): The question they are ranked against.
+
+        Returns:
+            List[Document]: Copies of the best documents, most relevant first.
+        """
+        candidates = dedupe_documents(list(documents))[:self.max_candidates]
+        if not candidates or self.top_n < 1:
+            return []
+        scores = await self._scores(query, [doc.page_content for doc in candidates])
+        if scores is None:
+            logging.warning("No reranker available; keeping the retrieval order.")
+            return [Document(page_content=d.page_content, metadata=dict(d.metadata)) for d in candidates[:self.top_n]]
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)[:self.top_n]
+        return [
+            Document(
+                page_content=candidates[i].page_content,
+                metadata={**candidates[i].metadata, "relevance_score": scores[i]},
+            )
+            for i in order
+        ]
@@ -1,27 +1,238 @@
-from typing import List
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
-from langchain_community.vectorstores import FAISS
+from typing import Any, List, Tuple
+import asyncio
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_nvidia_ai_endpoints import NVIDIAEmbeddings
+from bm25 import BM25Index
+from config import (
+    INDEX_DIRECTORY,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    BM25_SEARCH_K,
+    FUSION_LEXICAL_WEIGHT,
+    FUSION_METHOD,
+    FUSION_RRF_K,
+    HYBRID_SEARCH_K,
+    VECTOR_INDEX_TYPE,
+    VECTOR_SEARCH_K,
+)
+from fusion import Ranking, fuse
+from index_store import IndexArtifact, load_index, save_index
+from vector_index import build_vector_index, configure_search, search_index_for
 import logging
 
-def create_hybrid_retriever(doc_splits: List, embeddings: NVIDIAEmbeddings) -> EnsembleRetriever:
+class VectorIndexRetriever(BaseRetriever):
     """
-    Create a hybrid retriever combining BM25 and FAISS retrievers.
+    Dense retriever over a FAISS index whose ids are chunk ids in a ChunkStore.
+    """
+    vector_index: Any
+    chunk_store: Any
+    embeddings: Any
+    k: int = VECTOR_SEARCH_K
+
+    def _ranking(self, vector: List[float]) -> Ranking:
+        distances, ids = self.vector_index.search(np.asarray([vector], dtype=np.float32), self.k)
+        found = ids[0] >= 0
+        # Negated L2 distances, so that higher is better like BM25 scores
+        return ids[0][found], -distances[0][found]
+
+    def search(self, query: str) -> Ranking:
+        return self._ranking(self.embeddings.embed_query(query))
+
+    async def asearch(self, query: str) -> Ranking:
+        vector = await self.embeddings.aembed_query(query)
+        # FAISS releases the GIL, so the search does not hold up the event loop
+        return await asyncio.to_thread(self._ranking, vector)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.chunk_store.documents(self.search(query)[0])
+
+class LexicalIndexRetriever(BaseRetriever):
+    """
+    Retriever over a BM25Index, hydrating only the top-k chunks.
+    """
+    bm25: Any
+    chunk_store: Any
+    k: int = BM25_SEARCH_K
+
+    def search(self, query: str) -> Ranking:
+        return self.bm25.search(query, self.k)
+
+    async def asearch(self, query: str) -> Ranking:
+        return await asyncio.to_thread(self.search, query)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.chunk_store.documents(self.search(query)[0])
+
+class HybridRetriever(BaseRetriever):
+    """
+    Hybrid retriever fusing BM25 and vector search results on chunk ids.
+
+    Both backends are queried at the same time and return chunk ids with scores;
+    only the fused top-k chunks are read from the chunk store. ``method`` is "rrf"
+    (reciprocal rank fusion) or "minmax"/"zscore" (weighted normalized scores).
+    """
+    lexical: LexicalIndexRetriever
+    vector: VectorIndexRetriever
+    chunk_store: Any
+    k: int = HYBRID_SEARCH_K
+    method: str = FUSION_METHOD
+    rrf_k: int = FUSION_RRF_K
+    lexical_weight: float = FUSION_LEXICAL_WEIGHT
+
+    def _top_k(self, rankings: Tuple[Ranking, Ranking]) -> List[Document]:
+        weights = (self.lexical_weight, 1.0 - self.lexical_weight)
+        chunk_ids, _ = fuse(rankings, weights, method=self.method, rrf_k=self.rrf_k)
+        return self.chunk_store.documents(chunk_ids[:self.k])
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._top_k((self.lexical.search(query), self.vector.search(query)))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        rankings = await asyncio.gather(self.lexical.asearch(query), self.vector.asearch(query))
+        return self._top_k(tuple(rankings))
+
+class InMemoryChunkStore:
+    """
+    Chunk store over a list of documents whose positions are their chunk ids.
+    """
+
+    def __init__(self, documents: List[Document]):
+        self._documents = documents
+
+    def documents(self, chunk_ids: List[int]) -> List[Document]:
+        return [self._documents[chunk_id] for chunk_id in chunk_ids]
+
+def dedupe_documents(documents: List[Document]) -> List[Document]:
+    """
+    Drop repeated chunks, keeping the first occurrence of each.
+
+    Chunks are identified by their chunk id, or by their text when they have none.
+
+    Args:
+        documents (List[Document]): Documents retrieved for one or more queries.
+
+    Returns:
+        List[Document]: The documents in their original order without duplicates.
+    """
+    seen = set()
+    unique = []
+    for doc in documents:
+        key = doc.metadata.get("chunk_id", doc.page_content)
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+def create_hybrid_retriever(doc_splits: List, embeddings: NVIDIAEmbeddings) -> HybridRetriever:
+    """
+    Create a hybrid retriever combining BM25 and FAISS retrievers, held in memory.
+
+    The FAISS index has the type set by VECTOR_INDEX_TYPE.
 
     Args:
         doc_splits (List): List of document splits.
         embeddings (NVIDIAEmbeddings): The embeddings model.
 
     Returns:
-        EnsembleRetriever: A hybrid retriever instance.
+        HybridRetriever: A hybrid retriever instance.
     """
     try:
-        bm25_retriever = BM25Retriever.from_documents(doc_splits)
-        faiss_vectorstore = FAISS.from_documents(doc_splits, embeddings)
-        faiss_retriever = faiss_vectorstore.as_retriever(search_kwargs={"k": 2})
+        for chunk_id, doc in enumerate(doc_splits):
+            doc.metadata["chunk_id"] = chunk_id
+        chunk_store = InMemoryChunkStore(doc_splits)
+        bm25_retriever = LexicalIndexRetriever(
+            bm25=BM25Index.build(doc.page_content for doc in doc_splits), chunk_store=chunk_store
+        )
+        vectors = embeddings.embed_documents([doc.page_content for doc in doc_splits])
+        faiss_retriever = VectorIndexRetriever(
+            vector_index=configure_search(build_vector_index(np.asarray(vectors), np.arange(len(doc_splits)))),
+            chunk_store=chunk_store,
+            embeddings=embeddings,
+        )
         logging.info("Hybrid retriever created successfully.")
-        return EnsembleRetriever(retrievers=[bm25_retriever, faiss_retriever], weights=[0.7, 0.3])
+        return HybridRetriever(lexical=bm25_retriever, vector=faiss_retriever, chunk_store=chunk_store)
     except Exception as e:
         logging.error(f"Failed to create hybrid retriever: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def build_index(doc_splits: List, embeddings: NVIDIAEmbeddings, index_dir: str = INDEX_DIRECTORY) -> str:
+    """
+    Embed the document splits once and save them as a versioned on-disk index.
+
+    The exact flat index is always saved; when VECTOR_INDEX_TYPE is not "flat", an
+    approximate index built from it is saved alongside and used for queries.
+
+    Args:
+        doc_splits (List): List of document splits.
+        embeddings (NVIDIAEmbeddings): The embeddings model.
+        index_dir (str): The root index directory.
+
+    Returns:
+        str: The version of the saved index.
+    """
+    try:
+        if not doc_splits:
+            raise ValueError("Cannot build an index without documents")
+        texts = [doc.page_content for doc in doc_splits]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        chunk_ids = np.arange(len(doc_splits), dtype=np.int64)
+        vector_index = build_vector_index(vectors, chunk_ids, "flat")
+        return save_index(
+            index_dir,
+            doc_splits,
+            vector_index,
+            BM25Index.build(texts, chunk_ids),
+            manifest={
+                "embedding_model": getattr(embeddings, "model", None),
+                "chunk_size": CHUNK_SIZE,
+                "chunk_overlap": CHUNK_OVERLAP,
+                "vector_index_type": VECTOR_INDEX_TYPE,
+            },
+            search_index=search_index_for(vector_index),
+        )
+    except Exception as e:
+        logging.error(f"Failed to build index: {e}")
+        raise
+
+def hybrid_retriever_from_artifact(artifact: IndexArtifact, embeddings: NVIDIAEmbeddings) -> HybridRetriever:
+    """
+    Create a hybrid retriever over an already loaded index artifact.
+
+    Args:
+        artifact (IndexArtifact): The loaded index.
+        embeddings (NVIDIAEmbeddings): The embeddings model used for queries.
+
+    Returns:
+        HybridRetriever: A hybrid retriever instance.
+    """
+    bm25_retriever = LexicalIndexRetriever(
+        bm25=artifact.bm25, chunk_store=artifact.chunk_store
+    )
+    faiss_retriever = VectorIndexRetriever(
+        vector_index=artifact.vector_index, chunk_store=artifact.chunk_store, embeddings=embeddings
+    )
+    return HybridRetriever(lexical=bm25_retriever, vector=faiss_retriever, chunk_store=artifact.chunk_store)
+
+def load_hybrid_retriever(embeddings: NVIDIAEmbeddings, index_dir: str = INDEX_DIRECTORY) -> HybridRetriever:
+    """
+    Load the current on-disk index and wrap it in a hybrid retriever.
+
+    Args:
+        embeddings (NVIDIAEmbeddings): The embeddings model used for queries.
+        index_dir (str): The root index directory.
+
+    Returns:
+        HybridRetriever: A hybrid retriever instance.
+    """
+    try:
+        retriever = hybrid_retriever_from_artifact(load_index(index_dir), embeddings)
+        logging.info("Hybrid retriever loaded successfully.")
+        return retriever
+    except Exception as e:
+        logging.error(f"Failed to load hybrid retriever: {e}")
+        raise
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+import httpx
+
+from config import (
+    EMBEDDING_CONCURRENCY,
+    EMBEDDING_RATE_LIMIT,
+    LLM_API_URL,
+    LLM_CONCURRENCY,
+    LLM_RATE_LIMIT,
+    LOCAL_EMBEDDINGS_URL,
+)
+from metrics import UPSTREAM_IN_FLIGHT
+from tracing import SPAN_KIND_CLIENT, begin_span
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at ``rate`` tokens per second up to ``burst``.
+
+    Callers reserve tokens ahead and are told how long to wait for them, so the
+    bucket works from any thread and any event loop.
+
+    Args:
+        rate (float): Tokens added per second; 0 disables the limit.
+        burst (Optional[float]): Bucket size; defaults to one second of tokens.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens, possibly on credit.
+
+        Args:
+            tokens (float): The number of tokens needed.
+
+        Returns:
+            float: Seconds to wait before the tokens are actually available.
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+
+# Every limiter, so a forked child can start with empty slots
+_all_limiters: "weakref.WeakSet[UpstreamLimiter]" = weakref.WeakSet()
+
+
+class UpstreamLimiter:
+    """
+    Per-upstream admission control: a token-bucket rate limit plus a concurrency limit.
+
+    The limits are shared by every caller in the process, including callers on
+    different event loops, such as the embedding client's private loop and the
+    server's loop. A 429 from the upstream pauses all callers for its Retry-After.
+
+    Args:
+        name (str): The upstream name used in logs and metrics.
+        max_concurrency (int): Requests allowed in flight at once.
+        rate (float): Requests per second; 0 disables the rate limit.
+        burst (Optional[float]): Requests allowed at once after an idle period.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate: float = 0.0, burst: Optional[float] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self._in_use = 0
+        self._paused_until = 0.0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, "asyncio.Future"]] = deque()
+        self._lock = threading.Lock()
+        _all_limiters.add(self)
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Hold back new requests for some time, e.g. after the upstream answered 429.
+
+        Args:
+            seconds (float): How long to pause.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        logging.warning(f"Upstream {self.name} is rate limiting; pausing requests for {seconds:.1f}s.")
+
+    async def acquire(self) -> None:
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        wait = self.bucket.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+        await self._acquire_slot()
+        UPSTREAM_IN_FLIGHT.labels(self.name).inc()
+
+    def release(self) -> None:
+        UPSTREAM_IN_FLIGHT.labels(self.name).dec()
+        with self._lock:
+            self._in_use -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one request slot for the duration of the block.
+        """
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def _acquire_slot(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._in_use < self.max_concurrency:
+                    self._in_use += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        self._waiters.remove((loop, waiter))
+                        woken = False
+                    except ValueError:
+                        woken = True
+                if woken:
+                    # Hand the wake-up this caller received to the next one in line
+                    self._wake_next()
+                raise
+
+    def _wake_next(self) -> None:
+        while True:
+            with self._lock:
+                if not self._waiters or self._in_use >= self.max_concurrency:
+                    return
+                loop, waiter = self._waiters.popleft()
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+                return
+            except RuntimeError:
+                # The waiter's loop is closed; try the next one
+                continue
+
+
+def _reset_limiters() -> None:
+    # Requests in flight and waiters belong to the parent's threads, not the child's
+    global _limiters_lock
+    _limiters_lock = threading.Lock()
+    for limiter in list(_all_limiters):
+        limiter._in_use = 0
+        limiter._waiters = deque()
+        limiter._lock = threading.Lock()
+        limiter.bucket._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_limiters)
+
+
+def _resolve(waiter: "asyncio.Future") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_limiters: Dict[str, UpstreamLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(url: str) -> UpstreamLimiter:
+    """
+    Return the process-wide limiter for an upstream base URL.
+
+    LOCAL_EMBEDDINGS_URL (embeddings and reranking) is limited by EMBEDDING_CONCURRENCY
+    and EMBEDDING_RATE_LIMIT, LLM_API_URL by LLM_CONCURRENCY and LLM_RATE_LIMIT; other
+    URLs get the embedding limits.
+
+    Args:
+        url (str): The upstream base URL.
+
+    Returns:
+        UpstreamLimiter: The limiter shared by every client of that upstream.
+    """
+    key = url.rstrip("/")
+    with _limiters_lock:
+        if key not in _limiters:
+            if key == LLM_API_URL.rstrip("/"):
+                _limiters[key] = UpstreamLimiter("llm", LLM_CONCURRENCY, LLM_RATE_LIMIT)
+            else:
+                name = "embedding" if key == LOCAL_EMBEDDINGS_URL.rstrip("/") else key
+                _limiters[key] = UpstreamLimiter(name, EMBEDDING_CONCURRENCY, EMBEDDING_RATE_LIMIT)
+        return _limiters[key]
+
+
+def retry_after_seconds(value: Optional[str], default: float = 1.0) -> float:
+    """
+    Parse a Retry-After header given in seconds.
+
+    Args:
+        value (Optional[str]): The header value.
+        default (float): Used when the header is missing or not a number.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class MicroBatcher:
+    """
+    Coalesce single-item calls made within a short window into one batched call.
+
+    The first item starts a ``window`` second timer; the batch is sent when it
+    fires or when ``max_batch_size`` items are waiting. Identical items in a batch
+    are sent once. Must be used from a single event loop.
+
+    Args:
+        fn (Callable): Async function mapping a list of items to a list of results.
+        max_batch_size (int): Items that trigger an immediate flush.
+        window (float): Seconds to wait for more items.
+    """
+
+    def __init__(self, fn: Callable[[List[Hashable]], Awaitable[List[Any]]], max_batch_size: int, window: float):
+        self.fn = fn
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._pending: List[Tuple[Hashable, "asyncio.Future"]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def submit(self, item: Hashable) -> Any:
+        """
+        Queue an item and wait for its result.
+
+        Args:
+            item (Hashable): The item.
+
+        Returns:
+            Any: The result the batched call returned for the item.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Hashable, "asyncio.Future"]]) -> None:
+        items = list(dict.fromkeys(item for item, _ in batch))
+        try:
+            results = dict(zip(items, await self.fn(items)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for item, future in batch:
+            if not future.done():
+                future.set_result(results[item])
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """
+    Response body that releases its limiter slot once it is closed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class LimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that sends every request through an UpstreamLimiter.
+
+    A request holds its slot until its response body is closed, so streamed LLM
+    responses count against the concurrency limit for as long as they stream. Each
+    request is traced as an ``upstream {name}`` span, from admission until the body
+    is closed, and carries its ``traceparent``.
+
+    Args:
+        limiter (UpstreamLimiter): The upstream's limiter.
+        transport (Optional[httpx.AsyncBaseTransport]): The transport doing the I/O.
+    """
+
+    def __init__(self, limiter: UpstreamLimiter, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        span = begin_span(
+            f"upstream {self.limiter.name}", SPAN_KIND_CLIENT,
+            **{"upstream": self.limiter.name, "http.method": request.method, "http.request_bytes": len(request.content)},
+        )
+        request.headers["traceparent"] = span.traceparent()
+
+        def finish() -> None:
+            self.limiter.release()
+            span.end()
+
+        await self.limiter.acquire()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException as e:
+            span.record_error(e)
+            finish()
+            raise
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code == 429:
+            self.limiter.penalize(retry_after_seconds(response.headers.get("Retry-After")))
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, finish),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
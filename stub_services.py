@@ -0,0 +1,388 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from aiohttp import web
+
+# A latency sampler returns one delay in seconds per call
+LatencySampler = Callable[[], float]
+
+
+def parse_latency(spec: str, seed: Optional[int] = None) -> LatencySampler:
+    """
+    Build a latency sampler from a short spec.
+
+    Supported specs are ``constant:S``, ``uniform:LOW,HIGH``, ``exponential:MEAN`` and
+    ``lognormal:MEDIAN,SIGMA``, all in seconds. A bare number means constant.
+
+    Args:
+        spec (str): The distribution.
+        seed (Optional[int]): Seed for reproducible samples.
+
+    Returns:
+        LatencySampler: A function returning one delay per call.
+    """
+    rng = random.Random(seed)
+    kind, _, args = spec.partition(":") if ":" in spec else ("constant", "", spec)
+    try:
+        params = [float(value) for value in args.split(",")]
+        if kind == "constant":
+            return lambda: params[0]
+        if kind == "uniform":
+            return lambda: rng.uniform(params[0], params[1])
+        if kind == "exponential":
+            return lambda: rng.expovariate(1.0 / params[0])
+        if kind == "lognormal":
+            return lambda: params[0] * rng.lognormvariate(0.0, params[1])
+    except (ValueError, IndexError) as e:
+        raise ValueError(f"Invalid latency spec {spec!r}: {e}") from e
+    raise ValueError(f"Unknown latency distribution {kind!r} in {spec!r}")
+
+
+def stub_vector(text: str, dimension: int) -> List[float]:
+    """
+    Deterministic unit vector for a text, so equal texts always embed the same.
+
+    Args:
+        text (str): The text.
+        dimension (int): The vector size.
+
+    Returns:
+        List[float]: The vector.
+    """
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubService:
+    """
+    Local stand-in for an upstream service, served by aiohttp from a background thread.
+
+    Subclasses return their (method, path, handler) triples from ``routes``. Use as a
+    context manager, or call ``start`` (on a free port unless one is given) and ``stop``;
+    ``url`` is the ``/v1`` base URL.
+
+    Args:
+        latency (str): Latency spec for every response, see ``parse_latency``.
+        seed (Optional[int]): Seed for the latency samples.
+    """
+
+    def __init__(self, latency: str = "constant:0", seed: Optional[int] = None):
+        self.sample_latency = parse_latency(latency, seed)
+        self.requests = 0
+        self.url: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def routes(self) -> List[Tuple[str, str, Any]]:
+        return []
+
+    async def delay(self) -> None:
+        self.requests += 1
+        await asyncio.sleep(max(0.0, self.sample_latency()))
+
+    def start(self, port: int = 0) -> "StubService":
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve() -> None:
+            app = web.Application(client_max_size=64 * 1024 ** 2)
+            for method, path, handler in self.routes():
+                app.router.add_route(method, path, handler)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", port)
+            await site.start()
+            self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/v1"
+            started.set()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def __enter__(self) -> "StubService":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class StubNIMService(StubService):
+    """
+    Stand-in for the NIM host behind LOCAL_EMBEDDINGS_URL: ``/embeddings`` and ``/ranking``.
+
+    Embeddings come from ``stub_vector``; passages are ranked by the query words they contain.
+
+    Args:
+        dimension (int): Embedding size; must match the index being served.
+        latency (str): Latency spec for embedding requests.
+        rerank_latency (str): Latency spec for ranking requests.
+        seed (Optional[int]): Seed for the latency samples.
+    """
+
+    def __init__(self, dimension: int, latency: str = "constant:0", rerank_latency: str = "constant:0", seed: Optional[int] = None):
+        super().__init__(latency, seed)
+        self.dimension = dimension
+        self.sample_rerank_latency = parse_latency(rerank_latency, None if seed is None else seed + 1)
+
+    def routes(self) -> List[Tuple[str, str, Any]]:
+        return [("POST", "/v1/embeddings", self.embeddings), ("POST", "/v1/ranking", self.ranking)]
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        await self.delay()
+        return web.json_response({
+            "object": "list",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": stub_vector(text, self.dimension)}
+                for i, text in enumerate(payload["input"])
+            ],
+            "model": payload["model"],
+        })
+
+    async def ranking(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.requests += 1
+        await asyncio.sleep(max(0.0, self.sample_rerank_latency()))
+        words = set(payload["query"]["text"].lower().split())
+        scores = [float(len(words.intersection(p["text"].lower().split()))) for p in payload["passages"]]
+        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return web.json_response({"rankings": [{"index": i, "logit": scores[i]} for i in order]})
+
+
+class StubLLMService(StubService):
+    """
+    Stand-in for the OpenAI-compatible ``/chat/completions`` endpoint behind LLM_API_URL.
+
+    Tool calls and JSON-schema responses, as used for structured output, are answered
+    with ``sub_questions`` variants of the user's message; other requests get an answer
+    of ``answer_tokens`` words. Streaming requests are answered as server-sent events
+    spread over the sampled latency.
+
+    Args:
+        latency (str): Latency spec for a whole completion.
+        sub_questions (int): Sub-questions returned for a decomposition request.
+        answer_tokens (int): Words in a generated answer.
+        seed (Optional[int]): Seed for the latency samples.
+    """
+
+    def __init__(self, latency: str = "constant:0", sub_questions: int = 2, answer_tokens: int = 60, seed: Optional[int] = None):
+        super().__init__(latency, seed)
+        self.sub_questions = sub_questions
+        self.answer_tokens = answer_tokens
+
+    def routes(self) -> List[Tuple[str, str, Any]]:
+        return [("POST", "/v1/chat/completions", self.completions)]
+
+    def _structured(self, question: str, schema: Dict[str, Any]) -> str:
+        arguments = {}
+        for name, field in schema.get("properties", {}).items():
+            if field.get("type") == "array":
+                arguments[name] = [f"{question.rstrip('?')} (aspect {i + 1})?" for i in range(self.sub_questions)]
+            else:
+                arguments[name] = question
+        return json.dumps(arguments)
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        user_messages = [m["content"] for m in payload["messages"] if m["role"] == "user" and isinstance(m["content"], str)]
+        question = user_messages[-1] if user_messages else ""
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in payload["messages"])
+        message: Dict[str, Any] = {"role": "assistant", "content": None}
+        if payload.get("tools"):
+            function = payload["tools"][0]["function"]
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": function["name"], "arguments": self._structured(question, function["parameters"])},
+            }]
+        elif (payload.get("response_format") or {}).get("type") == "json_schema":
+            message["content"] = self._structured(question, payload["response_format"]["json_schema"]["schema"])
+        else:
+            message["content"] = " ".join(["stub"] * self.answer_tokens)
+        completion_tokens = len((message["content"] or "").split()) or self.sub_questions * 8
+        finish_reason = "tool_calls" if "tool_calls" in message else "stop"
+        latency = max(0.0, self.sample_latency())
+        self.requests += 1
+        response_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+        if not payload.get("stream"):
+            await asyncio.sleep(latency)
+            return web.json_response({
+                "id": response_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        pieces = (message["content"] or "").split(" ") if message["content"] else []
+        deltas = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": (" " if i else "") + piece} for i, piece in enumerate(pieces)]
+        if "tool_calls" in message:
+            deltas.append({"tool_calls": [{"index": 0, **message["tool_calls"][0]}]})
+        for delta in deltas:
+            await asyncio.sleep(latency / len(deltas))
+            chunk = {
+                "id": response_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        final = {
+            "id": response_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        await response.write_eof()
+        return response
+
+
+def flatten_span(span: Dict[str, Any], service: str) -> Dict[str, Any]:
+    """
+    Turn one OTLP/JSON span into a flat record.
+
+    Args:
+        span (Dict[str, Any]): The span as sent by an OTLP exporter.
+        service (str): The ``service.name`` of its resource.
+
+    Returns:
+        Dict[str, Any]: The trace and span ids, name, duration and attributes.
+    """
+    attributes = {}
+    for attribute in span.get("attributes", []):
+        value = attribute["value"]
+        if "intValue" in value:
+            attributes[attribute["key"]] = int(value["intValue"])
+        else:
+            attributes[attribute["key"]] = next(iter(value.values()), None)
+    return {
+        "service": service,
+        "trace_id": span["traceId"],
+        "span_id": span["spanId"],
+        "parent_id": span.get("parentSpanId") or None,
+        "name": span["name"],
+        "start_ns": int(span["startTimeUnixNano"]),
+        "duration_ms": (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6,
+        "status": span.get("status", {}).get("code", 0),
+        "attributes": attributes,
+    }
+
+
+def span_latencies(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Count and p50/p99 duration of the spans of each name.
+
+    Args:
+        spans (List[Dict[str, Any]]): Spans from ``flatten_span``.
+
+    Returns:
+        Dict[str, Dict[str, float]]: Per span name, "count", "p50_ms" and "p99_ms".
+    """
+    durations: Dict[str, List[float]] = {}
+    for span in spans:
+        durations.setdefault(span["name"], []).append(span["duration_ms"])
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p99_ms": round(float(np.percentile(values, 99)), 3),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+
+class StubCollector(StubService):
+    """
+    Stand-in for an OpenTelemetry collector's OTLP/HTTP receiver: ``POST /v1/traces`` in JSON.
+
+    Received spans are kept in ``spans`` as ``flatten_span`` records and, when ``output``
+    is given, appended to that JSONL file. Point OTEL_EXPORTER_OTLP_ENDPOINT at
+    ``endpoint``.
+
+    Args:
+        output (Optional[str]): JSONL file to append spans to.
+    """
+
+    def __init__(self, output: Optional[str] = None):
+        super().__init__()
+        self.output = output
+        self.spans: List[Dict[str, Any]] = []
+
+    @property
+    def endpoint(self) -> str:
+        return self.url[: -len("/v1")]
+
+    def routes(self) -> List[Tuple[str, str, Any]]:
+        return [("POST", "/v1/traces", self.traces)]
+
+    async def traces(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        received = []
+        for resource_spans in payload.get("resourceSpans", []):
+            service = next(
+                (a["value"].get("stringValue") for a in resource_spans.get("resource", {}).get("attributes", []) if a["key"] == "service.name"),
+                "unknown",
+            )
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                received += [flatten_span(span, service) for span in scope_spans.get("spans", [])]
+        self.requests += 1
+        self.spans += received
+        if self.output:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(span) + "\n" for span in received)
+        return web.json_response({})
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        return sorted((span for span in self.spans if span["trace_id"] == trace_id), key=lambda span: span["start_ns"])
+
+    def slowest(self, count: int = 10) -> List[Dict[str, Any]]:
+        roots = [span for span in self.spans if span["parent_id"] is None]
+        return sorted(roots, key=lambda span: span["duration_ms"], reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in service.")
+    parser.add_argument("service", choices=["collector"])
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default="spans.jsonl", help="JSONL file the collector appends spans to")
+    args = parser.parse_args()
+    collector = StubCollector(args.output).start(args.port)
+    print(f"Collecting spans at {collector.endpoint} into {args.output}; Ctrl-C prints a summary.")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    collector.stop()
+    print(json.dumps({"spans": span_latencies(collector.spans), "slowest_traces": [
+        {"trace_id": span["trace_id"], "name": span["name"], "duration_ms": span["duration_ms"]} for span in collector.slowest()
+    ]}, indent=2))
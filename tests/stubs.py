@@ -0,0 +1,168 @@
+# tests/stubs.py
+import asyncio
+import threading
+from aiohttp import web
+
+def stub_embedding(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 97), 1.0]
+
+class StubServer:
+    """
+    Base for local stand-ins of upstream services, served from a background thread.
+
+    Subclasses list their POST handlers in ``routes`` and GET handlers in
+    ``get_routes``, as (path, handler) pairs.
+    """
+
+    def routes(self):
+        return []
+
+    def get_routes(self):
+        return []
+
+    def __enter__(self):
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def start():
+            app = web.Application()
+            for path, handler in self.routes():
+                app.router.add_post(path, handler)
+            for path, handler in self.get_routes():
+                app.router.add_get(path, handler)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.url = f"http://127.0.0.1:{port}/v1"
+            started.set()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(start())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+class StubEmbeddingServer(StubServer):
+    """
+    Local stand-in for the NIM embeddings endpoint.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        max_batch_size (int): Larger batches are answered with 413.
+        rate_limited_requests (int): Number of initial requests answered with 429.
+    """
+
+    def __init__(self, latency=0.0, max_batch_size=None, rate_limited_requests=0):
+        self.latency = latency
+        self.max_batch_size = max_batch_size
+        self.rate_limited_requests = rate_limited_requests
+        self.batch_sizes = []
+        self.url = None
+
+    async def embeddings(self, request):
+        payload = await request.json()
+        if self.rate_limited_requests > 0:
+            self.rate_limited_requests -= 1
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        if self.max_batch_size and len(payload["input"]) > self.max_batch_size:
+            return web.Response(status=413)
+        self.batch_sizes.append(len(payload["input"]))
+        await asyncio.sleep(self.latency)
+        return web.json_response({
+            "data": [{"index": i, "embedding": stub_embedding(text)} for i, text in enumerate(payload["input"])],
+            "model": payload["model"],
+        })
+
+    def routes(self):
+        return [("/v1/embeddings", self.embeddings)]
+
+def stub_relevance(query, text):
+    return float(sum(word in text.lower().split() for word in query.lower().split()))
+
+class StubRerankServer(StubServer):
+    """
+    Local stand-in for the NIM ranking endpoint, scoring passages by query words they contain.
+
+    Args:
+        latency (float): Seconds to wait before answering each request.
+        status (int): Status returned instead of rankings, e.g. 503 to simulate an outage.
+    """
+
+    def __init__(self, latency=0.0, status=200):
+        self.latency = latency
+        self.status = status
+        self.batch_sizes = []
+        self.url = None
+
+    async def ranking(self, request):
+        payload = await request.json()
+        await asyncio.sleep(self.latency)
+        if self.status != 200:
+            return web.Response(status=self.status)
+        passages = [p["text"] for p in payload["passages"]]
+        self.batch_sizes.append(len(passages))
+        scores = [stub_relevance(payload["query"]["text"], text) for text in passages]
+        order = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+        return web.json_response({"rankings": [{"index": i, "logit": scores[i]} for i in order]})
+
+    def routes(self):
+        return [("/v1/ranking", self.ranking)]
+
+class StubFileServer(StubServer):
+    """
+    Local stand-in for a static file host with ETag and Range support.
+
+    Args:
+        files (dict): File contents by name, served at ``/v1/files/<name>``.
+        drop_after (int): If set, the first full response is cut off after this many bytes.
+        failures (list): Statuses returned, in order, to the first requests instead of the file.
+    """
+
+    def __init__(self, files, drop_after=None, failures=()):
+        self.files = files
+        self.drop_after = drop_after
+        self.failures = list(failures)
+        self.requests = []
+        self.url = None
+
+    def get_routes(self):
+        return [("/v1/files/{name}", self.serve)]
+
+    async def serve(self, request):
+        self.requests.append(dict(request.headers))
+        if self.failures:
+            return web.Response(status=self.failures.pop(0))
+        data = self.files.get(request.match_info["name"])
+        if data is None:
+            return web.Response(status=404)
+        etag = f'"{hash(data) & 0xffffffff:x}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        start = 0
+        if "Range" in request.headers and request.headers.get("If-Range") == etag:
+            start = int(request.headers["Range"].split("=")[1].rstrip("-"))
+            if start >= len(data):
+                return web.Response(status=416)
+        body = data[start:]
+        response = web.StreamResponse(status=206 if start else 200, headers={"ETag": etag})
+        response.content_length = len(body)
+        await response.prepare(request)
+        if self.drop_after is not None and not start:
+            await response.write(body[:self.drop_after])
+            self.drop_after = None
+            request.transport.close()
+            return response
+        await response.write(body)
+        await response.write_eof()
+        return response
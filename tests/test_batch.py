@@ -0,0 +1,88 @@
+# tests/test_batch.py
+import json
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from batch import BatchRunner, SharedRetriever, run_jsonl
+from planner import QueryPlanner
+from workflow import SubQuery, setup_langgraph_workflow
+
+class CountingRetriever:
+    def __init__(self):
+        self.queries = []
+
+    async def ainvoke(self, query):
+        self.queries.append(query)
+        return [Document(page_content=f"about {query}", metadata={"chunk_id": len(self.queries), "source": "a.pdf"})]
+
+class FakeReranker:
+    async def acompress_documents(self, query, documents):
+        return documents
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+
+    async def aembed_queries(self, texts):
+        self.batches.append(list(texts))
+        return [[0.0] for _ in texts]
+
+def build_runner(retriever, embeddings):
+    planner = QueryPlanner(RunnableLambda(
+        lambda inputs: SubQuery(questions=[f"What is {part}?" for part in inputs["question"].rstrip("?").split(" and ")])
+    ))
+    def build_workflow(shared_retriever):
+        return setup_langgraph_workflow(
+            llm=None,
+            sub_question_generator=planner.sub_question_generator,
+            hybrid_retriever=shared_retriever,
+            rag_chain=RunnableLambda(lambda inputs: f"answer to {inputs['question']}"),
+            reranker=FakeReranker(),
+            query_planner=planner,
+        )
+    return BatchRunner(build_workflow, retriever, embeddings, planner, concurrency=4, window=2)
+
+@pytest.mark.asyncio
+async def test_batch_shares_sub_questions_and_embeds_them_in_batches():
+    retriever, embeddings = CountingRetriever(), FakeEmbeddings()
+    records = [
+        {"id": 1, "question": "TURBT and URS?"},
+        {"id": 2, "question": "URS and GIRFT?"},
+        {"id": 3, "question": "What is TURBT?"},
+    ]
+    results = [result async for result in build_runner(retriever, embeddings).run(records)]
+    assert sorted(result["id"] for result in results) == [1, 2, 3]
+    assert all("error" not in result for result in results)
+    assert sorted(retriever.queries) == ["What is GIRFT?", "What is TURBT?", "What is URS?"]
+    assert embeddings.batches == [["What is TURBT?", "What is URS?", "What is GIRFT?"], ["What is TURBT?"]]
+
+class FlakyRetriever(CountingRetriever):
+    async def ainvoke(self, query):
+        if not self.queries:
+            self.queries.append(query)
+            raise ConnectionError("retriever unavailable")
+        return await super().ainvoke(query)
+
+@pytest.mark.asyncio
+async def test_shared_retriever_retries_a_failed_query():
+    retriever = FlakyRetriever()
+    shared = SharedRetriever(retriever)
+    with pytest.raises(ConnectionError):
+        await shared.ainvoke("What is TURBT?")
+    assert (await shared.ainvoke("what is TURBT?"))[0].page_content == "about what is TURBT?"
+    await shared.ainvoke("What is TURBT?")
+    assert shared.calls == 2
+
+@pytest.mark.asyncio
+async def test_run_jsonl_resumes_from_the_results_file(tmp_path):
+    questions, output = tmp_path / "questions.jsonl", tmp_path / "results.jsonl"
+    questions.write_text("".join(json.dumps({"id": i, "question": f"What is trial {i}?"}) + "\n" for i in [0, 1, 2, 3, 3]))
+    output.write_text(json.dumps({"id": "0", "answer": "done"}) + "\n" + json.dumps({"id": "1", "error": "failed"}) + "\n" + '{"id": "2", "ans')
+    retriever = CountingRetriever()
+
+    counts = await run_jsonl(build_runner(retriever, FakeEmbeddings()), str(questions), str(output))
+    assert counts == {"answered": 3, "failed": 0, "skipped": 2}
+    assert sorted(retriever.queries) == ["What is trial 1?", "What is trial 2?", "What is trial 3?"]
+    lines = output.read_text().splitlines()
+    assert lines[0] == json.dumps({"id": "0", "answer": "done"})
+    assert sorted(json.loads(line)["id"] for line in lines) == ["0", "1", "2", "3"]
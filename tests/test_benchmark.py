@@ -0,0 +1,78 @@
+# tests/test_benchmark.py
+import asyncio
+import statistics
+import pytest
+from benchmark import bucket_quantile, compare_to_baseline, parse_args, run_load, run_micro, stage_latencies
+from stub_services import parse_latency
+
+BEFORE = """# HELP rag_node_duration_seconds Time spent in each LangGraph node.
+# TYPE rag_node_duration_seconds histogram
+rag_node_duration_seconds_bucket{le="0.1",node="retrieve"} 5.0
+rag_node_duration_seconds_bucket{le="0.5",node="retrieve"} 5.0
+rag_node_duration_seconds_bucket{le="+Inf",node="retrieve"} 5.0
+rag_node_duration_seconds_count{node="retrieve"} 5.0
+rag_node_duration_seconds_sum{node="retrieve"} 0.2
+"""
+
+AFTER = """# HELP rag_node_duration_seconds Time spent in each LangGraph node.
+# TYPE rag_node_duration_seconds histogram
+rag_node_duration_seconds_bucket{le="0.1",node="retrieve"} 55.0
+rag_node_duration_seconds_bucket{le="0.5",node="retrieve"} 105.0
+rag_node_duration_seconds_bucket{le="+Inf",node="retrieve"} 105.0
+rag_node_duration_seconds_count{node="retrieve"} 105.0
+rag_node_duration_seconds_sum{node="retrieve"} 15.2
+rag_node_duration_seconds_bucket{le="0.1",node="generate"} 0.0
+rag_node_duration_seconds_bucket{le="0.5",node="generate"} 0.0
+rag_node_duration_seconds_bucket{le="+Inf",node="generate"} 0.0
+rag_node_duration_seconds_count{node="generate"} 0.0
+rag_node_duration_seconds_sum{node="generate"} 0.0
+"""
+
+def test_latency_specs():
+    assert parse_latency("0.25")() == 0.25
+    assert 0.01 <= parse_latency("uniform:0.01,0.02", seed=1)() <= 0.02
+    sample = parse_latency("lognormal:0.1,0.5", seed=1)
+    samples = [sample() for _ in range(2000)]
+    assert statistics.median(samples) == pytest.approx(0.1, rel=0.1)
+    with pytest.raises(ValueError):
+        parse_latency("pareto:1")
+
+def test_bucket_quantile_interpolates_like_promql():
+    buckets = {0.1: 50.0, 0.5: 100.0, float("inf"): 100.0}
+    assert bucket_quantile(buckets, 0.5) == pytest.approx(0.1)
+    assert bucket_quantile(buckets, 0.75) == pytest.approx(0.3)
+    assert bucket_quantile({0.1: 0.0, float("inf"): 10.0}, 0.99) == 0.1
+
+def test_stage_latencies_only_count_the_measured_interval():
+    stages = stage_latencies(BEFORE, AFTER)
+    assert list(stages) == ["node:retrieve"]
+    assert stages["node:retrieve"]["count"] == 100
+    assert stages["node:retrieve"]["p50_ms"] == pytest.approx(100.0)
+    assert stages["node:retrieve"]["p99_ms"] == pytest.approx(492.0)
+
+def test_compare_to_baseline_flags_only_real_regressions():
+    baseline = {"load": {"throughput_rps": 50.0, "latency": {"p95_ms": 400.0, "p50_ms": 0.5}, "memory": {"total_pss_mb": 800.0}}}
+    report = {"load": {"throughput_rps": 35.0, "latency": {"p95_ms": 450.0, "p50_ms": 1.2}, "memory": {"total_pss_mb": 1200.0}}}
+    assert compare_to_baseline(report, baseline, tolerance=0.2) == [
+        "load/throughput_rps: 50 -> 35",
+        "load/memory/total_pss_mb: 800 -> 1200",
+    ]
+
+def test_micro_benchmarks_report_every_component():
+    report = run_micro(parse_args(["micro", "--chunks", "500", "--dimension", "32", "--queries", "40"]))
+    assert {"chunking", "bm25", "faiss_flat"} <= set(report["micro"])
+    assert report["micro"]["faiss_flat"]["recall_at_k"] == 1.0
+
+def test_load_replays_workload_against_stubbed_server():
+    args = parse_args([
+        "load", "--server", "uvicorn", "--chunks", "200", "--dimension", "32", "--requests", "12",
+        "--warmup", "2", "--concurrency", "4", "--embedding-latency", "constant:0.005",
+        "--rerank-latency", "constant:0.005", "--llm-latency", "constant:0.02",
+    ])
+    load = asyncio.run(run_load(args))["load"]
+    assert load["failures"] == 0
+    assert load["throughput_rps"] > 0
+    assert load["stages"]["node:generate"]["count"] == 12
+    # One generation per request, plus a decomposition only for uncached multi-hop questions
+    assert 12 < load["stages"]["upstream:llm"]["count"] < 24
+    assert load["memory"]["total_pss_mb"] > 0
@@ -0,0 +1,61 @@
+# tests/test_bm25.py
+import logging
+import math
+import time
+import numpy as np
+import pytest
+from bm25 import BM25Index, tokenize
+
+TEXTS = [
+    "Transurethral resection of bladder tumour",
+    "Ureteroscopy outcomes in the GIRFT programme",
+    "Cardiology trial protocol for bladder patients",
+    "GIRFT GIRFT review of ureteroscopy",
+]
+
+def reference_scores(texts, query, k1=1.5, b=0.75):
+    docs = [tokenize(text) for text in texts]
+    avgdl = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        score = 0.0
+        for term in tokenize(query):
+            df = sum(term in d for d in docs)
+            tf = doc.count(term)
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / avgdl))
+        scores.append(score)
+    return scores
+
+@pytest.mark.parametrize("query", ["GIRFT ureteroscopy", "bladder", "bladder bladder tumour", "unknown words"])
+def test_scores_match_okapi_bm25(query):
+    index = BM25Index.build(TEXTS)
+    np.testing.assert_allclose(index.scores(query), reference_scores(TEXTS, query), rtol=1e-5, atol=1e-6)
+
+def test_search_returns_chunk_ids_best_first():
+    index = BM25Index.build(TEXTS, doc_ids=[10, 11, 12, 13])
+    chunk_ids, scores = index.search("GIRFT review", k=3)
+    assert chunk_ids.tolist() == [13, 11]
+    assert scores[0] > scores[1] > 0
+    assert index.search("nothing matches", k=3)[0].tolist() == []
+
+def test_save_and_load_memory_mapped(tmp_path):
+    index = BM25Index.build(TEXTS, doc_ids=[5, 6, 7, 8])
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert isinstance(loaded.postings, np.memmap)
+    np.testing.assert_array_equal(loaded.scores("bladder GIRFT"), index.scores("bladder GIRFT"))
+    assert loaded.search("bladder", k=1)[0].tolist() == [5]
+
+def test_search_latency_on_large_corpus():
+    rng = np.random.default_rng(0)
+    vocabulary = [f"term{i}" for i in range(20000)]
+    words = rng.zipf(1.3, size=(200000, 30)) % len(vocabulary)
+    index = BM25Index.build(" ".join(vocabulary[w] for w in row) for row in words)
+    queries = [" ".join(vocabulary[w] for w in rng.integers(0, 200, size=4)) for _ in range(50)]
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, k=4)
+    elapsed = (time.perf_counter() - start) / len(queries)
+    logging.info(f"BM25 search over {len(index)} chunks took {elapsed * 1000:.2f} ms per query.")
+    assert elapsed < 0.05
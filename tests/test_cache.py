@@ -0,0 +1,93 @@
+# tests/test_cache.py
+import pytest
+from langchain_core.embeddings import Embeddings
+from cache import CachedEmbeddings, EmbeddingCache, LRUCache, SemanticAnswerCache, normalize_text
+
+class CountingEmbeddings(Embeddings):
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.queries = []
+
+    def embed_documents(self, texts):
+        return [[float(len(t))] for t in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [float(len(text)), 1.0]
+
+@pytest.fixture
+def cache(tmp_path):
+    return EmbeddingCache(directory=str(tmp_path), max_size=2, ttl=None)
+
+def test_normalize_text():
+    assert normalize_text("  What is  TURBT?\n") == "what is turbt?"
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = LRUCache(max_size=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+def test_lru_cache_expires_entries(monkeypatch):
+    lru = LRUCache(max_size=2, ttl=10)
+    monkeypatch.setattr("cache.time.monotonic", lambda: 100.0)
+    lru.set("a", 1)
+    monkeypatch.setattr("cache.time.monotonic", lambda: 111.0)
+    assert lru.get("a") is None
+
+def test_cached_embeddings_skip_repeated_queries(cache):
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, cache)
+    first = cached.embed_query("What is TURBT?")
+    assert cached.embed_query("what is  turbt?") == first
+    assert embeddings.queries == ["What is TURBT?"]
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_disk_cache_is_shared_between_workers(tmp_path):
+    first_worker = CachedEmbeddings(CountingEmbeddings(), EmbeddingCache(directory=str(tmp_path)))
+    vector = first_worker.embed_query("What is URS?")
+    second_embeddings = CountingEmbeddings()
+    second_worker = CachedEmbeddings(second_embeddings, EmbeddingCache(directory=str(tmp_path)))
+    assert second_worker.embed_query("What is URS?") == pytest.approx(vector)
+    assert second_embeddings.queries == []
+    assert second_worker.cache.disk_hits == 1
+
+def test_cache_keys_include_model(cache):
+    cache.set("model-a", "question?", [1.0])
+    assert cache.get("model-b", "question?") is None
+
+def test_semantic_answer_cache_hits_similar_questions():
+    answers = SemanticAnswerCache(max_size=10, threshold=0.95, ttl=None)
+    answers.set([1.0, 0.0], "v1", {"answer": "A"})
+    assert answers.get([0.99, 0.05], "v1") == {"answer": "A"}
+    assert answers.get([0.0, 1.0], "v1") is None
+    assert answers.stats()["hits"] == 1 and answers.stats()["misses"] == 1
+
+def test_semantic_answer_cache_invalidated_by_new_index_version():
+    answers = SemanticAnswerCache(max_size=10, threshold=0.95, ttl=None)
+    answers.set([1.0, 0.0], "v1", {"answer": "A"})
+    assert answers.get([1.0, 0.0], "v2") is None
+    assert answers.stats()["entries"] == 0
+
+def test_semantic_answer_cache_ignores_answers_from_stale_index_version():
+    answers = SemanticAnswerCache(max_size=10, threshold=0.95, ttl=None)
+    answers.set([1.0, 0.0], "v1", {"answer": "A"})
+    assert answers.get([0.0, 1.0], "v2") is None
+    answers.set([1.0, 0.0], "v1", {"answer": "stale"})
+    assert answers.get([1.0, 0.0], "v2") is None
+    answers.set([1.0, 0.0], "v2", {"answer": "B"})
+    assert answers.get([1.0, 0.0], "v2") == {"answer": "B"}
+
+def test_semantic_answer_cache_evicts_least_recently_used():
+    answers = SemanticAnswerCache(max_size=2, threshold=0.99, ttl=None)
+    answers.set([1.0, 0.0, 0.0], "v1", "A")
+    answers.set([0.0, 1.0, 0.0], "v1", "B")
+    answers.get([1.0, 0.0, 0.0], "v1")
+    answers.set([0.0, 0.0, 1.0], "v1", "C")
+    assert answers.get([0.0, 1.0, 0.0], "v1") is None
+    assert answers.get([1.0, 0.0, 0.0], "v1") == "A"
+    assert answers.get([0.0, 0.0, 1.0], "v1") == "C"
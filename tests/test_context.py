@@ -0,0 +1,44 @@
+# tests/test_context.py
+import sys
+import types
+from langchain_core.documents import Document
+import context
+from context import ContextPacker, TokenCounter, merge_passages
+
+TEXT = " ".join(f"Sentence {i} describes the cystoscopy follow-up schedule." for i in range(80))
+
+def chunk(start, end, chunk_id, source="docs/a.pdf"):
+    return Document(page_content=TEXT[start:end], metadata={"chunk_id": chunk_id, "source": source})
+
+def test_overlapping_chunks_are_merged_without_repeating_the_overlap():
+    documents = [chunk(400, 900, 2), chunk(0, 500, 1), chunk(0, 500, 7, source="docs/b.pdf"), chunk(2000, 2300, 9)]
+    passages = merge_passages(documents)
+    assert [p["chunk_ids"] for p in passages] == [[1, 2], [9]]
+    assert passages[0]["text"] == TEXT[0:900]
+    assert passages[0]["rank"] == 0
+
+def test_packing_respects_the_token_budget_best_first():
+    counter = TokenCounter(encoding="")
+    documents = [chunk(1500, 2000, 5), chunk(0, 500, 1, source="docs/b.pdf"), chunk(3000, 3100, 8, source="docs/c.pdf")]
+    context = ContextPacker(token_budget=1000, counter=counter).pack(documents)
+    assert context.startswith("[1] a.pdf\n" + TEXT[1500:2000])
+    assert "[3] c.pdf" in context
+
+    small = ContextPacker(token_budget=150, counter=counter).pack(documents)
+    assert counter.count(small) <= 150
+    assert small.startswith("[1] a.pdf\n") and "b.pdf" not in small
+
+def test_packers_share_one_counter_loaded_once(monkeypatch):
+    loads = []
+
+    def get_encoding(name):
+        loads.append(name)
+        raise OSError("no network")
+
+    monkeypatch.setitem(sys.modules, "tiktoken", types.SimpleNamespace(get_encoding=get_encoding))
+    monkeypatch.setattr(context, "_default_counter", None)
+    first, second = ContextPacker(), ContextPacker()
+    assert first.counter is second.counter
+    assert len(loads) == 1
+    # Without the encoding, tokens are estimated from the text
+    assert first.counter.count("Cystoscopy follow-up, every three months.") == 15
@@ -0,0 +1,58 @@
+# tests/test_downloader.py
+import aiohttp
+import pytest
+from downloader import Downloader, filenames_for, read_manifest
+from tests.stubs import StubFileServer
+
+PROTOCOL = bytes(range(256)) * 1024
+
+@pytest.mark.asyncio
+async def test_streams_files_and_revalidates_with_etag(tmp_path):
+    with StubFileServer({"a.pdf": PROTOCOL, "b.pdf": b"short"}) as server:
+        urls = [f"{server.url}/files/a.pdf", f"{server.url}/files/b.pdf", f"{server.url}/files/missing.pdf"]
+        async with Downloader(str(tmp_path), chunk_size=4096, refresh_interval=0, max_retries=0) as downloader:
+            first = await downloader.download_all(urls)
+            second = await downloader.download_all(urls[:2])
+        async with Downloader(str(tmp_path)) as downloader:
+            third = await downloader.download_all(urls[:2])
+    assert list(first.values()) == ["downloaded", "downloaded", "failed"]
+    assert list(second.values()) == ["not_modified", "not_modified"]
+    assert list(third.values()) == ["fresh", "fresh"]
+    assert (tmp_path / "a.pdf").read_bytes() == PROTOCOL
+    assert "If-None-Match" in server.requests[3]
+    assert len(server.requests) == 5
+
+@pytest.mark.asyncio
+async def test_resumes_interrupted_download_with_range(tmp_path):
+    with StubFileServer({"a.pdf": PROTOCOL}, drop_after=100_000) as server:
+        async with Downloader(str(tmp_path), max_retries=1) as downloader:
+            status = await downloader.fetch(f"{server.url}/files/a.pdf")
+    assert status == "resumed"
+    assert (tmp_path / "a.pdf").read_bytes() == PROTOCOL
+    assert server.requests[1]["Range"].startswith("bytes=")
+    assert int(server.requests[1]["Range"][6:-1]) > 0
+
+@pytest.mark.asyncio
+async def test_retries_server_errors_but_not_client_errors(tmp_path):
+    with StubFileServer({"a.pdf": PROTOCOL}, failures=[503, 429]) as server:
+        async with Downloader(str(tmp_path), max_retries=3) as downloader:
+            assert await downloader.fetch(f"{server.url}/files/a.pdf") == "downloaded"
+            assert len(server.requests) == 3
+            with pytest.raises(aiohttp.ClientResponseError) as error:
+                await downloader.fetch(f"{server.url}/files/missing.pdf")
+    assert error.value.status == 404
+    assert len(server.requests) == 4
+
+def test_read_manifest_and_filenames(tmp_path):
+    manifest = tmp_path / "download.csv"
+    manifest.write_text(
+        "title,url\n"
+        "Trial A,https://host/NCT1/Prot_000.pdf\n"
+        "Trial B,https://host/NCT2/Prot_000.pdf\n"
+        "Trial A again,https://host/NCT1/Prot_000.pdf\n"
+    )
+    urls = read_manifest(str(manifest))
+    assert urls == ["https://host/NCT1/Prot_000.pdf", "https://host/NCT2/Prot_000.pdf"]
+    names = filenames_for(urls)
+    assert names[urls[0]] == "Prot_000.pdf"
+    assert names[urls[1]].endswith("_Prot_000.pdf") and names[urls[1]] != names[urls[0]]
@@ -0,0 +1,98 @@
+# tests/test_embedding_client.py
+import logging
+import os
+import signal
+import threading
+import time
+import pytest
+from langchain_core.documents import Document
+from cache import CachedEmbeddings, EmbeddingCache
+from embedding_client import BatchedEmbeddings
+from retrievers import build_index
+from tests.stubs import StubEmbeddingServer, stub_embedding
+
+@pytest.fixture
+def texts():
+    return [f"chunk number {i} of the protocol" for i in range(200)]
+
+def test_embed_documents_keeps_order(texts):
+    with StubEmbeddingServer(latency=0.01) as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", batch_size=16, max_concurrency=4)
+        try:
+            assert client.embed_documents(texts) == [stub_embedding(t) for t in texts]
+            assert client.embed_query("hello") == stub_embedding("hello")
+        finally:
+            client.close()
+    assert client.stats.chunks == len(texts) + 1
+    assert client.stats.throughput > 0
+
+@pytest.mark.asyncio
+async def test_closing_cached_embeddings_stops_the_client(tmp_path):
+    with StubEmbeddingServer() as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub")
+        embeddings = CachedEmbeddings(client, EmbeddingCache(directory=str(tmp_path)))
+        assert await embeddings.aembed_query("hello") == stub_embedding("hello")
+        session = client._session
+        embeddings.close()
+    assert session.closed
+    time.sleep(0.1)
+    assert not any(thread.name == "embedding-client" for thread in threading.enumerate())
+
+@pytest.mark.asyncio
+async def test_client_used_before_fork_works_in_child():
+    with StubEmbeddingServer() as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub")
+        try:
+            assert client.embed_query("parent") == stub_embedding("parent")
+            pid = os.fork()
+            if pid == 0:
+                # The parent's loop thread is gone; the child must start its own
+                signal.alarm(10)
+                os._exit(0 if client.embed_query("child") == stub_embedding("child") else 1)
+            _, status = os.waitpid(pid, 0)
+        finally:
+            client.close()
+    assert os.waitstatus_to_exitcode(status) == 0
+
+@pytest.mark.asyncio
+async def test_aembed_documents_splits_on_413(texts):
+    with StubEmbeddingServer(max_batch_size=8) as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", batch_size=32, max_concurrency=2)
+        try:
+            assert await client.aembed_documents(texts) == [stub_embedding(t) for t in texts]
+        finally:
+            client.close()
+    assert client.batch_size <= 8
+    assert max(server.batch_sizes) <= 8
+
+def test_retries_after_429(texts):
+    with StubEmbeddingServer(rate_limited_requests=2) as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", batch_size=64, max_concurrency=1)
+        try:
+            assert client.embed_documents(texts[:10]) == [stub_embedding(t) for t in texts[:10]]
+        finally:
+            client.close()
+    assert client.stats.retries == 2
+    assert client.batch_size < 64
+
+def test_batch_size_grows_under_target_latency(texts):
+    with StubEmbeddingServer() as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", batch_size=4, max_concurrency=1)
+        try:
+            client.embed_documents(texts)
+        finally:
+            client.close()
+    assert client.batch_size > 4
+
+def test_index_build_time_against_stub_server(tmp_path):
+    docs = [Document(page_content=f"protocol section {i} " * 10, metadata={"source": "a.pdf"}) for i in range(2000)]
+    with StubEmbeddingServer(latency=0.02) as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", batch_size=32, max_concurrency=8)
+        try:
+            start = time.perf_counter()
+            build_index(docs, client, str(tmp_path))
+            elapsed = time.perf_counter() - start
+        finally:
+            client.close()
+    logging.info(f"Built index of {len(docs)} chunks in {elapsed:.2f}s: {client.stats.as_dict()}")
+    assert client.stats.chunks == len(docs)
@@ -0,0 +1,61 @@
+# tests/test_fusion.py
+import asyncio
+import time
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from fusion import fuse, normalize_scores
+from retrievers import HybridRetriever, LexicalIndexRetriever, VectorIndexRetriever
+
+LEXICAL = (np.array([3, 1, 2]), np.array([9.0, 5.0, 1.0]))
+VECTOR = (np.array([1, 4]), np.array([-0.1, -0.4]))
+
+def test_rrf_rewards_chunks_found_by_both_backends():
+    chunk_ids, scores = fuse([LEXICAL, VECTOR], [0.5, 0.5], method="rrf", rrf_k=60)
+    assert chunk_ids.tolist() == [1, 3, 4, 2]
+    assert scores[0] == pytest.approx(0.5 / 62 + 0.5 / 61)
+
+def test_minmax_fusion_follows_weights():
+    assert fuse([LEXICAL, VECTOR], [0.9, 0.1], method="minmax")[0].tolist()[0] == 3
+    assert fuse([LEXICAL, VECTOR], [0.1, 0.9], method="minmax")[0].tolist()[0] == 1
+
+def test_normalize_scores():
+    np.testing.assert_allclose(normalize_scores(np.array([1.0, 3.0, 5.0]), "minmax"), [0.0, 0.5, 1.0])
+    np.testing.assert_allclose(normalize_scores(np.array([1.0, 3.0, 5.0]), "zscore").mean(), 0.0, atol=1e-12)
+    np.testing.assert_allclose(normalize_scores(np.array([2.0, 2.0]), "minmax"), [1.0, 1.0])
+    with pytest.raises(ValueError):
+        fuse([LEXICAL], [1.0], method="borda")
+
+class CountingChunkStore:
+    def __init__(self):
+        self.hydrated = []
+
+    def documents(self, chunk_ids):
+        self.hydrated.extend(int(i) for i in chunk_ids)
+        return [Document(page_content=f"chunk {i}", metadata={"chunk_id": int(i)}) for i in chunk_ids]
+
+class SlowLexical(LexicalIndexRetriever):
+    async def asearch(self, query):
+        await asyncio.sleep(0.2)
+        return LEXICAL
+
+class SlowVector(VectorIndexRetriever):
+    async def asearch(self, query):
+        await asyncio.sleep(0.2)
+        return VECTOR
+
+@pytest.mark.asyncio
+async def test_hybrid_retriever_queries_backends_concurrently_and_hydrates_top_k():
+    store = CountingChunkStore()
+    retriever = HybridRetriever(
+        lexical=SlowLexical(bm25=None, chunk_store=store),
+        vector=SlowVector(vector_index=None, chunk_store=store, embeddings=None),
+        chunk_store=store,
+        k=2,
+        lexical_weight=0.5,
+    )
+    start = time.perf_counter()
+    documents = await retriever.ainvoke("GIRFT")
+    assert time.perf_counter() - start < 0.35
+    assert [doc.metadata["chunk_id"] for doc in documents] == [1, 3]
+    assert store.hydrated == [1, 3]
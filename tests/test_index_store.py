@@ -0,0 +1,74 @@
+# tests/test_index_store.py
+import os
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from bm25 import BM25Index
+from index_store import VECTORS_FILE, current_version, load_index, save_index
+from retrievers import build_index, load_hybrid_retriever
+
+class FakeEmbeddings:
+    model = "fake-embedding"
+
+    def _embed(self, text):
+        return [float(text.count(c)) for c in "aeiou"]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+@pytest.fixture
+def doc_splits():
+    return [
+        Document(page_content="Transurethral resection of bladder tumour", metadata={"source": "a.pdf"}),
+        Document(page_content="Ureteroscopy outcomes in the GIRFT programme", metadata={"source": "b.pdf"}),
+        Document(page_content="Cardiology trial protocol", metadata={"source": "c.pdf"}),
+    ]
+
+def test_build_and_load_index(tmp_path, doc_splits):
+    version = build_index(doc_splits, FakeEmbeddings(), str(tmp_path))
+    assert current_version(str(tmp_path)) == version
+
+    artifact = load_index(str(tmp_path))
+    assert artifact.manifest["num_chunks"] == 3
+    assert artifact.manifest["embedding_model"] == "fake-embedding"
+    assert artifact.chunk_store.document(1).page_content == doc_splits[1].page_content
+    assert artifact.chunk_store.document(1).metadata == {"source": "b.pdf", "chunk_id": 1}
+
+def test_load_hybrid_retriever(tmp_path, doc_splits):
+    build_index(doc_splits, FakeEmbeddings(), str(tmp_path))
+    retriever = load_hybrid_retriever(FakeEmbeddings(), str(tmp_path))
+    bm25_retriever, faiss_retriever = retriever.lexical, retriever.vector
+    assert bm25_retriever.invoke("GIRFT programme")[0].page_content == doc_splits[1].page_content
+    assert len(faiss_retriever.invoke("GIRFT programme")) == 2
+    assert doc_splits[1].page_content in [doc.page_content for doc in retriever.invoke("GIRFT programme")]
+
+def test_load_index_without_build(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_index(str(tmp_path))
+
+def _anonymous_memory_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1])
+    return None
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc")
+def test_vectors_are_file_backed(tmp_path):
+    vectors = np.random.default_rng(0).random((100_000, 128), dtype=np.float32)
+    vector_index = faiss.IndexIDMap2(faiss.IndexFlatL2(128))
+    vector_index.add_with_ids(vectors, np.arange(len(vectors)))
+    documents = [Document(page_content="chunk", metadata={"chunk_id": 0})]
+    save_index(str(tmp_path), documents, vector_index, BM25Index.build(["chunk"]), {"embedding_model": "fake"})
+    del vectors, vector_index
+
+    before = _anonymous_memory_kb()
+    artifact = load_index(str(tmp_path))
+    artifact.vector_index.search(np.zeros((1, 128), dtype=np.float32), 5)
+    # Searching a flat index touches every vector; none of them may be copied onto the heap
+    size_kb = os.path.getsize(os.path.join(artifact.path, VECTORS_FILE)) // 1024
+    assert _anonymous_memory_kb() - before < size_kb // 4
@@ -0,0 +1,120 @@
+# tests/test_ingest.py
+import asyncio
+import os
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import ingest
+from index_store import load_index
+
+class CountingEmbeddings(Embeddings):
+    model = "fake-embedding"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(t)), float(t.count("e"))] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def fake_iter_file_chunks(paths):
+    # One chunk per line keeps the test independent of PDF parsing
+    for path in paths:
+        yield path, [Document(page_content=line, metadata={"source": path}) for line in open(path).read().splitlines()]
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "iter_file_chunks", fake_iter_file_chunks)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "a.pdf").write_text("alpha one\nalpha two\n")
+    (docs / "b.pdf").write_text("beta one\n")
+    return docs, str(tmp_path / "index")
+
+@pytest.mark.asyncio
+async def test_ingest_only_embeds_changes(corpus):
+    docs, index_dir = corpus
+    embeddings = CountingEmbeddings()
+    await ingest.ingest_directory(str(docs), embeddings, index_dir)
+    assert len(embeddings.embedded) == 3
+
+    embeddings = CountingEmbeddings()
+    (docs / "a.pdf").write_text("alpha one\nalpha three\n")
+    (docs / "b.pdf").unlink()
+    (docs / "c.pdf").write_text("gamma one\n")
+    await ingest.ingest_directory(str(docs), embeddings, index_dir)
+    assert sorted(embeddings.embedded) == ["alpha three", "gamma one"]
+
+    artifact = load_index(index_dir)
+    assert sorted(artifact.tombstones.tolist()) == [1, 2]
+    assert artifact.vector_index.ntotal == 3
+    live = sorted(artifact.chunk_store.text(i) for i in artifact.bm25.doc_ids)
+    assert live == ["alpha one", "alpha three", "gamma one"]
+
+@pytest.mark.asyncio
+async def test_ingest_unchanged_corpus_keeps_version(corpus):
+    docs, index_dir = corpus
+    version = await ingest.ingest_directory(str(docs), CountingEmbeddings(), index_dir)
+    embeddings = CountingEmbeddings()
+    assert await ingest.ingest_directory(str(docs), embeddings, index_dir) == version
+    assert embeddings.embedded == []
+
+@pytest.mark.asyncio
+async def test_ingest_reuses_and_tombstones_repeated_chunks(corpus):
+    docs, index_dir = corpus
+    (docs / "a.pdf").write_text("repeated\nrepeated\nalpha one\n")
+    await ingest.ingest_directory(str(docs), CountingEmbeddings(), index_dir)
+
+    embeddings = CountingEmbeddings()
+    (docs / "a.pdf").write_text("repeated\nalpha two\nrepeated\n")
+    await ingest.ingest_directory(str(docs), embeddings, index_dir)
+    assert embeddings.embedded == ["alpha two"]
+    assert load_index(index_dir).manifest["files"]["a.pdf"]["chunk_ids"] == [0, 4, 1]
+
+    (docs / "a.pdf").write_text("alpha two\nrepeated\n")
+    await ingest.ingest_directory(str(docs), CountingEmbeddings(), index_dir)
+    artifact = load_index(index_dir)
+    assert sorted(artifact.tombstones.tolist()) == [1, 2]
+    assert artifact.vector_index.ntotal == 3
+    live = sorted(artifact.chunk_store.text(i) for i in artifact.bm25.doc_ids)
+    assert live == ["alpha two", "beta one", "repeated"]
+
+class SlowEmbeddings(CountingEmbeddings):
+    def __init__(self, fail_after=None):
+        super().__init__()
+        self.active = self.max_active = 0
+        self.fail_after = fail_after
+
+    async def aembed_documents(self, texts):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            if self.fail_after is not None and len(self.embedded) >= self.fail_after:
+                raise RuntimeError("embedding service down")
+            return self.embed_documents(texts)
+        finally:
+            self.active -= 1
+
+@pytest.mark.asyncio
+async def test_ingest_bounds_embedding_batches_in_flight(corpus, monkeypatch):
+    docs, index_dir = corpus
+    monkeypatch.setattr(ingest, "EMBEDDING_BATCH_SIZE", 1)
+    monkeypatch.setattr(ingest, "EMBEDDING_CONCURRENCY", 2)
+    (docs / "c.pdf").write_text("\n".join(f"gamma {i}" for i in range(20)))
+    embeddings = SlowEmbeddings()
+    await ingest.ingest_directory(str(docs), embeddings, index_dir)
+    assert embeddings.max_active == 2
+    artifact = load_index(index_dir)
+    assert sorted(artifact.chunk_store.text(i) for i in range(len(artifact.chunk_store))) == sorted(embeddings.embedded)
+
+@pytest.mark.asyncio
+async def test_ingest_failure_leaves_no_partial_version(corpus, monkeypatch):
+    docs, index_dir = corpus
+    monkeypatch.setattr(ingest, "EMBEDDING_BATCH_SIZE", 1)
+    with pytest.raises(RuntimeError):
+        await ingest.ingest_directory(str(docs), SlowEmbeddings(fail_after=1), index_dir)
+    assert os.listdir(index_dir) == []
@@ -0,0 +1,22 @@
+# tests/test_main.py
+import logging
+import pytest
+import main
+
+@pytest.mark.asyncio
+async def test_single_question_logs_the_answer(monkeypatch, caplog):
+    async def run_workflow(app, inputs):
+        return {"question": inputs["question"], "sub_questions": ["What is TURBT?"], "generation": "TURBT is a resection."}
+
+    monkeypatch.setattr(main, "initialize_models", lambda: (None, None, None))
+    monkeypatch.setattr(main, "current_version", lambda index_dir: "v1")
+    monkeypatch.setattr(main, "load_hybrid_retriever", lambda embeddings, index_dir: None)
+    monkeypatch.setattr(main, "initialize_decomposition_llm", lambda llm: None)
+    monkeypatch.setattr(main, "create_sub_question_generator", lambda llm: None)
+    monkeypatch.setattr(main, "create_rag_chain", lambda llm: None)
+    monkeypatch.setattr(main, "setup_langgraph_workflow", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "run_workflow", run_workflow)
+    with caplog.at_level(logging.INFO):
+        await main.main(main.parse_args(["--question", "What is TURBT?"]))
+    assert "What is TURBT?" in caplog.text
+    assert "Answer: TURBT is a resection." in caplog.text
@@ -0,0 +1,74 @@
+# tests/test_metrics.py
+import os
+import subprocess
+import sys
+import uuid
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from prometheus_client import REGISTRY
+from cache import SemanticAnswerCache
+from metrics import LLMMetricsCallback, render_metrics
+from tests.test_pipeline import build_graph
+from workflow import run_workflow
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+@pytest.mark.asyncio
+async def test_workflow_records_node_latency():
+    before = {node: sample("rag_node_duration_seconds_count", node=node) for node in ("decompose", "generate")}
+    await run_workflow(build_graph(["What is TURBT?"]), {"question": "TURBT?"})
+    for node, count in before.items():
+        assert sample("rag_node_duration_seconds_count", node=node) == count + 1
+
+def test_llm_callback_records_latency_and_tokens():
+    before_calls = sample("rag_upstream_request_duration_seconds_count", upstream="llm")
+    before_tokens = sample("rag_llm_tokens_total", kind="completion")
+    callback = LLMMetricsCallback()
+    run_id = uuid.uuid4()
+    callback.on_chat_model_start({}, [], run_id=run_id)
+    callback.on_llm_end(
+        LLMResult(generations=[[ChatGeneration(message=AIMessage(content="ok"))]],
+                  llm_output={"token_usage": {"prompt_tokens": 12, "completion_tokens": 5}}),
+        run_id=run_id,
+    )
+    assert sample("rag_upstream_request_duration_seconds_count", upstream="llm") == before_calls + 1
+    assert sample("rag_llm_tokens_total", kind="completion") == before_tokens + 5
+
+def test_answer_cache_counts_hits_and_misses():
+    before_hits = sample("rag_cache_lookups_total", cache="answer", result="hit")
+    before_misses = sample("rag_cache_lookups_total", cache="answer", result="miss")
+    cache = SemanticAnswerCache(max_size=4)
+    cache.get([1.0, 0.0], "v1")
+    cache.set([1.0, 0.0], "v1", {"answer": "a"})
+    cache.get([1.0, 0.0], "v1")
+    assert sample("rag_cache_lookups_total", cache="answer", result="hit") == before_hits + 1
+    assert sample("rag_cache_lookups_total", cache="answer", result="miss") == before_misses + 1
+    payload, _ = render_metrics()
+    assert b"rag_cache_lookups_total" in payload
+
+def test_metrics_aggregate_across_processes(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    worker = "from metrics import NODE_LATENCY; NODE_LATENCY.labels('retrieve').observe(0.2)"
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", worker], cwd=REPO_ROOT, env=env, check=True)
+    scrape = "import sys; from metrics import render_metrics; sys.stdout.write(render_metrics()[0].decode())"
+    output = subprocess.run(
+        [sys.executable, "-c", scrape], cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    assert 'rag_node_duration_seconds_count{node="retrieve"} 2.0' in output
+
+def test_index_chunks_reports_latest_index_across_processes(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    # The preloading master sets the size of the index it loaded, then a worker reloads a smaller one
+    for chunks in (100, 80):
+        worker = f"from metrics import INDEX_CHUNKS; INDEX_CHUNKS.set({chunks})"
+        subprocess.run([sys.executable, "-c", worker], cwd=REPO_ROOT, env=env, check=True)
+    scrape = "import sys; from metrics import render_metrics; sys.stdout.write(render_metrics()[0].decode())"
+    output = subprocess.run(
+        [sys.executable, "-c", scrape], cwd=REPO_ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    assert "rag_index_chunks 80.0" in output
@@ -0,0 +1,54 @@
+# tests/test_pipeline.py
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from workflow import SubQuery, create_rag_chain, run_workflow, setup_langgraph_workflow, stream_workflow
+
+class FakeRetriever:
+    async def ainvoke(self, query):
+        return [Document(page_content=f"about {query}", metadata={"chunk_id": len(query)})]
+
+class FakeReranker:
+    async def acompress_documents(self, query, documents):
+        return documents[:1]
+
+def build_graph(sub_questions):
+    return setup_langgraph_workflow(
+        llm=None,
+        sub_question_generator=RunnableLambda(lambda inputs: SubQuery(questions=sub_questions)),
+        hybrid_retriever=FakeRetriever(),
+        rag_chain=RunnableLambda(lambda inputs: f"{len(inputs['context'].split(chr(10) * 2))} passage(s) for {inputs['question']}"),
+        reranker=FakeReranker(),
+    )
+
+@pytest.mark.asyncio
+async def test_workflow_runs_async_end_to_end():
+    result = await run_workflow(build_graph(["What is TURBT?", "What is URS?"]), {"question": "TURBT and URS?"})
+    assert result["sub_questions"] == ["What is TURBT?", "What is URS?"]
+    assert result["generation"] == "1 passage(s) for TURBT and URS?"
+
+@pytest.mark.asyncio
+async def test_workflow_stops_without_sub_questions():
+    result = await run_workflow(build_graph([]), {"question": "TURBT and URS?"})
+    assert result["sub_questions"] == []
+    assert "generation" not in result
+
+@pytest.mark.asyncio
+async def test_stream_workflow_yields_progress_then_tokens():
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="TURBT and URS are procedures")]))
+    graph = setup_langgraph_workflow(
+        llm=llm,
+        sub_question_generator=RunnableLambda(lambda inputs: SubQuery(questions=["What is TURBT?"])),
+        hybrid_retriever=FakeRetriever(),
+        rag_chain=create_rag_chain(llm),
+        reranker=FakeReranker(),
+    )
+    events = [event async for event in stream_workflow(graph, {"question": "TURBT and URS?"})]
+    names = [name for name, _ in events]
+    assert names[:2] == ["sub_questions", "sources"]
+    assert names[-1] == "done"
+    assert "".join(data for name, data in events if name == "token") == "TURBT and URS are procedures"
+    assert events[1][1] == [{"chunk_id": 14, "source": None}]
+    assert events[-1][1]["generation"] == "TURBT and URS are procedures"
@@ -0,0 +1,37 @@
+# tests/test_planner.py
+import pytest
+from langchain_core.runnables import RunnableLambda
+from planner import QueryPlanner, is_single_hop
+from workflow import SubQuery
+
+def test_single_hop_heuristic():
+    assert is_single_hop("What is the recommended follow-up after TURBT?")
+    assert not is_single_hop("How does GIRFT relate to TURBT and URS?")
+    assert not is_single_hop("Compare TURBT with URS outcomes?")
+    assert not is_single_hop("What is TURBT? What is URS?")
+    assert not is_single_hop(" ".join(["word"] * 30) + "?")
+
+@pytest.mark.asyncio
+async def test_planner_skips_simple_questions_and_caches_decompositions():
+    calls = []
+    def decompose(inputs):
+        calls.append(inputs["question"])
+        return SubQuery(questions=["What is TURBT?", "What is URS?"])
+    planner = QueryPlanner(RunnableLambda(decompose))
+
+    assert await planner.plan("What is the recommended follow-up after TURBT?") == ["What is the recommended follow-up after TURBT?"]
+    assert await planner.plan("How does TURBT compare to URS?") == ["What is TURBT?", "What is URS?"]
+    assert await planner.plan("  how does TURBT compare to   URS?") == ["What is TURBT?", "What is URS?"]
+    assert calls == ["How does TURBT compare to URS?"]
+
+    always = QueryPlanner(RunnableLambda(decompose), mode="always")
+    await always.plan("What is the recommended follow-up after TURBT?")
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_failed_decomposition_is_not_cached():
+    def fail(inputs):
+        raise RuntimeError("upstream unavailable")
+    planner = QueryPlanner(RunnableLambda(fail))
+    assert await planner.plan("How does TURBT compare to URS?") == []
+    assert len(planner.cache) == 0
@@ -0,0 +1,112 @@
+# tests/test_reranking.py
+import asyncio
+import sys
+import threading
+import time
+import types
+import pytest
+from langchain_core.documents import Document
+from reranking import BatchedReranker, CrossEncoderReranker, RerankClient
+from tests.stubs import StubRerankServer, stub_relevance
+
+QUERY = "bladder tumour resection"
+
+def candidates(n):
+    words = ["bladder", "tumour", "resection", "cardiology", "trial"]
+    return [
+        Document(page_content=" ".join(words[j] for j in range(5) if (i >> j) & 1) or "empty", metadata={"chunk_id": i})
+        for i in range(n)
+    ]
+
+class FixedScorer:
+    available = True
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ascore(self, query, texts):
+        self.calls += 1
+        return [float(len(text)) for text in texts]
+
+@pytest.mark.asyncio
+async def test_dedupes_prunes_and_batches():
+    docs = candidates(32)
+    with StubRerankServer(latency=0.1) as server:
+        reranker = BatchedReranker(
+            RerankClient(server.url, "stub"), top_n=3, max_candidates=24, batch_size=4, max_concurrency=6
+        )
+        start = time.perf_counter()
+        ranked = await reranker.acompress_documents(docs + docs[:8], QUERY)
+        elapsed = time.perf_counter() - start
+        await reranker.client.close()
+    assert sum(server.batch_sizes) == 24
+    assert max(server.batch_sizes) == 4
+    assert elapsed < 0.1 * 3
+    assert ranked[0].metadata["chunk_id"] == 7
+    assert [d.metadata["relevance_score"] for d in ranked] == sorted(
+        (stub_relevance(QUERY, d.page_content) for d in docs[:24]), reverse=True
+    )[:3]
+    assert "relevance_score" not in docs[7].metadata
+
+@pytest.mark.asyncio
+async def test_falls_back_to_local_scorer_when_remote_is_down():
+    fallback = FixedScorer()
+    with StubRerankServer(status=503) as server:
+        reranker = BatchedReranker(RerankClient(server.url, "stub"), fallback=fallback, top_n=2)
+        ranked = await reranker.acompress_documents(candidates(8), QUERY)
+        again = await reranker.acompress_documents(candidates(8), QUERY)
+        await reranker.client.close()
+    assert [d.metadata["chunk_id"] for d in ranked] == [7, 5]
+    assert again == ranked
+    assert fallback.calls == 2
+
+@pytest.mark.asyncio
+async def test_slow_remote_keeps_retrieval_order_without_fallback():
+    with StubRerankServer(latency=1.0) as server:
+        reranker = BatchedReranker(RerankClient(server.url, "stub"), top_n=2, timeout=0.2)
+        start = time.perf_counter()
+        ranked = await reranker.acompress_documents(candidates(8), QUERY)
+        elapsed = time.perf_counter() - start
+        await reranker.client.close()
+    assert elapsed < 0.5
+    assert [d.metadata["chunk_id"] for d in ranked] == [0, 1]
+
+@pytest.mark.asyncio
+async def test_close_closes_sessions_of_every_loop():
+    other = asyncio.new_event_loop()
+    thread = threading.Thread(target=other.run_forever, daemon=True)
+    thread.start()
+    try:
+        with StubRerankServer() as server:
+            client = RerankClient(server.url, "stub")
+            asyncio.run_coroutine_threadsafe(client.rank(QUERY, ["other loop"]), other).result(5)
+            await client.rank(QUERY, ["test loop"])
+            sessions = list(client._sessions.values())
+            await client.close()
+        assert len(sessions) == 2
+        assert all(session.closed for session in sessions)
+    finally:
+        other.call_soon_threadsafe(other.stop)
+        thread.join()
+        other.close()
+
+def test_cross_encoder_loads_the_model_once(monkeypatch):
+    loads = []
+
+    class SlowModel:
+        @staticmethod
+        def from_pretrained(name):
+            loads.append(name)
+            time.sleep(0.05)
+            return types.SimpleNamespace(eval=lambda: "model")
+
+    transformers = types.SimpleNamespace(AutoModelForSequenceClassification=SlowModel, AutoTokenizer=SlowModel)
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    reranker = CrossEncoderReranker("cross-encoder/stub")
+    threads = [threading.Thread(target=reranker._load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One tokenizer and one model
+    assert len(loads) == 2
@@ -0,0 +1,41 @@
+# tests/test_retrieval.py
+import asyncio
+import time
+import pytest
+from langchain_core.documents import Document
+import workflow
+from retrievers import dedupe_documents
+from workflow import retrieve_documents
+
+class SlowRetriever:
+    def __init__(self, delay, results):
+        self.delay = delay
+        self.results = results
+
+    async def ainvoke(self, query):
+        await asyncio.sleep(self.delay.get(query, 0.2))
+        return self.results[query]
+
+def chunk(chunk_id, text):
+    return Document(page_content=text, metadata={"chunk_id": chunk_id})
+
+def test_dedupe_documents_by_chunk_id():
+    docs = [chunk(1, "a"), chunk(2, "b"), chunk(1, "a"), Document(page_content="c"), Document(page_content="c")]
+    assert [doc.page_content for doc in dedupe_documents(docs)] == ["a", "b", "c"]
+
+@pytest.mark.asyncio
+async def test_retrieve_documents_fans_out_concurrently():
+    results = {f"q{i}": [chunk(i, f"doc {i}"), chunk(100, "shared")] for i in range(6)}
+    retriever = SlowRetriever({}, results)
+    start = time.perf_counter()
+    documents = await retrieve_documents(retriever, list(results))
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.2 * 3
+    assert [doc.metadata["chunk_id"] for doc in documents] == [0, 1, 2, 3, 4, 5, 100]
+
+@pytest.mark.asyncio
+async def test_retrieve_documents_drops_timed_out_calls(monkeypatch):
+    monkeypatch.setattr(workflow, "RETRIEVAL_TIMEOUT", 0.3)
+    retriever = SlowRetriever({"slow": 1.0, "fast": 0.0}, {"slow": [chunk(1, "slow")], "fast": [chunk(2, "fast")]})
+    documents = await retrieve_documents(retriever, ["slow", "fast"])
+    assert [doc.page_content for doc in documents] == ["fast"]
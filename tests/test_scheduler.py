@@ -0,0 +1,91 @@
+# tests/test_scheduler.py
+import asyncio
+import threading
+import time
+import httpx
+import pytest
+from embedding_client import BatchedEmbeddings
+from scheduler import LimitedAsyncTransport, MicroBatcher, UpstreamLimiter
+from tests.stubs import StubEmbeddingServer, stub_embedding
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_are_coalesced_into_one_request():
+    questions = [f"question {i}" for i in range(20)] + ["question 0"]
+    with StubEmbeddingServer(latency=0.05) as server:
+        client = BatchedEmbeddings(base_url=server.url, model="stub", coalesce_window=0.02)
+        try:
+            vectors = await asyncio.gather(*[client.aembed_query(q) for q in questions])
+        finally:
+            client.close()
+    assert vectors == [stub_embedding(q) for q in questions]
+    assert server.batch_sizes == [20]
+
+@pytest.mark.asyncio
+async def test_micro_batcher_flushes_full_batches_and_propagates_errors():
+    calls = []
+
+    async def double(items):
+        calls.append(list(items))
+        if "bad" in items:
+            raise ValueError("bad item")
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=3, window=10.0)
+    assert await asyncio.gather(*[batcher.submit(s) for s in "abc"]) == ["aa", "bb", "cc"]
+    assert calls == [["a", "b", "c"]]
+    batcher.window = 0.01
+    with pytest.raises(ValueError):
+        await batcher.submit("bad")
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_out_requests():
+    limiter = UpstreamLimiter("test", max_concurrency=10, rate=20.0, burst=1)
+    start = time.perf_counter()
+    for _ in range(6):
+        async with limiter.slot():
+            pass
+    assert 0.2 < time.perf_counter() - start < 0.5
+
+def test_concurrency_limit_is_shared_across_event_loops():
+    limiter = UpstreamLimiter("test", max_concurrency=2)
+    in_flight, peak = 0, 0
+    lock = threading.Lock()
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter.slot():
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            with lock:
+                in_flight -= 1
+
+    async def burst():
+        await asyncio.gather(*[call() for _ in range(6)])
+
+    threads = [threading.Thread(target=asyncio.run, args=(burst(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_limited_transport_pauses_after_429_and_releases_slots():
+    sent = []
+
+    def handler(request):
+        sent.append(time.perf_counter())
+        if len(sent) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0.3"})
+        return httpx.Response(200, json={"ok": True})
+
+    limiter = UpstreamLimiter("llm", max_concurrency=1)
+    transport = LimitedAsyncTransport(limiter, transport=httpx.MockTransport(handler))
+    async with httpx.AsyncClient(transport=transport) as client:
+        assert (await client.get("http://llm/v1/models")).status_code == 429
+        responses = await asyncio.gather(*[client.get("http://llm/v1/models") for _ in range(3)])
+    assert [r.json() for r in responses] == [{"ok": True}] * 3
+    assert sent[1] - sent[0] >= 0.3
+    assert limiter._in_use == 0
@@ -0,0 +1,76 @@
+# tests/test_tracing.py
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+from stub_services import StubCollector, span_latencies
+from tracing import OTLPExporter, TracingMiddleware, set_exporter, start_span
+from workflow import SubQuery, run_workflow, setup_langgraph_workflow
+
+class FakeRetriever:
+    async def ainvoke(self, query):
+        return [Document(page_content=f"about {query}", metadata={"chunk_id": len(query), "source": "a.pdf"})]
+
+class FakeReranker:
+    async def acompress_documents(self, query, documents):
+        return documents
+
+@pytest.fixture
+def collector():
+    with StubCollector() as collector:
+        exporter = OTLPExporter(collector.endpoint, interval=60)
+        previous = set_exporter(exporter)
+        yield collector, exporter
+        set_exporter(previous)
+
+def test_workflow_nodes_are_spans_with_sizes(collector):
+    collector, exporter = collector
+    graph = setup_langgraph_workflow(
+        llm=None,
+        sub_question_generator=RunnableLambda(lambda inputs: SubQuery(questions=["What is TURBT?", "What is URS?"])),
+        hybrid_retriever=FakeRetriever(),
+        rag_chain=RunnableLambda(lambda inputs: "an answer"),
+        reranker=FakeReranker(),
+    )
+
+    async def traced():
+        with start_span("request") as root:
+            await run_workflow(graph, {"question": "How does TURBT compare to URS?"})
+        return root
+
+    root = asyncio.run(traced())
+    exporter.flush()
+    spans = {span["name"]: span for span in collector.trace(root.trace_id)}
+    assert {"request", "node decompose", "node retrieve", "node rerank", "node generate", "retrieve sub-question"} <= set(spans)
+    assert spans["node decompose"]["parent_id"] == root.span_id
+    assert spans["node decompose"]["attributes"]["rag.plan_route"] == "decomposed"
+    assert spans["node retrieve"]["attributes"]["rag.documents"] == 2
+    assert spans["retrieve sub-question"]["parent_id"] == spans["node retrieve"]["span_id"]
+    assert spans["node generate"]["attributes"]["rag.context_passages"] == 2
+    assert span_latencies(list(spans.values()))["node generate"]["count"] == 1
+
+def test_middleware_returns_trace_id_and_writes_profile(collector, tmp_path):
+    collector, exporter = collector
+    app = FastAPI()
+    app.add_middleware(TracingMiddleware, endpoints=["/ask"], profile_enabled=True, profile_directory=str(tmp_path))
+
+    @app.post("/ask")
+    async def ask():
+        await asyncio.sleep(0.05)
+        return {"answer": "ok"}
+
+    client = TestClient(app)
+    parent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+    response = client.post("/ask?profile=1", headers={"traceparent": parent})
+    assert response.headers["x-trace-id"] == "ab" * 16
+    profile = tmp_path / f"{'ab' * 16}.folded"
+    assert response.headers["x-profile"] == profile.name
+    assert profile.read_text().strip()
+
+    assert "x-profile" not in client.post("/ask").headers
+    exporter.flush()
+    request_span = collector.trace("ab" * 16)[0]
+    assert request_span["parent_id"] == "cd" * 8
+    assert request_span["attributes"]["http.status_code"] == 200
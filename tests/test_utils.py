@@ -1,6 +1,6 @@
 # tests/test_utils.py
 import pytest
-from utils import download_datasets, load_and_chunk_documents
+from utils import download_datasets, load_and_chunk_documents, iter_file_chunks, iter_document_chunks
 
 @pytest.mark.asyncio
 async def test_download_datasets():
@@ -19,3 +19,8 @@ async def test_load_and_chunk_documents():
         assert len(doc_splits) > 0, "Document splits should not be empty"
     except Exception as e:
         pytest.fail(f"Loading and chunking documents failed: {e}")
+
+def test_iter_document_chunks_skips_unreadable_files(tmp_path):
+    missing = str(tmp_path / "missing.pdf")
+    assert list(iter_file_chunks([missing], max_workers=1)) == [(missing, None)]
+    assert list(iter_document_chunks([missing], max_workers=1)) == []
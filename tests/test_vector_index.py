@@ -0,0 +1,58 @@
+# tests/test_vector_index.py
+import faiss
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+import retrievers
+from index_store import load_index
+from retrievers import build_index
+from tests.test_index_store import FakeEmbeddings
+from vector_index import benchmark_vector_indexes, build_vector_index, configure_search, factory_string, recall_at_k, search_index_for
+
+@pytest.fixture(scope="module")
+def clustered():
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, 32), dtype=np.float32)
+    vectors = centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.standard_normal((2000, 32), dtype=np.float32)
+    return vectors, vectors[:50] + 0.01
+
+def test_factory_strings():
+    assert factory_string("ivf", 1024, 100000, nlist=0) == "IVF1264,Flat"
+    assert factory_string("hnsw", 1024, 100000, hnsw_m=16) == "HNSW16"
+    assert factory_string("ivfpq", 1000, 100000, nlist=256, pq_m=64, pq_bits=8) == "IVF256,PQ50x8"
+    with pytest.raises(ValueError):
+        factory_string("annoy", 1024, 100000)
+
+@pytest.mark.parametrize("index_type", ["ivf", "hnsw"])
+def test_approximate_indexes_keep_chunk_ids(clustered, index_type):
+    vectors, queries = clustered
+    ids = np.arange(1000, 3000)
+    index = configure_search(build_vector_index(vectors, ids, index_type), nprobe=8, ef_search=64)
+    _, found = index.search(queries, 1)
+    assert found[:, 0].tolist() == ids[:50].tolist()
+
+def test_ivfpq_falls_back_to_flat_without_enough_training_data(clustered):
+    vectors, _ = clustered
+    index = build_vector_index(vectors[:100], np.arange(100), "ivfpq", pq_bits=8)
+    assert isinstance(faiss.downcast_index(index.index), faiss.IndexFlat)
+
+def test_recall_at_k():
+    truth = np.array([[1, 2], [3, 4]])
+    assert recall_at_k(truth, np.array([[2, 1], [3, 5]])) == 0.75
+
+def test_benchmark_reports_recall_latency_and_memory(clustered):
+    vectors, queries = clustered
+    results = {r["index_type"]: r for r in benchmark_vector_indexes(vectors, queries, k=5, nlist=16, nprobe=16, pq_m=4, pq_bits=4)}
+    assert results["flat"]["recall_at_k"] == 1.0
+    assert results["ivf"]["recall_at_k"] == 1.0
+    assert results["hnsw"]["recall_at_k"] >= 0.9
+    assert results["ivfpq"]["index_bytes"] < results["flat"]["index_bytes"]
+    assert all(r["p95_ms"] >= r["p50_ms"] > 0 for r in results.values())
+
+def test_artifact_serves_the_approximate_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrievers, "search_index_for", lambda index: search_index_for(index, "hnsw"))
+    docs = [Document(page_content=f"protocol {i} " + "a" * i, metadata={}) for i in range(30)]
+    build_index(docs, FakeEmbeddings(), str(tmp_path))
+    artifact = load_index(str(tmp_path))
+    assert isinstance(faiss.downcast_index(artifact.vector_index.index), faiss.IndexHNSW)
+    assert artifact.vector_index.ntotal == 30
@@ -0,0 +1,428 @@
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import (
+    OTEL_EXPORTER_OTLP_ENDPOINT,
+    OTEL_SERVICE_NAME,
+    PROFILE_DIRECTORY,
+    PROFILE_ENABLED,
+    PROFILE_SAMPLE_RATE,
+    TRACE_EXPORT_INTERVAL,
+    TRACE_QUEUE_SIZE,
+    TRACE_SAMPLE_RATIO,
+)
+from profiling import SamplingProfiler
+
+# Spans follow the OpenTelemetry data model and are exported as OTLP/HTTP JSON, so any
+# collector (or StubCollector in stub_services.py) receives them without an SDK here.
+# Spans record sizes and counts, never payloads such as documents or prompts.
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation of a trace.
+
+    Args:
+        name (str): The operation name.
+        trace_id (str): 32 hex digits shared by every span of the trace.
+        parent_id (Optional[str]): The parent span's id, None for the root.
+        sampled (bool): Whether the trace is exported.
+        kind (int): The OpenTelemetry span kind.
+        attributes (Optional[Dict[str, Any]]): Initial attributes.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "kind", "attributes", "start_ns", "end_ns", "status", "message")
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        kind: int = SPAN_KIND_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.message = f"{type(error).__name__}: {error}"
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def end(self) -> None:
+        """
+        Finish the span and queue it for export if its trace is sampled.
+        """
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled and _exporter is not None:
+            _exporter.export(self)
+
+
+class OTLPExporter:
+    """
+    Sends finished spans to an OTLP/HTTP endpoint as JSON, from a background thread.
+
+    Spans wait in a queue of at most ``max_queue`` spans and are posted in batches every
+    ``interval`` seconds. When the collector is slow or down, new spans are dropped
+    instead of piling up, and ``dropped`` counts them. The thread is started on first
+    use in each process, so a forked worker exports its own spans.
+
+    Args:
+        endpoint (str): The collector's base URL; spans go to ``{endpoint}/v1/traces``.
+        service_name (str): The ``service.name`` resource attribute.
+        interval (float): Seconds between exports.
+        max_queue (int): The most spans waiting for export.
+        max_batch (int): The most spans per request.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        service_name: str = OTEL_SERVICE_NAME,
+        interval: float = TRACE_EXPORT_INTERVAL,
+        max_queue: int = TRACE_QUEUE_SIZE,
+        max_batch: int = 512,
+    ):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.interval = interval
+        self.max_batch = max_batch
+        self.dropped = 0
+        self._queue: "queue.Queue[Span]" = queue.Queue(max_queue)
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._failing = False
+
+    def export(self, span: Span) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._queue = queue.Queue(self._queue.maxsize)
+                    threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        spans = []
+        while len(spans) < self.max_batch:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Post every queued span now.
+        """
+        while True:
+            spans = self._drain()
+            if not spans:
+                return
+            try:
+                request = urllib.request.Request(
+                    self.url, data=json.dumps(self.encode(spans)).encode("utf-8"), headers={"Content-Type": "application/json"}
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+                self._failing = False
+            except Exception as e:
+                if not self._failing:
+                    logging.warning(f"Failed to export {len(spans)} spans to {self.url}: {e}")
+                self._failing = True
+                return
+
+    def encode(self, spans: Iterable[Span]) -> Dict[str, Any]:
+        """
+        Encode spans as an OTLP ExportTraceServiceRequest in JSON.
+
+        Args:
+            spans (Iterable[Span]): Finished spans.
+
+        Returns:
+            Dict[str, Any]: The request body.
+        """
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": encode_attributes({"service.name": self.service_name, "process.pid": os.getpid()})},
+                "scopeSpans": [{
+                    "scope": {"name": "agentic_rag"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": span.kind,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": encode_attributes(span.attributes),
+                            "status": {"code": span.status, "message": span.message},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }],
+        }
+
+
+def encode_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    encoded = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            encoded.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            encoded.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            encoded.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            encoded.append({"key": key, "value": {"stringValue": str(value)}})
+    return encoded
+
+
+_exporter: Optional[OTLPExporter] = OTLPExporter(OTEL_EXPORTER_OTLP_ENDPOINT) if OTEL_EXPORTER_OTLP_ENDPOINT else None
+
+
+def set_exporter(exporter: Optional[OTLPExporter]) -> Optional[OTLPExporter]:
+    """
+    Replace the span exporter; None stops exporting.
+
+    Args:
+        exporter (Optional[OTLPExporter]): The new exporter.
+
+    Returns:
+        Optional[OTLPExporter]: The previous exporter.
+    """
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """
+    Read a W3C ``traceparent`` header.
+
+    Args:
+        header (Optional[str]): The header value.
+
+    Returns:
+        Optional[Tuple[str, str, bool]]: The trace id, parent span id and sampled flag, or None if invalid.
+    """
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def add_span_attributes(**attributes: Any) -> None:
+    """
+    Set attributes on the current span, if there is one.
+    """
+    span = _current_span.get()
+    if span is not None:
+        span.set_attributes(attributes)
+
+
+def begin_span(name: str, kind: int = SPAN_KIND_INTERNAL, parent: Optional[Tuple[str, str, bool]] = None, **attributes: Any) -> Span:
+    """
+    Start a span without making it current; call ``end`` when the operation finishes.
+
+    The span is a child of ``parent`` if given, otherwise of the current span. Without
+    either it starts a new trace, sampled with probability TRACE_SAMPLE_RATIO while
+    an exporter is configured.
+
+    Args:
+        name (str): The operation name.
+        kind (int): The span kind.
+        parent (Optional[Tuple[str, str, bool]]): A remote parent from ``parse_traceparent``.
+        **attributes: Initial attributes.
+
+    Returns:
+        Span: The started span.
+    """
+    current = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        sampled = sampled and _exporter is not None
+    elif current is not None:
+        trace_id, parent_id, sampled = current.trace_id, current.span_id, current.sampled
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+        sampled = _exporter is not None and random.random() < TRACE_SAMPLE_RATIO
+    return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+
+@contextmanager
+def start_span(name: str, kind: int = SPAN_KIND_INTERNAL, parent: Optional[Tuple[str, str, bool]] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Run a block in a new span, which is the current span inside it.
+
+    An exception escaping the block marks the span as failed.
+
+    Args:
+        name (str): The operation name.
+        kind (int): The span kind.
+        parent (Optional[Tuple[str, str, bool]]): A remote parent from ``parse_traceparent``.
+        **attributes: Initial attributes.
+
+    Yields:
+        Span: The span.
+    """
+    span = begin_span(name, kind, parent, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def state_sizes(state: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Summarize a workflow state update by the sizes of its fields.
+
+    Args:
+        state (Dict[str, Any]): A node's state update.
+
+    Returns:
+        Dict[str, int]: Counts such as ``rag.documents``, cheap to log and trace.
+    """
+    sizes = {}
+    if "sub_questions" in state:
+        sizes["rag.sub_questions"] = len(state["sub_questions"] or [])
+    if "documents" in state:
+        sizes["rag.documents"] = len(state["documents"] or [])
+    if "generation" in state:
+        sizes["rag.generation_chars"] = len(state["generation"] or "")
+    return sizes
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware giving each request to the selected endpoints a trace.
+
+    The request span continues the caller's trace when a ``traceparent`` header is
+    sent. The response carries ``X-Trace-Id`` and ``traceparent`` headers either way.
+    When profiling is enabled, requests with ``?profile=1`` and a random
+    ``profile_sample_rate`` fraction of the others are profiled by a
+    SamplingProfiler, one at a time per worker. The folded stacks are written to
+    ``{profile_directory}/{trace_id}.folded``. The ``X-Profile`` response header gives
+    only the file name, so server paths are not disclosed; the full path is logged.
+
+    Args:
+        app (Any): The wrapped ASGI application.
+        endpoints (Iterable[str]): The request paths to trace.
+        profile_enabled (bool): Whether requests may be profiled at all.
+        profile_sample_rate (float): Fraction of requests profiled without asking.
+        profile_directory (str): Where profiles are written.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        endpoints: Iterable[str],
+        profile_enabled: bool = PROFILE_ENABLED,
+        profile_sample_rate: float = PROFILE_SAMPLE_RATE,
+        profile_directory: str = PROFILE_DIRECTORY,
+    ):
+        self.app = app
+        self.endpoints = set(endpoints)
+        self.profile_enabled = profile_enabled
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_directory = profile_directory
+
+    def _wants_profile(self, scope: Dict[str, Any]) -> bool:
+        if not self.profile_enabled:
+            return False
+        query = scope.get("query_string", b"").decode("latin-1").split("&")
+        return "profile=1" in query or random.random() < self.profile_sample_rate
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.endpoints:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        name = f"{scope['method']} {scope['path']}"
+        with start_span(name, SPAN_KIND_SERVER, parent, **{"http.method": scope["method"], "http.route": scope["path"]}) as span:
+            profiler = SamplingProfiler() if self._wants_profile(scope) else None
+            if profiler is not None and not profiler.start():
+                profiler = None
+            profile_path = os.path.join(self.profile_directory, f"{span.trace_id}.folded") if profiler else None
+
+            async def send_with_trace(message: Dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = STATUS_ERROR
+                    extra = [(b"x-trace-id", span.trace_id.encode()), (b"traceparent", span.traceparent().encode())]
+                    if profile_path:
+                        extra.append((b"x-profile", os.path.basename(profile_path).encode()))
+                    message = {**message, "headers": list(message.get("headers") or []) + extra}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+                    profiler.write(profile_path)
+                    logging.info(f"Wrote profile of {name} to {profile_path} ({profiler.samples} samples).")
@@ -1,45 +1,115 @@
 import asyncio
-import aiohttp
+import glob
 import logging
-from typing import List
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import DirectoryLoader
-from config import DOWNLOAD_URLS, DOCS_DIRECTORY, CHUNK_SIZE, CHUNK_OVERLAP
+from langchain_community.document_loaders import UnstructuredFileLoader
+from config import DOWNLOAD_URLS, DOWNLOAD_DOCUMENTS, DOCS_DIRECTORY, CHUNK_SIZE, CHUNK_OVERLAP, INGEST_WORKERS
+from downloader import DirectoryLock, Downloader, filenames_for, read_manifest
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def download_file(url: str) -> None:
+async def download_datasets(directory: str = DOCS_DIRECTORY, fetch_documents: bool = DOWNLOAD_DOCUMENTS) -> None:
     """
-    Download a file asynchronously from a given URL.
+    Download the dataset files, and the documents listed in its download.csv manifest.
+
+    Files already present are only transferred again if they changed on the server.
+    Processes calling this at the same time take turns, so the work is done once.
 
     Args:
-        url (str): The URL to download the file from.
+        directory (str): Where the files are written.
+        fetch_documents (bool): Whether to download the documents listed in the manifest.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                filename = url.split("/")[-1]
-                with open(filename, "wb") as f:
-                    f.write(await response.read())
-        logging.info(f"Downloaded {filename} successfully.")
+        async with DirectoryLock(directory), Downloader(directory) as downloader:
+            await downloader.download_all(DOWNLOAD_URLS)
+            if fetch_documents:
+                for manifest in [name for name in filenames_for(DOWNLOAD_URLS).values() if name.endswith(".csv")]:
+                    await downloader.download_all(read_manifest(os.path.join(directory, manifest)))
     except Exception as e:
-        logging.error(f"Failed to download {url}: {e}")
+        logging.error(f"Error downloading datasets: {e}")
 
-async def download_datasets() -> None:
+def load_and_split_file(path: str) -> List:
     """
-    Download all datasets asynchronously.
+    Load a single file and split it into chunks. Runs inside ingestion worker processes.
+
+    Args:
+        path (str): The file to load.
+
+    Returns:
+        List: The file's document chunks.
     """
-    try:
-        await asyncio.gather(*[download_file(url) for url in DOWNLOAD_URLS])
-    except Exception as e:
-        logging.error(f"Error downloading datasets: {e}")
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(UnstructuredFileLoader(path).load())
+
+def iter_file_chunks(paths: List[str], max_workers: Optional[int] = None) -> Iterator[Tuple[str, List]]:
+    """
+    Parse and chunk files in a process pool, yielding each file's chunks in input order.
+
+    At most two files per worker are in flight, so memory stays bounded by the
+    window rather than by the size of the corpus.
+
+    Args:
+        paths (List[str]): The files to load.
+        max_workers (Optional[int]): Number of worker processes; defaults to INGEST_WORKERS.
+
+    Yields:
+        Tuple[str, List]: The file path and its document chunks, or None if it failed to load.
+    """
+    max_workers = max_workers or INGEST_WORKERS
+    pending = deque()
+    remaining = iter(paths)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for path in islice(remaining, max_workers * 2):
+            pending.append((path, executor.submit(load_and_split_file, path)))
+        while pending:
+            path, future = pending.popleft()
+            try:
+                chunks = future.result()
+            except Exception as e:
+                logging.error(f"Failed to load or chunk {path}: {e}")
+                chunks = None
+            for next_path in islice(remaining, 1):
+                pending.append((next_path, executor.submit(load_and_split_file, next_path)))
+            yield path, chunks
+
+def iter_document_chunks(paths: List[str], max_workers: Optional[int] = None) -> Iterator:
+    """
+    Stream document chunks from a list of files, parsed in parallel.
+
+    Args:
+        paths (List[str]): The files to load.
+        max_workers (Optional[int]): Number of worker processes; defaults to INGEST_WORKERS.
+
+    Yields:
+        Document chunks, in file order.
+    """
+    for _, chunks in iter_file_chunks(paths, max_workers):
+        yield from chunks or []
+
+def list_documents(directory: str) -> List[str]:
+    """
+    List the PDF files under a directory in a stable order.
+
+    Args:
+        directory (str): The directory to search.
+
+    Returns:
+        List[str]: The PDF paths.
+    """
+    return sorted(glob.glob(os.path.join(directory, "**/*.pdf"), recursive=True))
 
 async def load_and_chunk_documents(directory: str) -> List:
     """
     Load and split documents into chunks asynchronously.
 
+    Parsing runs in a process pool off the event loop.
+
     Args:
         directory (str): The directory from which to load the documents.
 
@@ -47,11 +117,10 @@ async def load_and_chunk_documents(directory: str) -> List:
         List: A list of document chunks.
     """
     try:
-        loader = DirectoryLoader(directory, glob="**/*.pdf")
-        docs = loader.load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        paths = list_documents(directory)
+        doc_splits = await asyncio.to_thread(lambda: list(iter_document_chunks(paths)))
         logging.info(f"Loaded and chunked documents from {directory}.")
-        return text_splitter.split_documents(docs)
+        return doc_splits
     except Exception as e:
         logging.error(f"Failed to load or chunk documents: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,248 @@
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from config import (
+    VECTOR_INDEX_EF_SEARCH,
+    VECTOR_INDEX_HNSW_M,
+    VECTOR_INDEX_NLIST,
+    VECTOR_INDEX_NPROBE,
+    VECTOR_INDEX_PQ_BITS,
+    VECTOR_INDEX_PQ_M,
+    VECTOR_INDEX_TYPE,
+)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+
+def default_nlist(num_vectors: int) -> int:
+    """
+    Pick the number of IVF lists: about 4 * sqrt(n), with at least 39 training points per list.
+
+    Args:
+        num_vectors (int): The number of vectors indexed.
+
+    Returns:
+        int: The number of lists.
+    """
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+
+
+def _pq_subquantizers(dimension: int, pq_m: int) -> int:
+    # Product quantization needs the dimension to split evenly into sub-vectors
+    return max(m for m in range(1, min(pq_m, dimension) + 1) if dimension % m == 0)
+
+
+def factory_string(
+    index_type: str,
+    dimension: int,
+    num_vectors: int,
+    nlist: int = VECTOR_INDEX_NLIST,
+    hnsw_m: int = VECTOR_INDEX_HNSW_M,
+    pq_m: int = VECTOR_INDEX_PQ_M,
+    pq_bits: int = VECTOR_INDEX_PQ_BITS,
+) -> str:
+    """
+    Describe an index type as a FAISS index factory string.
+
+    Args:
+        index_type (str): One of "flat", "ivf", "hnsw" or "ivfpq".
+        dimension (int): The vector dimension.
+        num_vectors (int): The number of vectors indexed, used to size the IVF lists.
+        nlist (int): Number of IVF lists; 0 picks it from the corpus size.
+        hnsw_m (int): Neighbours per HNSW node.
+        pq_m (int): Maximum number of PQ sub-quantizers.
+        pq_bits (int): Bits per PQ code.
+
+    Returns:
+        str: The factory string.
+    """
+    nlist = min(nlist or default_nlist(num_vectors), max(1, num_vectors))
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+    if index_type == "ivfpq":
+        return f"IVF{nlist},PQ{_pq_subquantizers(dimension, pq_m)}x{pq_bits}"
+    raise ValueError(f"Unknown vector index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+
+def build_vector_index(vectors: np.ndarray, ids: np.ndarray, index_type: str = VECTOR_INDEX_TYPE, **params: Any) -> Any:
+    """
+    Build a FAISS index of the given type whose ids are chunk ids.
+
+    Trainable types fall back to a flat index when there are too few vectors to
+    train them, e.g. fewer than ``2 ** pq_bits`` for IVF-PQ.
+
+    Args:
+        vectors (np.ndarray): The vectors, one row per chunk.
+        ids (np.ndarray): The chunk id of each row.
+        index_type (str): One of "flat", "ivf", "hnsw" or "ivfpq".
+        **params: Overrides for the factory_string parameters.
+
+    Returns:
+        Any: The FAISS index, wrapped in an IndexIDMap2.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dimension = vectors.shape
+    description = factory_string(index_type, dimension, num_vectors, **params)
+    if index_type == "ivfpq" and num_vectors < 2 ** params.get("pq_bits", VECTOR_INDEX_PQ_BITS):
+        logging.warning(f"Too few vectors ({num_vectors}) to train {description}; using a flat index.")
+        description = "Flat"
+    start = time.perf_counter()
+    index = faiss.IndexIDMap2(faiss.index_factory(dimension, description))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    logging.info(f"Built {description} index over {num_vectors} vectors in {time.perf_counter() - start:.2f}s.")
+    return index
+
+
+def flat_vectors(index: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the vectors and ids back out of a flat IndexIDMap2.
+
+    Args:
+        index (Any): An IndexIDMap2 over an IndexFlat.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The vectors and their chunk ids.
+    """
+    ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+    return faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal), ids
+
+
+def search_index_for(flat_index: Any, index_type: str = VECTOR_INDEX_TYPE) -> Optional[Any]:
+    """
+    Build the index used for serving queries from the exact flat index.
+
+    The flat index stays the source of truth for incremental updates and recall
+    measurements; only the serving index changes with VECTOR_INDEX_TYPE.
+
+    Args:
+        flat_index (Any): The exact IndexIDMap2 over an IndexFlat.
+        index_type (str): The serving index type.
+
+    Returns:
+        Optional[Any]: The serving index, or None when the flat index is served directly.
+    """
+    if index_type == "flat":
+        return None
+    return build_vector_index(*flat_vectors(flat_index), index_type=index_type)
+
+
+def configure_search(
+    index: Any, nprobe: int = VECTOR_INDEX_NPROBE, ef_search: int = VECTOR_INDEX_EF_SEARCH
+) -> Any:
+    """
+    Apply query-time parameters: nprobe for IVF indexes and efSearch for HNSW.
+
+    Args:
+        index (Any): The FAISS index.
+        nprobe (int): IVF lists visited per query.
+        ef_search (int): HNSW candidate list size per query.
+
+    Returns:
+        Any: The same index.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+    return index
+
+
+def resident_memory_bytes() -> int:
+    """
+    Return the resident set size of this process.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        # Peak rather than current RSS where /proc is unavailable; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    """
+    Compute the mean fraction of the true top-k ids that were found.
+
+    Args:
+        truth (np.ndarray): Exact top-k ids, one row per query.
+        found (np.ndarray): Approximate top-k ids, one row per query.
+
+    Returns:
+        float: Recall@k between 0 and 1.
+    """
+    hits = sum(len(np.intersect1d(t[t >= 0], f[f >= 0])) for t, f in zip(truth, found))
+    return hits / max(1, int((truth >= 0).sum()))
+
+
+def benchmark_vector_indexes(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    index_types: Iterable[str] = INDEX_TYPES,
+    **params: Any,
+) -> List[Dict[str, Any]]:
+    """
+    Compare index types on recall@k against the flat baseline, latency and memory.
+
+    Each query is searched on its own, as the API does, to measure per-query latency.
+
+    Args:
+        vectors (np.ndarray): The indexed vectors.
+        queries (np.ndarray): The query vectors.
+        k (int): Results per query.
+        index_types (Iterable[str]): The index types to compare.
+        **params: Overrides for the factory_string and configure_search parameters.
+
+    Returns:
+        List[Dict[str, Any]]: One result per index type.
+    """
+    search_params = {name: params.pop(name) for name in ("nprobe", "ef_search") if name in params}
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    truth = exact.search(queries, k)[1]
+    del exact
+    results = []
+    for index_type in index_types:
+        rss_before = resident_memory_bytes()
+        start = time.perf_counter()
+        index = configure_search(build_vector_index(vectors, ids, index_type, **params), **search_params)
+        build_seconds = time.perf_counter() - start
+        rss_delta = resident_memory_bytes() - rss_before
+
+        latencies = np.empty(len(queries))
+        found = np.empty((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, found[i] = index.search(query[None, :], k)
+            latencies[i] = time.perf_counter() - start
+
+        results.append({
+            "index_type": index_type,
+            "recall_at_k": round(recall_at_k(truth, found), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+            "build_seconds": round(build_seconds, 2),
+            "index_bytes": len(faiss.serialize_index(index)),
+            "rss_delta_bytes": rss_delta,
+        })
+        logging.info(f"Benchmarked {index_type}: {results[-1]}")
+        del index
+    return results
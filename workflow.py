@@ -1,69 +1,184 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple, TypedDict
+import asyncio
+from itertools import chain, zip_longest
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field
 from langgraph.graph import END, StateGraph, START
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain import hub
+from langchain_core.documents import Document
+from retrievers import HybridRetriever, dedupe_documents
+from config import RETRIEVAL_CONCURRENCY, RETRIEVAL_TIMEOUT
+from metrics import instrument_node
+from reranking import BatchedReranker
+from context import ContextPacker
+from planner import QueryPlanner
+from tracing import start_span, state_sizes
 import logging
 
+# Vendored copy of the "rlm/rag-prompt" LangChain Hub prompt, so no request pulls it over the network
+RAG_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "human",
+        "You are an assistant for question-answering tasks. Use the following pieces of retrieved context "
+        "to answer the question. If you don't know the answer, just say that you don't know. Use three "
+        "sentences maximum and keep the answer concise.\nQuestion: {question} \nContext: {context} \nAnswer:",
+    ),
+])
+
+DECOMPOSITION_PROMPT = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "Break the user's question into the sub-questions that need to be answered to answer it. "
+        "Each sub-question must be self-contained so it can be used as a search query on its own.",
+    ),
+    ("human", "{question}"),
+])
+
+class SubQuery(BaseModel):
+    questions: List[str] = Field(description="The list of sub-questions")
+
+def create_sub_question_generator(llm: ChatOpenAI) -> Any:
+    """
+    Create a runnable that decomposes a question into sub-questions using structured generation.
+
+    Args:
+        llm (ChatOpenAI): The LLM model instance.
+
+    Returns:
+        Any: A runnable mapping {"question": ...} to a SubQuery.
+    """
+    return DECOMPOSITION_PROMPT | llm.with_structured_output(SubQuery)
+
+def create_rag_chain(llm: ChatOpenAI) -> Any:
+    """
+    Create a RAG (Retrieval-Augmented Generation) chain.
+
+    Args:
+        llm (ChatOpenAI): The LLM model instance.
+
+    Returns:
+        Any: A configured RAG chain.
+    """
+    try:
+        # Combine the vendored prompt with the LLM and an output parser
+        rag_chain = RAG_PROMPT | llm | StrOutputParser()
+        logging.info("RAG chain created successfully.")
+        return rag_chain
+    except Exception as e:
+        logging.error(f"Failed to create RAG chain: {e}")
+        raise
+
 class GraphState(TypedDict):
     question: str
     sub_questions: List[str]
     generation: str
     documents: List[str]
 
+async def retrieve_documents(hybrid_retriever: HybridRetriever, sub_questions: List[str]) -> List[Document]:
+    """
+    Retrieve documents for all sub-questions concurrently and merge them.
+
+    At most RETRIEVAL_CONCURRENCY calls run at once; calls still running after
+    RETRIEVAL_TIMEOUT seconds are dropped. The results are interleaved by rank, so the
+    best chunk of every sub-question comes before any second best, and de-duplicated
+    by chunk id; pruning the list later keeps the top chunks of every sub-question.
+
+    Args:
+        hybrid_retriever (HybridRetriever): Hybrid retriever instance.
+        sub_questions (List[str]): The sub-questions to retrieve for.
+
+    Returns:
+        List[Document]: Unique documents, best ranks first.
+    """
+    semaphore = asyncio.Semaphore(RETRIEVAL_CONCURRENCY)
+
+    async def retrieve_one(sub_question: str) -> List[Document]:
+        async with semaphore:
+            with start_span("retrieve sub-question") as span:
+                documents = await asyncio.wait_for(hybrid_retriever.ainvoke(sub_question), RETRIEVAL_TIMEOUT)
+                span.set_attribute("rag.documents", len(documents))
+                return documents
+
+    results = await asyncio.gather(*[retrieve_one(q) for q in sub_questions], return_exceptions=True)
+    rankings = []
+    for sub_question, result in zip(sub_questions, results):
+        if isinstance(result, asyncio.TimeoutError):
+            logging.warning(f"Retrieval timed out for sub-question: {sub_question}")
+        elif isinstance(result, BaseException):
+            logging.error(f"Retrieval failed for sub-question {sub_question}: {result}")
+        else:
+            rankings.append(result)
+    interleaved = chain.from_iterable(zip_longest(*rankings))
+    return dedupe_documents([doc for doc in interleaved if doc is not None])
+
 def setup_langgraph_workflow(
     llm: ChatOpenAI, 
     sub_question_generator: Any, 
-    hybrid_retriever: EnsembleRetriever, 
-    rag_chain: Any
+    hybrid_retriever: HybridRetriever, 
+    rag_chain: Any,
+    reranker: BatchedReranker,
+    context_packer: Optional[ContextPacker] = None,
+    query_planner: Optional[QueryPlanner] = None
 ) -> Any:
     """
     Setup the LangGraph workflow for multi-agent RAG.
 
+    Every node is async, so the compiled graph is meant to be built once and run
+    with ``ainvoke``/``astream`` by many concurrent requests. Node durations are
+    recorded in the ``rag_node_duration_seconds`` histogram.
+
     Args:
         llm (ChatOpenAI): The LLM model instance.
         sub_question_generator (Any): Sub-query generator instance.
-        hybrid_retriever (EnsembleRetriever): Hybrid retriever instance.
+        hybrid_retriever (HybridRetriever): Hybrid retriever instance.
         rag_chain (Any): RAG chain instance.
+        reranker (BatchedReranker): The reranking stage.
+        context_packer (Optional[ContextPacker]): Builds the prompt context from the
+            reranked chunks; a packer with the configured token budget by default.
+        query_planner (Optional[QueryPlanner]): Picks the sub-questions to retrieve;
+            by default a planner around sub_question_generator. Pass a shared planner
+            to keep its decomposition cache across rebuilt workflows.
 
     Returns:
         A compiled workflow graph.
     """
-    def decompose(state: Dict[str, Any]) -> Dict[str, Any]:
+    context_packer = context_packer or ContextPacker()
+    query_planner = query_planner or QueryPlanner(sub_question_generator)
+
+    async def decompose(state: Dict[str, Any]) -> Dict[str, Any]:
         question = state["question"]
-        sub_queries = sub_question_generator.invoke(question)
-        return {"sub_questions": sub_queries.questions, "question": question}
-
-    def retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
-        sub_questions = state["sub_questions"]
-        documents = []
-        for sub_question in sub_questions:
-            docs = hybrid_retriever.get_relevant_documents(sub_question)
-            documents.extend(docs)
+        sub_questions = await query_planner.plan(question)
+        return {"sub_questions": sub_questions, "question": question}
+
+    async def retrieve(state: Dict[str, Any]) -> Dict[str, Any]:
+        documents = await retrieve_documents(hybrid_retriever, state["sub_questions"])
         return {"documents": documents, "question": state["question"]}
 
-    def rerank(state: Dict[str, Any]) -> Dict[str, Any]:
+    async def rerank(state: Dict[str, Any]) -> Dict[str, Any]:
         question = state["question"]
         documents = state["documents"]
-        documents = reranker.compress_documents(query=question, documents=documents)
+        documents = await reranker.acompress_documents(query=question, documents=documents)
         return {"documents": documents, "question": question}
 
-    def generate(state: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate(state: Dict[str, Any]) -> Dict[str, Any]:
         question = state["question"]
         documents = state["documents"]
-        generation = rag_chain.invoke({"context": documents, "question": question})
+        context = context_packer.pack(documents)
+        generation = await rag_chain.ainvoke({"context": context, "question": question})
         return {"documents": documents, "question": question, "generation": generation}
 
+    def has_sub_questions(state: Dict[str, Any]) -> str:
+        return "retrieve" if state["sub_questions"] else END
+
     workflow = StateGraph(GraphState)
-    workflow.add_node("decompose", decompose)
-    workflow.add_node("retrieve", retrieve)
-    workflow.add_node("rerank", rerank)
-    workflow.add_node("generate", generate)
+    workflow.add_node("decompose", instrument_node("decompose", decompose))
+    workflow.add_node("retrieve", instrument_node("retrieve", retrieve))
+    workflow.add_node("rerank", instrument_node("rerank", rerank))
+    workflow.add_node("generate", instrument_node("generate", generate))
 
     workflow.add_edge(START, "decompose")
-    workflow.add_edge("decompose", "retrieve")
+    workflow.add_conditional_edges("decompose", has_sub_questions, ["retrieve", END])
     workflow.add_edge("retrieve", "rerank")
     workflow.add_edge("rerank", "generate")
     workflow.add_edge("generate", END)
@@ -71,18 +186,71 @@ def setup_langgraph_workflow(
     logging.info("LangGraph workflow setup successfully.")
     return workflow.compile()
 
-def run_workflow(app: Any, inputs: Dict[str, Any]) -> None:
+async def run_workflow(app: Any, inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Execute the workflow with provided inputs.
 
+    Node outputs are logged at DEBUG as sizes only; document lists are too large to log.
+
     Args:
         app (Any): Compiled workflow application.
         inputs (Dict[str, Any]): Input data for the workflow.
+
+    Returns:
+        Optional[Dict[str, Any]]: The final workflow state, or None if execution failed.
     """
     try:
-        for output in app.stream(inputs):
+        state = dict(inputs)
+        async for output in app.astream(inputs):
             for key, value in output.items():
-                logging.info(f"Node '{key}': {value}")
-            logging.info("\n---\n")
+                logging.debug(f"Node '{key}' finished: {state_sizes(value or {})}")
+                state.update(value or {})
+        return state
     except Exception as e:
-        logging.error(f"Error during workflow execution: {e}")
\ No newline at end of file
+        logging.error(f"Error during workflow execution: {e}")
+        return None
+
+
+def describe_source(doc: Document) -> Dict[str, Any]:
+    """
+    Summarize a document as the chunk id and source it came from.
+
+    Args:
+        doc (Document): A retrieved document.
+
+    Returns:
+        Dict[str, Any]: The chunk id and source file.
+    """
+    return {"chunk_id": doc.metadata.get("chunk_id"), "source": doc.metadata.get("source")}
+
+async def stream_workflow(app: Any, inputs: Dict[str, Any]) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Execute the workflow and yield its progress as it happens.
+
+    Yields ``("sub_questions", [...])`` after decomposition, ``("sources", [...])`` with
+    the reranked chunks, one ``("token", str)`` per token generated by the LLM, and
+    finally ``("done", state)`` with the final workflow state.
+
+    Args:
+        app (Any): Compiled workflow application.
+        inputs (Dict[str, Any]): Input data for the workflow.
+
+    Yields:
+        Tuple[str, Any]: The event name and its data.
+    """
+    state = dict(inputs)
+    async for event in app.astream_events(inputs, version="v2"):
+        node = event.get("metadata", {}).get("langgraph_node")
+        if event["event"] == "on_chat_model_stream" and node == "generate":
+            token = event["data"]["chunk"].content
+            if token:
+                yield "token", token
+        elif event["event"] == "on_chain_end" and event["name"] == node:
+            # The end of a node's own run carries the state update it returned
+            output = event["data"].get("output") or {}
+            state.update(output)
+            if node == "decompose":
+                yield "sub_questions", output.get("sub_questions", [])
+            elif node == "rerank":
+                yield "sources", [describe_source(doc) for doc in output.get("documents", [])]
+    yield "done", state